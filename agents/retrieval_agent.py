@@ -2,14 +2,59 @@
 
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import asyncio
+import datetime
+import inspect
+import json
 import os
+import shutil
+import threading
+import time
+import uuid
 import google.generativeai as genai
 # For vector store and embeddings, LangChain is a convenient choice
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_core.documents import Document # To represent text chunks
+from langchain_core.embeddings import Embeddings
 import sys
+import faiss
+import numpy as np
+
+from vector_store.chunking import TextChunker, chunk_id, join_chunks
+from vector_store.collection_registry import CollectionInUseError, CollectionRegistry
+from vector_store.diversity import maximal_marginal_relevance
+from vector_store.embedding_backends import HashedNGramEmbeddings, validate_embedding_backend
+from vector_store.embedding_cache import EmbeddingCache
+from vector_store.embedding_pipeline import BatchEmbedder
+from vector_store.float_vectors import FloatVectorStore, rerank_exact
+from vector_store.index_view import IndexView, PositionalDocuments, merge_nearest
+from vector_store.ingest_jobs import IngestJobQueue
+from vector_store.index_factory import (
+    build_index, empty_like, enable_reconstruction, index_type_of, make_search_params, quantization_of,
+    supports_selector,
+    validate_index_type, validate_quantization,
+)
+from vector_store.latency_stats import LatencyStats
+from vector_store.lexical_index import RRF_K, BM25Index, reciprocal_rank_fusion
+from vector_store.metadata_index import MetadataIndex
+from vector_store.mmap_snapshot import (
+    MmapDocstore, current_snapshot_dir, has_snapshot, load_snapshot, read_snapshot_index, read_snapshot_vectors, write_snapshot,
+)
+from vector_store.numpy_search import NormalizedMatrix, validate_search_engine
+from vector_store.query_cache import QueryEmbeddingCache
+from vector_store.reranker import TermOverlapReranker, rerank_hits
+from vector_store.semantic_cache import SemanticResultCache, query_key_terms
+from vector_store.scoring import cut_off, similarity_from_distance
+from vector_store.time_partitions import (
+    is_expired, is_partition_key, parse_date, partition_key, select_partitions, validate_partition_by,
+)
+from vector_store.write_ahead_log import WriteAheadLog
+from vector_store.writer_lock import WriterLock
 
 # Load environment variables (for API key)
 # Note: For Render, environment variables are set directly in the dashboard,
@@ -17,6 +62,24 @@ import sys
 from dotenv import load_dotenv
 load_dotenv()
 
+# Metadata fields that together identify a document, so re-indexing it replaces the old version
+STABLE_ID_METADATA_KEYS = ("type", "symbol", "date")
+# File inside the vector store directory that logs mutations made since the last snapshot
+WAL_FILENAME = "wal.jsonl"
+# Lock file inside the vector store directory held by the one process allowed to write it
+WRITER_LOCK_FILENAME = "WRITER.lock"
+# How a query is answered:
+#   "dense"   - embedding + vector search
+#   "lexical" - BM25 over the document texts only; no embedding call
+#   "hybrid"  - both, merged with reciprocal rank fusion
+#   "auto"    - BM25 first; answered lexically when it is confident, otherwise hybrid
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid", "auto")
+# Directory inside the vector store directory holding one sub-store per time partition
+SHARDS_DIRNAME = "shards"
+# Filtered searches with at most this many candidates score the candidates directly instead of
+# running a selector-restricted FAISS search, so their cost tracks the size of the matching subset
+FILTER_BRUTE_FORCE_MAX_CANDIDATES = 4096
+
 app = FastAPI(
     title="Retriever Agent Microservice",
     description="Indexes data embeddings and retrieves relevant text chunks for RAG."
@@ -27,7 +90,25 @@ class RetrieverAgent:
     Manages indexing of text data into a vector store and retrieving relevant chunks.
     This agent uses Google Generative AI Embeddings and FAISS for vector storage.
     """
-    def __init__(self, vector_store_path: str = "faiss_index", embedding_model_name: str = "models/text-embedding-004"):
+    def __init__(self, vector_store_path: str = "faiss_index", embedding_model_name: str = "models/text-embedding-004",
+                 embed_batch_size: int = 64, embed_max_workers: int = 4, embed_max_retries: int = 3,
+                 embedding_cache_path: Optional[str] = "embedding_cache.sqlite3", embedding_cache_max_entries: int = 100_000,
+                 wal_fsync: bool = True, compaction_interval_seconds: Optional[float] = 60.0, compaction_max_records: int = 500,
+                 tombstone_purge_fraction: float = 0.2, query_cache_max_entries: int = 1024, query_cache_ttl_seconds: Optional[float] = 3600.0,
+                 result_cache_max_entries: int = 0, result_cache_similarity: float = 0.95,
+                 index_type: str = "flat", ivf_nlist: int = 1024, ivf_nprobe: int = 8,
+                 hnsw_m: int = 32, hnsw_ef_construction: int = 200, hnsw_ef_search: int = 64,
+                 mmap_snapshot: bool = True, quantization: str = "none", pq_m: int = 96, rerank_factor: int = 4,
+                 partition_by: Optional[str] = None, retention_days: Optional[int] = None, shard_search_workers: int = 4,
+                 retrieval_mode: str = "dense", lexical_confidence: float = 0.8, lexical_margin: float = 1.25,
+                 hybrid_fanout: int = 4,
+                 embedding_backend: str = "google", embedding_dimension: int = 768,
+                 embeddings: Optional[Embeddings] = None, ingest_workers: int = 2, ingest_batch_size: int = 256,
+                 max_unindexed_vectors: int = 8192, mmr_fetch_factor: int = 4, rerank: bool = False,
+                 reranker=None, rerank_fetch_factor: int = 4, rerank_batch_size: int = 64,
+                 rerank_budget_ms: Optional[float] = 5.0, search_engine: str = "faiss",
+                 chunk_size: Optional[int] = 1000, chunk_overlap: int = 150, parent_context_chunks: Optional[int] = 2,
+                 read_only: Optional[bool] = None, refresh_interval_seconds: Optional[float] = 5.0):
         """
         Initializes the RetrieverAgent.
 
@@ -35,74 +116,472 @@ class RetrieverAgent:
             vector_store_path (str): The local path where the FAISS index will be saved/loaded.
             embedding_model_name (str): The name of the Google Generative AI embedding model to use.
                                         Defaults to "models/text-embedding-004".
+            embed_batch_size (int): Number of documents sent to the embedding model per request.
+            embed_max_workers (int): Maximum number of embedding batches in flight at once.
+            embed_max_retries (int): Attempts per embedding batch before indexing fails.
+            embedding_cache_path (Optional[str]): SQLite file for the persistent embedding cache.
+                                                  Set to None to disable caching.
+            embedding_cache_max_entries (int): Size cap of the embedding cache (LRU eviction).
+            wal_fsync (bool): Whether each write-ahead log append is fsynced before indexing returns.
+            compaction_interval_seconds (Optional[float]): How often the background thread writes a full
+                                                           snapshot and truncates the write-ahead log.
+                                                           None disables the background thread.
+            compaction_max_records (int): Number of logged batches that triggers an early compaction.
+            tombstone_purge_fraction (float): Share of deleted or replaced vectors above which compaction drops
+                                              them from the index. Below it they are written to the snapshot as
+                                              tombstones, since dropping them rebuilds the whole index.
+            query_cache_max_entries (int): Size of the in-memory query embedding LRU. 0 disables it.
+            query_cache_ttl_seconds (Optional[float]): Lifetime of a cached query embedding.
+            result_cache_max_entries (int): Size of the semantic result cache, which answers a query whose
+                                            embedding is close to an earlier one's, and which names the same
+                                            tickers, dates and numbers, with the earlier results until the index
+                                            changes. 0 (the default) disables it.
+            result_cache_similarity (float): Minimum cosine similarity between query embeddings for a cache hit.
+            index_type (str): FAISS index layout: "flat" (exact), "ivf" or "hnsw" (approximate).
+                              A stored index of another type is rebuilt on startup.
+            ivf_nlist (int): Number of IVF centroids (capped so each gets enough training points).
+            ivf_nprobe (int): IVF lists visited per query; higher is slower but more accurate.
+            hnsw_m (int): HNSW graph degree.
+            hnsw_ef_construction (int): HNSW candidate list size while inserting.
+            hnsw_ef_search (int): HNSW candidate list size per query; higher is slower but more accurate.
+            mmap_snapshot (bool): Open the stored snapshot memory-mapped and read-only, so startup does not
+                                  copy vectors or documents onto the heap and worker processes share
+                                  the same physical pages. The index is copied into memory on the first write.
+            quantization (str): How the index stores vectors: "none" (float32), "sq8" (int8 scalar
+                                quantization, 4x smaller) or "pq" (product quantization, ~32x smaller).
+                                Float vectors are kept memory-mapped on disk for exact re-ranking.
+            pq_m (int): Number of PQ sub-vectors (bytes per vector); capped to a divisor of the dimension.
+            rerank_factor (int): With quantization, k * rerank_factor candidates are fetched from the
+                                 index and re-ranked by exact float distance.
+            partition_by (Optional[str]): "day" or "week" splits the store into one shard per period of the
+                                          documents' metadata "date"; each shard is a separate index under
+                                          `<vector_store_path>/shards/`. None keeps a single index.
+            retention_days (Optional[int]): With partitioning, shards whose last day is older than this
+                                            are dropped whole. None keeps every shard.
+            shard_search_workers (int): Threads used to search shards in parallel.
+            retrieval_mode (str): Default of RETRIEVAL_MODES for queries that do not choose one.
+            lexical_confidence (float): Normalized BM25 score the best hit needs for "auto" mode to skip
+                                        the embedding call (about 1.0 = every known query term matched once).
+            lexical_margin (float): Factor by which the best BM25 hit must also beat the best hit left out of
+                                    the top k (or, when all hits fit, the weakest one) for "auto" mode to
+                                    answer lexically, i.e. how clearly the returned hits stand apart from
+                                    the rest of the matches.
+            hybrid_fanout (int): In hybrid retrieval, each engine contributes k * hybrid_fanout candidates.
+            embedding_backend (str): "google" (Google Generative AI, needs GOOGLE_API_KEY) or "hashed"
+                                     (local CPU hashed character n-grams; no key, no network).
+            embedding_dimension (int): Vector size of the "hashed" backend, and of a new empty index for models
+                                       that do not report theirs (text-embedding-004 produces 768).
+            embeddings (Optional[Embeddings]): Any LangChain Embeddings object to use instead of the
+                                               configured backend, e.g. a local sentence-transformers model.
+            ingest_workers (int): Background threads running ingest jobs submitted with submit_index_job.
+            ingest_batch_size (int): Documents an ingest job embeds and indexes per step; progress is
+                                     reported per step.
+            max_unindexed_vectors (int): Vectors written since the FAISS index was last built are searched
+                                         exactly from their float vectors; once this many accumulate, they are
+                                         added to a new copy of the index, which is then swapped in.
+            mmr_fetch_factor (int): Queries asking for diversified results (mmr_lambda) pick k of
+                                    k * mmr_fetch_factor candidates.
+            rerank (bool): Default for queries that do not choose whether to re-rank: when on, k * rerank_fetch_factor
+                           candidates are retrieved, re-scored on CPU by `reranker` and the best k returned.
+            reranker: Object with a score_batch(query, documents, retrieval_scores) method returning new scores,
+                      e.g. a small local cross-encoder. Defaults to TermOverlapReranker (term overlap + symbol match).
+            rerank_fetch_factor (int): Candidates re-ranked per requested result.
+            rerank_batch_size (int): Candidates scored per re-ranker call.
+            rerank_budget_ms (Optional[float]): Time allowed for re-ranking one request; no new batch is started
+                                                after it, and unscored candidates keep their retrieval order.
+                                                None removes the limit.
+            search_engine (str): "faiss" searches the FAISS index; "numpy" keeps normalized vectors in one
+                                 contiguous in-memory array and answers each search with a single matrix
+                                 product, which is faster for corpora of up to tens of thousands of chunks.
+                                 The FAISS index is still maintained for snapshots.
+            chunk_size (Optional[int]): Documents longer than this many characters are split at sentence
+                                        boundaries into chunks of at most this size, indexed as "<ID>#0",
+                                        "<ID>#1", ... with the parent's metadata plus "parent_id". None
+                                        indexes every document whole.
+            chunk_overlap (int): Characters of whole sentences consecutive chunks share.
+            parent_context_chunks (Optional[int]): Neighbouring chunks on each side joined into a retrieved
+                                                   chunk's parent context; None returns the whole parent.
+            read_only (Optional[bool]): None elects the writer through a lock file in vector_store_path: the
+                                        first process to open the store writes and compacts it, every other
+                                        process (e.g. further uvicorn workers) serves it read-only and answers
+                                        writes with HTTP 409. True always opens read-only; False writes without
+                                        taking the lock, for shards whose parent already holds it.
+            refresh_interval_seconds (Optional[float]): How often a read-only process reloads the store when the
+                                                        writer has logged or compacted changes. None disables it.
         """
-        print(f"RetrieverAgent: Initializing RetrieverAgent with embedding model '{embedding_model_name}'...")
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            # Critical error: API key is absolutely necessary for embeddings
-            print("CRITICAL ERROR: RetrieverAgent: GOOGLE_API_KEY not found for embedding model. Please set it in your Render environment variables or .env file.")
-            raise ValueError("RetrieverAgent: GOOGLE_API_KEY not found. Service cannot start without it.")
-
-        # Initialize the embedding model
-        # google_api_key is passed directly for robustness
-        self.embeddings = GoogleGenerativeAIEmbeddings(model=embedding_model_name, google_api_key=api_key)
+        self.embedding_backend = validate_embedding_backend(embedding_backend)
+        if embeddings is not None:
+            # A caller-supplied model; its name (if it exposes one) keeps embedding cache entries apart
+            self.embeddings = embeddings
+            self.embedding_model_name = getattr(embeddings, "model_name", None) or getattr(embeddings, "model", None) or type(embeddings).__name__
+        elif self.embedding_backend == "hashed":
+            self.embeddings = HashedNGramEmbeddings(dimension=embedding_dimension)
+            self.embedding_model_name = self.embeddings.model_name
+        else:
+            api_key = os.getenv("GOOGLE_API_KEY")
+            if not api_key:
+                # Critical error: API key is absolutely necessary for embeddings
+                print("CRITICAL ERROR: RetrieverAgent: GOOGLE_API_KEY not found for embedding model. Please set it in your Render environment variables or .env file, or use embedding_backend='hashed'.")
+                raise ValueError("RetrieverAgent: GOOGLE_API_KEY not found. Service cannot start without it.")
+            # Initialize the embedding model
+            # google_api_key is passed directly for robustness
+            self.embeddings = GoogleGenerativeAIEmbeddings(model=embedding_model_name, google_api_key=api_key)
+            self.embedding_model_name = embedding_model_name
+        # Size of the vectors the model produces, known without an embedding call
+        self.embedding_dimension = getattr(self.embeddings, "dimension", None) or embedding_dimension
+        print(f"RetrieverAgent: Initializing RetrieverAgent with embedding model '{self.embedding_model_name}'...")
+        # Batched query embedding should use the query task type where the model distinguishes it
+        self._batch_query_embed_kwargs = (
+            {"task_type": "retrieval_query"}
+            if "task_type" in inspect.signature(self.embeddings.embed_documents).parameters else {}
+        )
+        # Vectors already computed for the same (model, text) are served from this cache
+        self.embedding_cache = (
+            EmbeddingCache(embedding_cache_path, max_entries=embedding_cache_max_entries)
+            if embedding_cache_path else None
+        )
+        # Repeated query texts reuse their embedding instead of calling the model again
+        self.query_cache = (
+            QueryEmbeddingCache(max_entries=query_cache_max_entries, ttl_seconds=query_cache_ttl_seconds)
+            if query_cache_max_entries > 0 else None
+        )
+        # Paraphrased queries reuse the results of an earlier query while the index is unchanged
+        self.result_cache = (
+            SemanticResultCache(max_entries=result_cache_max_entries, similarity_threshold=result_cache_similarity)
+            if result_cache_max_entries > 0 else None
+        )
+        # Document embedding for indexing goes through a batched, concurrent pipeline
+        self.batch_embedder = BatchEmbedder(
+            self.embeddings,
+            batch_size=embed_batch_size,
+            max_workers=embed_max_workers,
+            max_retries=embed_max_retries,
+            cache=self.embedding_cache,
+            model_name=self.embedding_model_name,
+        )
         self.vector_store_path = vector_store_path
         self.vectorstore = None
-        self._load_or_create_vector_store() # This method will create an empty index if none is found/loadable
+        self.search_engine = validate_search_engine(search_engine)
+        # Normalized copy of the float vectors searched by the "numpy" engine, filled when views are published
+        self._normalized_matrix: Optional[NormalizedMatrix] = None
+        self.index_type = validate_index_type(index_type)
+        self.ivf_nlist = ivf_nlist
+        self.ivf_nprobe = ivf_nprobe
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        self.mmap_snapshot = mmap_snapshot
+        self.quantization = validate_quantization(quantization)
+        self.pq_m = pq_m
+        self.rerank_factor = max(1, rerank_factor)
+        # Full-precision vectors by FAISS position, used wherever quantized codes are not exact enough
+        self._float_vectors: Optional[FloatVectorStore] = None
+        # Snapshot directory the current index was read from, and whether the index is still a
+        # read-only mapping of it (FAISS cannot add to a mapped index)
+        self._snapshot_dir: Optional[str] = None
+        self._index_is_mapped = False
+        # Positions of deleted or replaced vectors. They stay in the FAISS index (IVF and HNSW cannot
+        # remove vectors without renumbering or at all) and are excluded from searches until compaction
+        self._tombstones: Set[int] = set()
+        # Documents by FAISS position, the positional counterpart of the float vectors
+        self._documents: Optional[PositionalDocuments] = None
+        self._position_by_id: Dict[str, int] = {}
+        # Searches read the latest published IndexView and never take a lock. Writers work on their own
+        # structures and publish a new view when done; nothing a published view uses is modified in place
+        self.max_unindexed_vectors = max(1, max_unindexed_vectors)
+        self._view: Optional[IndexView] = None
+        self._view_generation = 0
+        # Wall-clock time of the last logged upsert or delete, for /stats
+        self._last_commit_time: Optional[float] = None
+        # Rolling embed, search and save timings, for /stats
+        self.latency = LatencyStats()
+        # Serializes mutations of the vector store against each other and against compaction
+        self._write_lock = threading.RLock()
+        self.compaction_interval_seconds = compaction_interval_seconds
+        self.compaction_max_records = compaction_max_records
+        self.tombstone_purge_fraction = tombstone_purge_fraction
+        # Held for a whole compaction or rebuild, so snapshots are written one at a time while
+        # _write_lock is only taken to capture and adopt them
+        self._compaction_lock = threading.Lock()
+        self.partition_by = validate_partition_by(partition_by) if partition_by else None
+        self.retention_days = retention_days
+        self.retrieval_mode = self._validate_retrieval_mode(retrieval_mode)
+        self.lexical_confidence = lexical_confidence
+        self.lexical_margin = lexical_margin
+        self.hybrid_fanout = max(1, hybrid_fanout)
+        self.mmr_fetch_factor = max(1, mmr_fetch_factor)
+        self.rerank = rerank
+        self.reranker = reranker if reranker is not None else TermOverlapReranker()
+        self.rerank_fetch_factor = max(1, rerank_fetch_factor)
+        self.rerank_batch_size = max(1, rerank_batch_size)
+        self.rerank_budget_ms = rerank_budget_ms
+        self.chunker = TextChunker(chunk_size, chunk_overlap) if chunk_size else None
+        self.parent_context_chunks = parent_context_chunks
+        # Only one process may append to the write-ahead log and compact: two writers in the same
+        # directory would truncate each other's log records and race for snapshot names
+        self._writer_lock = WriterLock(os.path.join(vector_store_path, WRITER_LOCK_FILENAME))
+        self.is_writer = not read_only if read_only is not None else self._writer_lock.try_acquire()
+        if not self.is_writer:
+            print(f"RetrieverAgent: Another process writes {vector_store_path}; serving it read-only.")
+        self.refresh_interval_seconds = refresh_interval_seconds
+        # Store files seen by the last (re)load, compared by read-only processes to notice the writer's changes
+        self._loaded_signature = None
+
+        if self.partition_by:
+            # Every shard is a RetrieverAgent of its own without caches or a compaction thread:
+            # this agent embeds once, routes vectors to shards and compacts them from its own thread
+            self._shard_options = dict(
+                embeddings=self.embeddings, embedding_dimension=self.embedding_dimension,
+                embedding_cache_path=None, query_cache_max_entries=0, result_cache_max_entries=0,
+                wal_fsync=wal_fsync, compaction_interval_seconds=None, compaction_max_records=compaction_max_records,
+                tombstone_purge_fraction=tombstone_purge_fraction,
+                index_type=index_type, ivf_nlist=ivf_nlist, ivf_nprobe=ivf_nprobe, hnsw_m=hnsw_m,
+                hnsw_ef_construction=hnsw_ef_construction, hnsw_ef_search=hnsw_ef_search,
+                mmap_snapshot=mmap_snapshot, quantization=quantization, pq_m=pq_m, rerank_factor=rerank_factor,
+                search_engine=search_engine, chunk_size=None, # Documents arrive here already chunked
+                read_only=not self.is_writer, refresh_interval_seconds=None, # The parent's lock covers its shards
+            )
+            self._shards: Dict[str, "RetrieverAgent"] = {}
+            self._shard_by_id: Dict[str, str] = {} # Document ID -> key of the shard holding it
+            self._shard_executor = ThreadPoolExecutor(max_workers=max(1, shard_search_workers), thread_name_prefix="retriever-shard")
+            self._open_shards()
+            self.drop_expired_shards()
+        else:
+            self._wal_fsync = wal_fsync
+            with self._write_lock:
+                self._load_store()
+        # Ingest jobs embed and index on background threads; searches read published views and
+        # never wait for them, so they keep running while a bulk ingest is in progress
+        self.ingest_jobs = IngestJobQueue(self.index_documents, max_workers=ingest_workers, batch_size=ingest_batch_size)
+        self._compaction_requested = threading.Event()
+        self._stop_compaction = threading.Event()
+        self._compaction_thread = None
+        if compaction_interval_seconds if self.is_writer else refresh_interval_seconds:
+            self._compaction_thread = threading.Thread(target=self._compaction_loop, name="retriever-compaction", daemon=True)
+            self._compaction_thread.start()
         print(f"RetrieverAgent: Vector store initialized/loaded at '{vector_store_path}'.")
 
+    def _load_store(self):
+        """
+        Loads the snapshot and replays the write-ahead log on top of it, then publishes the result.
+        Callers must hold self._write_lock.
+        """
+        self._loaded_signature = self._store_signature()
+        self._tombstones = set() # A snapshot written with tombstones restores them while loading
+        self._load_or_create_vector_store() # This method will create an empty index if none is found/loadable
+        self._check_embedding_dimension()
+        self._normalized_matrix = None
+        # Inverted (metadata key, value) -> document ID index used to restrict filtered searches
+        # It is built on first use, so a cold start does not decode every stored document
+        self.metadata_index = MetadataIndex()
+        self._metadata_index_ready = False
+        # BM25 index over the document texts; also built on first use, then kept up to date by writes
+        self.lexical_index = BM25Index()
+        self._lexical_index_ready = False
+        self._position_by_id = {doc_id: position for position, doc_id in self.vectorstore.index_to_docstore_id.items()}
+        self._apply_index_config()
+
+        # Index calls append to the write-ahead log; full snapshots are only written by compaction
+        self.write_ahead_log = WriteAheadLog(os.path.join(self.vector_store_path, WAL_FILENAME), fsync=self._wal_fsync)
+        self._replay_write_ahead_log()
+        self._publish_view()
+
+    def _store_signature(self) -> Tuple[Optional[str], Optional[Tuple[int, int]]]:
+        """The current snapshot and the size and modification time of the write-ahead log; changes with every commit."""
+        snapshot = current_snapshot_dir(self.vector_store_path) if has_snapshot(self.vector_store_path) else None
+        try:
+            wal_stat = os.stat(os.path.join(self.vector_store_path, WAL_FILENAME))
+            wal = (wal_stat.st_size, wal_stat.st_mtime_ns)
+        except FileNotFoundError:
+            wal = None
+        return snapshot, wal
+
+    def refresh(self) -> bool:
+        """
+        Reloads the store if the writer process has logged or compacted changes since this process
+        loaded it, and publishes the result for searches. Only read-only processes need this; their
+        background thread calls it every refresh_interval_seconds. Returns whether anything was reloaded.
+        """
+        if self.is_writer:
+            return False
+        if self.partition_by:
+            with self._write_lock:
+                keys = self._stored_shard_keys()
+                changed = False
+                for key in [key for key in self._shards if key not in keys]:
+                    self._shards.pop(key).close() # Dropped by the writer
+                    changed = True
+                for key in keys:
+                    if key not in self._shards:
+                        self._shard(key)
+                        changed = True
+                    elif self._shards[key].refresh():
+                        changed = True
+                if changed:
+                    self._shard_by_id = {doc_id: key for key, shard in self._shards.items() for doc_id in shard._position_by_id}
+            return changed
+        with self._write_lock:
+            if self._store_signature() == self._loaded_signature:
+                return False
+            # A compaction finishing mid-load removes the files being read; load again until nothing moved
+            for _ in range(5):
+                self._load_store()
+                if self._store_signature() == self._loaded_signature:
+                    break
+        print(f"RetrieverAgent: Reloaded {self.vector_store_path} with {len(self._position_by_id)} documents written by another process.")
+        return True
+
+    def _require_writer(self):
+        """Raises HTTPException 409 in read-only processes, which must not write the shared store."""
+        if not self.is_writer:
+            holder = self._writer_lock.holder()
+            raise HTTPException(
+                status_code=409,
+                detail=f"RetrieverAgent: This process serves {self.vector_store_path} read-only; "
+                       f"writes go to the process holding {WRITER_LOCK_FILENAME}{f' (pid {holder})' if holder else ''}. "
+                       "Run a single worker for indexing, or retry until a writer takes over.",
+            )
+
     def _load_or_create_vector_store(self):
         """
-        Loads an existing FAISS index from the specified path or creates a new one.
-        Handles cases where the index file might be corrupted or non-existent.
+        Loads the stored snapshot from the specified path or creates a new index.
+        Handles cases where the stored files might be corrupted or non-existent.
         On Render's ephemeral file system, this will typically create a new, empty index
         on every deployment or restart.
         """
-        if os.path.exists(self.vector_store_path):
+        if has_snapshot(self.vector_store_path):
+            try:
+                # Only the ID list is read eagerly; vectors and documents are paged in from disk on access
+                index, ids, docstore, self._snapshot_dir = load_snapshot(self.vector_store_path, mmap=self.mmap_snapshot)
+                # Tombstoned positions are stored without an ID
+                self.vectorstore = FAISS(self.embeddings, index, docstore, {
+                    position: doc_id for position, doc_id in enumerate(ids) if doc_id is not None
+                })
+                self._tombstones = {position for position, doc_id in enumerate(ids) if doc_id is None}
+                self._documents = PositionalDocuments.from_snapshot(docstore)
+                self._index_is_mapped = self.mmap_snapshot
+                self._float_vectors = read_snapshot_vectors(self._snapshot_dir) or FloatVectorStore.from_index(index)
+                print(f"RetrieverAgent: Loaded snapshot '{os.path.basename(self._snapshot_dir)}' ({len(ids) - len(self._tombstones)} documents, memory-mapped: {self.mmap_snapshot}) from {self.vector_store_path}.")
+                return
+            except Exception as e:
+                print(f"RetrieverAgent: Error loading snapshot from {self.vector_store_path}: {e}. Creating a new, empty index.")
+        elif os.path.exists(os.path.join(self.vector_store_path, "index.faiss")):
+            # Index saved by LangChain's save_local before snapshots were versioned; converted on first save
             try:
                 # allow_dangerous_deserialization=True is necessary for loading FAISS indexes
                 self.vectorstore = FAISS.load_local(self.vector_store_path, self.embeddings, allow_dangerous_deserialization=True)
+                enable_reconstruction(self.vectorstore.index)
+                self._float_vectors = FloatVectorStore.from_index(self.vectorstore.index)
+                self._documents = PositionalDocuments()
+                self._documents.append(
+                    self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[position])
+                    for position in range(self.vectorstore.index.ntotal)
+                )
                 print(f"RetrieverAgent: Loaded existing FAISS index from {self.vector_store_path}.")
+                return
             except Exception as e:
                 # This is the expected path on Render if an old incompatible index was attempted to be loaded
                 print(f"RetrieverAgent: Error loading FAISS index from {self.vector_store_path}: {e}. This might indicate corruption or an incompatible version. Creating a new, empty index.")
-                # If loading fails, create a new empty index with a dummy document
-                # This ensures vectorstore is always initialized
-                try:
-                    self.vectorstore = FAISS.from_documents([Document(page_content="initial document for empty index")], self.embeddings)
-                    self.vectorstore.save_local(self.vector_store_path)
-                    print("RetrieverAgent: Successfully created a new, empty index.")
-                except Exception as init_e:
-                    print(f"CRITICAL ERROR: RetrieverAgent: Failed to create even an empty index: {init_e}")
-                    raise init_e # Re-raise to prevent service startup if this critical step fails
         else:
             # This is the expected path on Render when the service starts fresh
             print(f"RetrieverAgent: No FAISS index found at {self.vector_store_path}. Creating a new empty index.")
-            # A dummy document is needed to initialize an empty FAISS index
-            try:
-                self.vectorstore = FAISS.from_documents([Document(page_content="initial document for empty index")], self.embeddings)
-                self.vectorstore.save_local(self.vector_store_path)
-                print("RetrieverAgent: Successfully created a new, empty index.")
-            except Exception as init_e:
-                print(f"CRITICAL ERROR: RetrieverAgent: Failed to create an empty index from scratch: {init_e}")
-                raise init_e
 
+        self._create_empty_vector_store(self.embedding_dimension)
+        print(f"RetrieverAgent: Successfully created a new, empty {self.embedding_dimension}-dimensional index.")
+
+    def _create_empty_vector_store(self, dimension: int):
+        """
+        Starts an empty store of `dimension`-sized vectors: no embedding call and nothing written to disk.
+        The flat index is only a stand-in; the configured index is built once there are vectors to
+        train it on (see _merge_unindexed_vectors), and the first compaction writes the first snapshot.
+        """
+        self.vectorstore = FAISS(self.embeddings, faiss.IndexFlatL2(dimension), InMemoryDocstore(), {})
+        self._float_vectors = FloatVectorStore(dimension)
+        self._documents = PositionalDocuments()
+        self._tombstones = set()
+        self._index_is_mapped = False
+        self._normalized_matrix = None
+
+    def _check_embedding_dimension(self):
+        """
+        Refuses to serve a stored index built with vectors of another size than the configured model
+        produces (e.g. after switching backends), rather than failing on the first search.
+        """
+        dimension = getattr(self.embeddings, "dimension", None)
+        if dimension is not None and self.vectorstore.index.d != dimension:
+            raise ValueError(
+                f"RetrieverAgent: Stored index at {self.vector_store_path} holds {self.vectorstore.index.d}-dimensional vectors, "
+                f"but embedding model '{self.embedding_model_name}' produces {dimension}. Use another vector_store_path or rebuild the index."
+            )
+
+    def _ensure_writable_index(self):
+        """
+        Replaces a memory-mapped index with an in-memory copy read from the same snapshot file,
+        since FAISS cannot add vectors to a mapped index. Published views keep searching the
+        mapping. Callers must hold self._write_lock.
+        """
+        if not self._index_is_mapped:
+            return
+        start = time.perf_counter()
+        index = read_snapshot_index(self._snapshot_dir, mmap=False)
+        enable_reconstruction(index)
+        self.vectorstore.index = index
+        self._index_is_mapped = False
+        self._apply_search_tunables()
+        print(f"RetrieverAgent: Copied the memory-mapped index into memory for writing in {time.perf_counter() - start:.2f}s.")
+
+    def _ensure_metadata_index(self):
+        """Builds the inverted metadata index on first use."""
+        if not self._metadata_index_ready:
+            with self._write_lock:
+                if not self._metadata_index_ready:
+                    self._rebuild_metadata_index()
+
+    @staticmethod
+    def make_document_id(metadata: Dict[str, Any]) -> Optional[str]:
+        """
+        Derives a stable document ID from metadata of the form produced by
+        format_market_data_for_retrieval, e.g. "stock_price:TSM:2025-05-29".
+        Returns None if any of `type`, `symbol` or `date` is missing.
+        """
+        parts = [metadata.get(key) for key in STABLE_ID_METADATA_KEYS]
+        if any(part in (None, "") for part in parts):
+            return None
+        return ":".join(str(part) for part in parts)
 
-    def index_documents(self, documents: List[str], metadata: Optional[List[Dict[str, Any]]] = None) -> int:
+    def index_documents(self, documents: List[str], metadata: Optional[List[Dict[str, Any]]] = None,
+                        ids: Optional[List[Optional[str]]] = None) -> int:
         """
         Indexes a list of text documents into the FAISS vector store.
         This method allows you to add documents to the vector store via API calls.
+
+        Documents are upserted by ID: indexing a document whose ID already exists replaces
+        the stored vector and text instead of adding a duplicate. IDs come from `ids` when given,
+        otherwise they are derived from metadata via make_document_id, and documents without
+        a derivable ID get a random one (plain append).
+
+        Documents longer than chunk_size are indexed as chunks (see _chunk_documents); the returned
+        count is of stored entries, i.e. chunks for those documents.
         """
         if not documents:
             print("RetrieverAgent: No documents provided for indexing. Returning 0 indexed documents.")
             return 0
+        self._require_writer()
         if metadata and len(documents) != len(metadata):
             raise ValueError("RetrieverAgent: Length of documents and metadata must match if metadata is provided.")
+        if ids and len(documents) != len(ids):
+            raise ValueError("RetrieverAgent: Length of documents and ids must match if ids are provided.")
 
-        docs_to_add = []
+        # Keyed by document ID so that a repeated ID within one request keeps only its last occurrence
+        docs_by_id: Dict[str, Document] = {}
         for i, doc_content in enumerate(documents):
             doc_metadata = metadata[i] if metadata and i < len(metadata) else {}
-            docs_to_add.append(Document(page_content=doc_content, metadata=doc_metadata))
+            doc_id = (ids[i] if ids else None) or self.make_document_id(doc_metadata) or str(uuid.uuid4())
+            docs_by_id.pop(doc_id, None)
+            docs_by_id[doc_id] = Document(page_content=doc_content, metadata=doc_metadata)
+        docs_by_id, stale_ids = self._chunk_documents(docs_by_id)
+        doc_ids = list(docs_by_id.keys())
+        docs_to_add = list(docs_by_id.values())
 
         print(f"RetrieverAgent: Attempting to index {len(docs_to_add)} documents into vector store...")
         try:
@@ -111,62 +590,1323 @@ class RetrieverAgent:
                 print(f"RetrieverAgent: Debug - First doc content (first 100 chars): {docs_to_add[0].page_content[:100]}")
                 print(f"RetrieverAgent: Debug - First doc metadata: {docs_to_add[0].metadata}")
 
-            if self.vectorstore:
-                print("RetrieverAgent: Adding documents to existing vector store...")
-                # This is the critical line where embeddings are generated and added
-                self.vectorstore.add_documents(docs_to_add)
+            # Embeddings are generated in batches across a bounded worker pool;
+            # the vectors come back in the same order as docs_to_add
+            texts = [doc.page_content for doc in docs_to_add]
+            with self.latency.time("embed"):
+                vectors = self.batch_embedder.embed_documents(texts)
+            metadatas = [doc.metadata for doc in docs_to_add]
+
+            if self.partition_by:
+                indexed_count, replaced_count = self._index_into_shards(doc_ids, texts, metadatas, vectors)
             else:
-                # This case should ideally not happen if _load_or_create_vector_store works,
-                # but handled as a fallback.
-                print("RetrieverAgent: Vector store was None during indexing, creating a new one from documents.")
-                self.vectorstore = FAISS.from_documents(docs_to_add, self.embeddings)
-
-            print("RetrieverAgent: Documents added successfully. Saving index locally...")
-            self.vectorstore.save_local(self.vector_store_path)
-            print(f"RetrieverAgent: Successfully indexed {len(docs_to_add)} documents and saved index locally.")
-            return len(docs_to_add)
+                indexed_count, replaced_count = len(doc_ids), self._index_vectors(doc_ids, texts, metadatas, vectors)
+            if stale_ids:
+                # Chunks of an earlier, longer version of a re-indexed document
+                self.delete_documents(stale_ids)
+
+            print(f"RetrieverAgent: Successfully indexed {indexed_count} documents ({replaced_count} replaced existing IDs) and logged them to the write-ahead log.")
+            return indexed_count
         except Exception as e:
             # Enhanced error logging to capture the exact exception during indexing
             print(f"RetrieverAgent: !!!!! CRITICAL ERROR during document indexing: {type(e).__name__} - {e}")
             raise HTTPException(status_code=500, detail=f"Failed to index documents into vector store: {e}")
 
 
-    def retrieve_top_k_chunks(self, query: str, k: int = 5) -> List[str]:
+    def _chunk_documents(self, docs_by_id: Dict[str, Document]) -> Tuple[Dict[str, Document], List[str]]:
         """
-        Retrieves the top-k most relevant text chunks from the vector store
-        for a given query.
+        Replaces documents longer than chunk_size by their chunks, keyed "<ID>#<n>", and returns them
+        with the IDs of stored entries the new versions make obsolete: chunks past the new chunk count,
+        and the whole document when it is now chunked (or its chunks when it is now stored whole).
+        """
+        if self.chunker is None:
+            return docs_by_id, []
+        chunked: Dict[str, Document] = {}
+        stale_ids: List[str] = []
+        for doc_id, doc in docs_by_id.items():
+            if len(doc.page_content) <= self.chunker.chunk_size:
+                chunked[doc_id] = doc
+                stale_ids.extend(self._stale_chunk_ids(doc_id, 0, stored_whole=True))
+                continue
+            chunk_count = 0
+            for index, (start, text) in enumerate(self.chunker.chunks([doc.page_content])):
+                chunked[chunk_id(doc_id, index)] = Document(page_content=text, metadata=self._chunk_metadata(doc.metadata, doc_id, index, start))
+                chunk_count = index + 1
+            stale_ids.extend(self._stale_chunk_ids(doc_id, chunk_count, stored_whole=False))
+        return chunked, stale_ids
+
+    @staticmethod
+    def _chunk_metadata(metadata: Dict[str, Any], parent_id: str, index: int, start: int) -> Dict[str, Any]:
+        return {**metadata, "parent_id": parent_id, "chunk_index": index, "chunk_start": start}
+
+    def _stale_chunk_ids(self, parent_id: str, chunk_count: int, stored_whole: bool) -> List[str]:
+        """Stored IDs of `parent_id` not written by a new version with `chunk_count` chunks (0 if `stored_whole`)."""
+        stale_ids = [] if stored_whole or not self._has_document(parent_id) else [parent_id]
+        index = chunk_count
+        while self._has_document(chunk_id(parent_id, index)):
+            stale_ids.append(chunk_id(parent_id, index))
+            index += 1
+        return stale_ids
+
+    def index_document_stream(self, pieces: Iterable[str], metadata: Optional[Dict[str, Any]] = None,
+                              doc_id: Optional[str] = None) -> int:
+        """
+        Indexes one long document, such as a filing, read piece by piece (lines of a file, blocks of
+        a download). Chunks are embedded and indexed in batches of ingest_batch_size as the text
+        streams in, so neither the document nor all of its chunks are held in memory at once.
+
+        Args:
+            pieces (Iterable[str]): The document text in consecutive pieces.
+            metadata (Optional[Dict[str, Any]]): Metadata of the document, copied to every chunk.
+            doc_id (Optional[str]): Parent ID of the chunks; derived from metadata or random by default.
+
+        Returns:
+            int: Number of chunks indexed.
+        """
+        if self.chunker is None:
+            raise ValueError("RetrieverAgent: Streaming a document needs chunking; set chunk_size.")
+        self._require_writer()
+        metadata = metadata or {}
+        parent_id = doc_id or self.make_document_id(metadata) or str(uuid.uuid4())
+        indexed_count = chunk_count = 0
+        batch: List[Tuple[str, str, Dict[str, Any]]] = []
+        for index, (start, text) in enumerate(self.chunker.chunks(pieces)):
+            batch.append((chunk_id(parent_id, index), text, self._chunk_metadata(metadata, parent_id, index, start)))
+            chunk_count = index + 1
+            if len(batch) >= self.ingest_jobs.batch_size:
+                indexed_count += self._index_chunk_batch(batch)
+                batch = []
+        if batch:
+            indexed_count += self._index_chunk_batch(batch)
+        stale_ids = self._stale_chunk_ids(parent_id, chunk_count, stored_whole=False)
+        if stale_ids:
+            self.delete_documents(stale_ids)
+        print(f"RetrieverAgent: Indexed document '{parent_id}' as {chunk_count} chunks.")
+        return indexed_count
+
+    def _index_chunk_batch(self, batch: List[Tuple[str, str, Dict[str, Any]]]) -> int:
+        ids, texts, metadatas = (list(column) for column in zip(*batch))
+        return self.index_documents(texts, metadatas, ids)
+
+    def _has_document(self, doc_id: str) -> bool:
+        if self.partition_by:
+            return doc_id in self._shard_by_id
+        return doc_id in self._position_by_id
+
+    def _document_by_id(self, doc_id: str) -> Optional[Document]:
+        """The stored document with `doc_id` in the current view, or None."""
+        if self.partition_by:
+            shard = self._shards.get(self._shard_by_id.get(doc_id))
+            return shard._document_by_id(doc_id) if shard is not None else None
+        view = self._view
+        position = view.position_of(doc_id)
+        return view.documents.at(position) if position is not None else None
+
+    def _parent_context(self, doc: Document) -> Optional[str]:
+        """
+        The stretch of a chunk's parent document around it: the chunk joined with up to
+        parent_context_chunks neighbours on each side (all chunks if None), overlaps removed.
+        None for documents stored whole.
+        """
+        parent_id = doc.metadata.get("parent_id")
+        if parent_id is None:
+            return None
+        index = doc.metadata["chunk_index"]
+        pieces = [(doc.metadata["chunk_start"], doc.page_content)]
+        for step in (-1, 1):
+            neighbour_index = index + step
+            while self.parent_context_chunks is None or abs(neighbour_index - index) <= self.parent_context_chunks:
+                neighbour = self._document_by_id(chunk_id(parent_id, neighbour_index))
+                if neighbour is None:
+                    break
+                pieces.append((neighbour.metadata["chunk_start"], neighbour.page_content))
+                neighbour_index += step
+        return join_chunks(pieces)
+
+    def submit_index_job(self, documents: List[str], metadata: Optional[List[Dict[str, Any]]] = None,
+                         ids: Optional[List[Optional[str]]] = None) -> Dict[str, Any]:
+        """
+        Queues documents for background indexing and returns the job status, including its `job_id`.
+        The job runs index_documents over slices of ingest_batch_size documents; follow it with get_index_job.
+        """
+        self._require_writer()
+        if metadata and len(documents) != len(metadata):
+            raise HTTPException(status_code=400, detail="RetrieverAgent: Length of documents and metadata must match if metadata is provided.")
+        if ids and len(documents) != len(ids):
+            raise HTTPException(status_code=400, detail="RetrieverAgent: Length of documents and ids must match if ids are provided.")
+        job = self.ingest_jobs.submit(documents, metadata, ids)
+        print(f"RetrieverAgent: Queued ingest job {job['job_id']} with {len(documents)} documents.")
+        return job
+
+    def get_index_job(self, job_id: str) -> Dict[str, Any]:
+        """Returns the status and progress of an ingest job. Raises HTTPException 404 for unknown or expired IDs."""
+        job = self.ingest_jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"RetrieverAgent: Unknown ingest job '{job_id}'.")
+        return job
+
+    def _index_vectors(self, doc_ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]],
+                       vectors: List[List[float]]) -> int:
+        """
+        Logs and applies an upsert of already embedded documents to this store.
+        Returns how many stored documents it replaced.
+        """
+        with self._write_lock:
+            # Log first so the batch survives a crash, then apply it in memory
+            self.write_ahead_log.append_upsert(doc_ids, texts, metadatas, vectors)
+            replaced_count = self._apply_upsert(doc_ids, texts, vectors, metadatas)
+            self._publish_view()
+            self._last_commit_time = time.time()
+            if self.write_ahead_log.record_count >= self.compaction_max_records:
+                self._compaction_requested.set()
+        return replaced_count
+
+    def _apply_upsert(self, doc_ids: List[str], texts: List[str], vectors: List[List[float]],
+                      metadatas: List[Dict[str, Any]]) -> int:
+        """
+        Applies an upsert to the in-memory vector store and returns how many stored documents it replaced.
+        Callers must hold self._write_lock.
+        """
+        if self.vectorstore is None:
+            # This case should ideally not happen if _load_or_create_vector_store works,
+            # but handled as a fallback.
+            print("RetrieverAgent: Vector store was None during indexing, creating a new one from documents.")
+            self.vectorstore = FAISS.from_embeddings(list(zip(texts, vectors)), self.embeddings, metadatas=metadatas, ids=doc_ids)
+            self._float_vectors = FloatVectorStore.from_index(self.vectorstore.index)
+            self._documents = PositionalDocuments()
+            self._documents.append(self.vectorstore.docstore.search(doc_id) for doc_id in doc_ids)
+            self._rebuild_metadata_index()
+            self._position_by_id = {doc_id: position for position, doc_id in self.vectorstore.index_to_docstore_id.items()}
+            return 0
+        self._ensure_metadata_index()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(self._float_vectors) == 0 and vectors.shape[1] != self._float_vectors.dimension:
+            # An empty store sized for a model that does not report its dimension; start over at the real size
+            print(f"RetrieverAgent: Resizing the empty index from {self._float_vectors.dimension} to {vectors.shape[1]} dimensions.")
+            self._create_empty_vector_store(vectors.shape[1])
+
+        # Tombstone the old vectors of IDs being re-indexed so the add below replaces them
+        replaced_count = self._remove_ids(doc_ids)
+        if replaced_count:
+            print(f"RetrieverAgent: Replacing {replaced_count} existing documents with matching IDs...")
+
+        # New vectors go to the float vectors only and are searched exactly from there until the next
+        # merge; the FAISS index itself may be in use by searches and is never added to in place.
+        # Positions continue after the last float vector, as LangChain's add_embeddings would get them
+        # wrong (it derives them from the docstore size) once tombstoned positions exist
+        first_position = len(self._float_vectors)
+        documents = [Document(page_content=text, metadata=doc_metadata) for text, doc_metadata in zip(texts, metadatas)]
+        self._float_vectors.add(vectors)
+        self._documents.append(documents)
+        self.vectorstore.docstore.add(dict(zip(doc_ids, documents)))
+        for offset, (doc_id, text, doc_metadata) in enumerate(zip(doc_ids, texts, metadatas)):
+            self.vectorstore.index_to_docstore_id[first_position + offset] = doc_id
+            self._position_by_id[doc_id] = first_position + offset
+            self.metadata_index.add(doc_id, doc_metadata)
+            if self._lexical_index_ready:
+                self.lexical_index.add(doc_id, text)
+        if len(self._float_vectors) - self.vectorstore.index.ntotal >= self.max_unindexed_vectors:
+            self._merge_unindexed_vectors()
+        return replaced_count
+
+    def _merge_unindexed_vectors(self):
+        """
+        Adds the vectors written since the FAISS index was built to a new copy of the index and makes
+        the copy current. The index published views search is left untouched; the next published view
+        searches the copy. Callers must hold self._write_lock.
+        """
+        index = self.vectorstore.index
+        first_position, count = index.ntotal, len(self._float_vectors)
+        if first_position == count:
+            return
+        start = time.perf_counter()
+        new_vectors = self._float_vectors.get(np.arange(first_position, count))
+        if first_position == 0 and (index_type_of(index), quantization_of(index)) != (self.index_type, self.quantization):
+            # The stand-in index of an empty store: build the configured one now that there are vectors to train on
+            try:
+                self.vectorstore.index = self._build_index(self.index_type, self.quantization, new_vectors)
+                print(f"RetrieverAgent: Built the '{self.index_type}' ({self.quantization}) index over the first {count} vectors in {time.perf_counter() - start:.2f}s.")
+                return
+            except ValueError as e:
+                print(f"RetrieverAgent: Could not build the index as configured yet: {e} Using a '{index_type_of(index)}' index until /rebuild_index.")
+        if self._index_is_mapped:
+            # A fresh in-memory read of the snapshot file is already a private copy
+            self._ensure_writable_index()
+            new_index = self.vectorstore.index
+        else:
+            new_index = faiss.clone_index(index)
+            enable_reconstruction(new_index)
+        new_index.add(new_vectors)
+        self.vectorstore.index = new_index
+        self._apply_search_tunables()
+        print(f"RetrieverAgent: Merged {count - first_position} vectors into a new copy of the index in {time.perf_counter() - start:.2f}s.")
+
+    def _publish_view(self):
+        """
+        Publishes the current store state as a new IndexView for searches to read.
+        Callers must hold self._write_lock.
+        """
+        matrix = None
+        if self.search_engine == "numpy":
+            if self._normalized_matrix is None:
+                self._normalized_matrix = NormalizedMatrix(self._float_vectors.dimension, capacity=max(1024, len(self._float_vectors)))
+            self._normalized_matrix.extend_from(self._float_vectors)
+            matrix = self._normalized_matrix.rows
+        self._view_generation += 1
+        self._view = IndexView(
+            self._view_generation, self.vectorstore.index, len(self._float_vectors), frozenset(self._tombstones),
+            self._float_vectors, self._documents, self._position_by_id, matrix,
+        )
+
+    def _apply_delete(self, doc_ids: List[str]) -> int:
+        """
+        Removes stored documents by ID from the in-memory vector store and returns how many were removed.
+        Callers must hold self._write_lock.
+        """
+        return self._remove_ids(doc_ids)
+
+    def _remove_ids(self, doc_ids: List[str]) -> int:
+        """
+        Unlinks stored documents from the docstore and metadata index and tombstones their vectors.
+        Tombstoned vectors are physically dropped by the next compaction or rebuild.
+        """
+        removed_ids = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id in self._position_by_id]
+        if not removed_ids:
+            return 0
+        self._ensure_metadata_index()
+        for doc_id in removed_ids:
+            position = self._position_by_id.pop(doc_id)
+            del self.vectorstore.index_to_docstore_id[position]
+            self._tombstones.add(position)
+            self.metadata_index.remove(doc_id)
+            if self._lexical_index_ready:
+                self.lexical_index.remove(doc_id)
+        self.vectorstore.docstore.delete(removed_ids)
+        return len(removed_ids)
+
+    def delete_documents(self, doc_ids: List[str]) -> int:
+        """
+        Deletes documents by ID. The deletion is logged to the write-ahead log before it is applied.
+        Returns the number of documents that were actually stored and removed.
+        """
+        if not doc_ids:
+            return 0
+        self._require_writer()
+        if self.partition_by:
+            with self._write_lock:
+                ids_by_shard: Dict[str, List[str]] = {}
+                for doc_id in doc_ids:
+                    key = self._shard_by_id.get(doc_id)
+                    if key in self._shards:
+                        ids_by_shard.setdefault(key, []).append(doc_id)
+                deleted_count = 0
+                for key, shard_ids in ids_by_shard.items():
+                    deleted_count += self._shards[key].delete_documents(shard_ids)
+                    for doc_id in shard_ids:
+                        self._shard_by_id.pop(doc_id, None)
+            return deleted_count
+        with self._write_lock:
+            self.write_ahead_log.append_delete(doc_ids)
+            deleted_count = self._apply_delete(doc_ids)
+            self._publish_view()
+            self._last_commit_time = time.time()
+        print(f"RetrieverAgent: Deleted {deleted_count} documents.")
+        return deleted_count
+
+    def _replay_write_ahead_log(self):
+        """
+        Re-applies mutations logged since the last snapshot, restoring the state before shutdown or crash.
+        Replaying is idempotent, so records that already made it into the snapshot are harmless.
+        """
+        replayed = 0
+        with self._write_lock:
+            for record in self.write_ahead_log.replay():
+                if record["op"] == "upsert":
+                    self._apply_upsert(record["ids"], record["texts"], record["vectors"], record["metadatas"])
+                elif record["op"] == "delete":
+                    self._apply_delete(record["ids"])
+                replayed += 1
+        if replayed:
+            print(f"RetrieverAgent: Replayed {replayed} write-ahead log records on top of the snapshot.")
+
+    def _save_snapshot(self, truncate_log: bool = True):
+        """
+        Writes the full index and documents as a new snapshot generation. Files go to a fresh
+        directory and the CURRENT pointer is switched atomically, so a crash mid-write never leaves
+        a half-written snapshot behind.
+
+        self._write_lock is only held to capture the current view and to adopt the written files,
+        so indexing and deletes continue while the snapshot is written. Unindexed vectors are merged
+        first, so positions match snapshot rows; tombstones are purged only above
+        tombstone_purge_fraction and are otherwise written as rows without an ID.
+        Callers must hold self._compaction_lock, or be loading the store.
+
+        Args:
+            truncate_log (bool): Whether write-ahead log records captured in the snapshot are discarded.
+                                 Records logged while it was being written are kept either way.
+        """
+        if not self.is_writer:
+            # Another process owns the snapshot directory; writing here would replace its CURRENT generation
+            raise RuntimeError(f"RetrieverAgent: Only the writer process may write snapshots of {self.vector_store_path}.")
+        with self._write_lock:
+            if len(self._tombstones) > self.tombstone_purge_fraction * len(self._float_vectors):
+                self._purge_tombstones()
+            # A mapped index would have to be re-read from the snapshot directory this write replaces
+            self._ensure_writable_index()
+            self._merge_unindexed_vectors()
+            self._publish_view()
+            view = self._view
+            mapping = self.vectorstore.index_to_docstore_id
+            ordered_ids = [mapping.get(position) for position in range(view.count)]
+            wal_mark = self.write_ahead_log.mark() if truncate_log else None
+        snapshot_dir = write_snapshot(
+            self.vector_store_path, view.index, ordered_ids,
+            (view.documents.at(position) for position in range(view.count)), index_type_of(view.index),
+            vectors=view.vectors, quantization=quantization_of(view.index),
+        )
+        with self._write_lock:
+            if wal_mark is not None:
+                self.write_ahead_log.truncate(upto=wal_mark)
+            # A mapped index is re-read from the newest snapshot, whose index file holds the same vectors
+            self._snapshot_dir = snapshot_dir
+            self._adopt_snapshot(view, ordered_ids)
+
+    def _adopt_snapshot(self, view: IndexView, ordered_ids: List[Optional[str]]):
+        """
+        Serves documents and float vectors of the positions in `view` from the snapshot just written,
+        which drops their in-memory copies. Positions written since the view was captured are carried
+        over on top. If the positions were renumbered in the meantime, the in-memory copies are kept
+        until the next snapshot. Callers must hold self._write_lock.
+        """
+        if self._float_vectors is not view.vectors or self._documents is not view.documents:
+            return
+        docstore = MmapDocstore(self._snapshot_dir, ordered_ids)
+        # Documents deleted or replaced while the snapshot was written
+        stale_ids = [
+            doc_id for row, doc_id in enumerate(ordered_ids)
+            if doc_id is not None and self._position_by_id.get(doc_id) != row
+        ]
+        if stale_ids:
+            docstore.delete(stale_ids)
+        later = range(view.count, len(self._float_vectors))
+        docstore.add({self.vectorstore.index_to_docstore_id[position]: self._documents.at(position)
+                      for position in later if position in self.vectorstore.index_to_docstore_id})
+        documents = PositionalDocuments.from_snapshot(docstore)
+        documents.append(self._documents.at(position) for position in later)
+        vectors = read_snapshot_vectors(self._snapshot_dir)
+        for _, rows in self._float_vectors.iter_rows(later.start, later.stop):
+            vectors.add(rows)
+        self.vectorstore.docstore = docstore
+        self._documents = documents
+        self._float_vectors = vectors
+        self._publish_view()
+
+    def compact(self) -> bool:
+        """
+        Writes a full snapshot and truncates the write-ahead log up to what the snapshot holds.
+        Returns False without writing anything if there is nothing new to persist.
+        With partitioning, expired shards are dropped and every shard with pending changes is compacted.
+        Read-only processes never compact.
+        """
+        if not self.is_writer:
+            return False
+        if self.partition_by:
+            self.drop_expired_shards()
+            with self._write_lock:
+                shards = list(self._shards.values())
+            compacted = False
+            for shard in shards:
+                start = time.perf_counter()
+                if shard.compact():
+                    self.latency.record("save", (time.perf_counter() - start) * 1000)
+                    compacted = True
+            return compacted
+        with self._compaction_lock:
+            pending_records = self.write_ahead_log.record_count
+            if pending_records == 0:
+                return False
+            start = time.perf_counter()
+            self._save_snapshot()
+            self.latency.record("save", (time.perf_counter() - start) * 1000)
+        print(f"RetrieverAgent: Compacted {pending_records} write-ahead log records into a snapshot in {time.perf_counter() - start:.2f}s.")
+        return True
+
+    def _compaction_loop(self):
+        """
+        Background thread: compacts every compaction_interval_seconds, or sooner when the log grows large.
+        In read-only processes it instead picks up the writer's changes every refresh_interval_seconds.
+        """
+        while not self._stop_compaction.is_set():
+            self._compaction_requested.wait(self.compaction_interval_seconds if self.is_writer else self.refresh_interval_seconds)
+            self._compaction_requested.clear()
+            if self._stop_compaction.is_set():
+                break
+            try:
+                self.compact() if self.is_writer else self.refresh()
+            except Exception as e:
+                # Keep the thread alive; the log still holds every change, so nothing is lost
+                print(f"RetrieverAgent: Error during background compaction: {type(e).__name__} - {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Reports what the store holds and how fast it is, for sizing containers and finding slow stages:
+        document counts by metadata "type" and "symbol", vector memory, bytes on disk, the index
+        generation and last commit time, cache counters, and p50/p95/p99 timings of the last calls
+        of each stage ("embed" for document batches, "embed_query", "search" and "save").
+        """
+        if self.partition_by:
+            shards = dict(self._shards)
+            shard_stats = {key: shard._store_stats() for key, shard in sorted(shards.items())}
+            store = {
+                "documents": sum(stats["documents"] for stats in shard_stats.values()),
+                "counts_by_type": self._sum_counts(stats["counts_by_type"] for stats in shard_stats.values()),
+                "counts_by_symbol": self._sum_counts(stats["counts_by_symbol"] for stats in shard_stats.values()),
+                "vectors": sum(stats["vectors"] for stats in shard_stats.values()),
+                "vector_bytes": sum(stats["vector_bytes"] for stats in shard_stats.values()),
+                "vector_bytes_in_memory": sum(stats["vector_bytes_in_memory"] for stats in shard_stats.values()),
+                "generation": {key: stats["generation"] for key, stats in shard_stats.items()},
+                "last_commit_at": max((stats["last_commit_at"] for stats in shard_stats.values() if stats["last_commit_at"]), default=None),
+                "shards": shard_stats,
+            }
+        else:
+            store = self._store_stats()
+        caches = {"embedding": self.embedding_cache, "query_embedding": self.query_cache, "result": self.result_cache}
+        return {
+            "vector_store_path": self.vector_store_path,
+            "index_type": self.index_type,
+            "search_engine": self.search_engine,
+            "partition_by": self.partition_by,
+            "writer": self.is_writer,
+            "dimension": self.embedding_dimension,
+            **store,
+            "disk_bytes": self._directory_bytes(self.vector_store_path),
+            "caches": {name: cache.stats() if cache is not None else None for name, cache in caches.items()},
+            "latency": self.latency.summary(),
+        }
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate memory the store needs for its vectors: the float32 vectors by position (which the
+        FAISS index holds a copy of) plus the NumPy search matrix; summed over shards when partitioned.
+        """
+        if self.partition_by:
+            return sum(shard.memory_bytes() for shard in dict(self._shards).values())
+        view = self._view
+        matrix_bytes = view.matrix[:view.count].nbytes if view.matrix is not None else 0
+        return view.count * view.vectors.dimension * 4 + matrix_bytes
+
+    def _store_stats(self) -> Dict[str, Any]:
+        """Counts and sizes of this (unpartitioned) store, read from the current view."""
+        self._ensure_metadata_index()
+        view = self._view
+        matrix_bytes = view.matrix[:view.count].nbytes if view.matrix is not None else 0
+        return {
+            "documents": view.live_count,
+            "counts_by_type": self.metadata_index.value_counts("type"),
+            "counts_by_symbol": self.metadata_index.value_counts("symbol"),
+            # Positions include tombstoned vectors and those not yet merged into the index until the next compaction
+            "vectors": view.count,
+            "tombstones": len(view.tombstones),
+            "unindexed_vectors": view.count - view.indexed_count,
+            # Float32 vectors as stored; the part on the heap excludes rows mapped from the snapshot file
+            "vector_bytes": view.count * view.vectors.dimension * 4,
+            "vector_bytes_in_memory": view.vectors.nbytes_in_memory + matrix_bytes,
+            "generation": view.generation,
+            "last_commit_at": (
+                datetime.datetime.fromtimestamp(self._last_commit_time, datetime.timezone.utc).isoformat()
+                if self._last_commit_time is not None else None
+            ),
+        }
+
+    @staticmethod
+    def _sum_counts(counts: Iterable[Dict[str, int]]) -> Dict[str, int]:
+        total: Dict[str, int] = {}
+        for per_value in counts:
+            for value, count in per_value.items():
+                total[value] = total.get(value, 0) + count
+        return total
+
+    @staticmethod
+    def _directory_bytes(path: str) -> int:
+        """Total size of the files under `path`: snapshots, the write-ahead log and shards."""
+        total = 0
+        for directory, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(directory, filename))
+                except OSError:
+                    pass # Removed by a concurrent compaction
+        return total
+
+    def close(self):
+        """
+        Finishes queued ingest jobs, stops the background compaction thread, writes a final snapshot,
+        closes the embedding cache and releases the writer lock.
+        """
+        self.ingest_jobs.shutdown(wait=True)
+        self._stop_compaction.set()
+        self._compaction_requested.set()
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+        self.compact()
+        if self.partition_by:
+            self._shard_executor.shutdown(wait=True)
+            for shard in self._shards.values():
+                shard.close()
+        if self.embedding_cache is not None:
+            # Collections are closed and reopened as they are evicted; each open holds its own connection
+            self.embedding_cache.close()
+        self._writer_lock.release()
+
+    def _shard_path(self, key: str) -> str:
+        return os.path.join(self.vector_store_path, SHARDS_DIRNAME, key)
+
+    def _open_shards(self):
+        """Opens every shard stored under the shards directory and maps document IDs to shards."""
+        for key in self._stored_shard_keys():
+            shard = self._shard(key)
+            self._shard_by_id.update(dict.fromkeys(shard._position_by_id, key))
+        print(f"RetrieverAgent: Opened {len(self._shards)} '{self.partition_by}' shards with {len(self._shard_by_id)} documents.")
+
+    def _stored_shard_keys(self) -> List[str]:
+        shards_dir = os.path.join(self.vector_store_path, SHARDS_DIRNAME)
+        keys = sorted(os.listdir(shards_dir)) if os.path.isdir(shards_dir) else []
+        return [key for key in keys if is_partition_key(key, self.partition_by)]
+
+    def _shard(self, key: str) -> "RetrieverAgent":
+        """Returns the shard for partition `key`, creating it on first use. Callers must hold self._write_lock."""
+        shard = self._shards.get(key)
+        if shard is None:
+            shard = RetrieverAgent(vector_store_path=self._shard_path(key), **self._shard_options)
+            self._shards[key] = shard
+        return shard
+
+    def _index_into_shards(self, doc_ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]],
+                           vectors: List[List[float]]) -> Tuple[int, int]:
+        """
+        Routes embedded documents to the shards of their metadata "date" and indexes them there.
+        A document whose date moved it to another shard is removed from the old one; documents
+        already past retention are skipped. Returns (indexed count, replaced count).
+        """
+        today = datetime.date.today()
+        rows_by_shard: Dict[str, List[int]] = {}
+        for row, doc_metadata in enumerate(metadatas):
+            key = partition_key(doc_metadata.get("date"), self.partition_by)
+            if is_expired(key, self.partition_by, self.retention_days, today):
+                continue
+            rows_by_shard.setdefault(key, []).append(row)
+        skipped_count = len(doc_ids) - sum(len(rows) for rows in rows_by_shard.values())
+        if skipped_count:
+            print(f"RetrieverAgent: Skipped {skipped_count} documents dated outside the {self.retention_days}-day retention window.")
+
+        with self._write_lock:
+            moved_ids: Dict[str, List[str]] = {}
+            for key, rows in rows_by_shard.items():
+                for row in rows:
+                    old_key = self._shard_by_id.get(doc_ids[row])
+                    if old_key is not None and old_key != key and old_key in self._shards:
+                        moved_ids.setdefault(old_key, []).append(doc_ids[row])
+            replaced_count = sum(self._shards[key].delete_documents(ids) for key, ids in moved_ids.items())
+            for key, rows in rows_by_shard.items():
+                shard = self._shard(key)
+                shard_ids = [doc_ids[row] for row in rows]
+                replaced_count += shard._index_vectors(
+                    shard_ids, [texts[row] for row in rows], [metadatas[row] for row in rows], [vectors[row] for row in rows],
+                )
+                self._shard_by_id.update(dict.fromkeys(shard_ids, key))
+                if shard.write_ahead_log.record_count >= self.compaction_max_records:
+                    self._compaction_requested.set()
+        return len(doc_ids) - skipped_count, replaced_count
+
+    def drop_expired_shards(self, today: Optional[datetime.date] = None) -> List[str]:
+        """
+        Deletes shards whose last day is older than retention_days. A shard is dropped by removing
+        its directory, without rebuilding or even touching any other shard. Returns the dropped keys.
+        """
+        if not self.partition_by or self.retention_days is None or not self.is_writer:
+            return []
+        today = today or datetime.date.today()
+        with self._write_lock:
+            expired = [key for key in self._shards if is_expired(key, self.partition_by, self.retention_days, today)]
+            for key in expired:
+                shard = self._shards.pop(key)
+                for doc_id in shard._position_by_id:
+                    if self._shard_by_id.get(doc_id) == key:
+                        del self._shard_by_id[doc_id]
+                shutil.rmtree(shard.vector_store_path, ignore_errors=True)
+        if expired:
+            print(f"RetrieverAgent: Dropped {len(expired)} shards past the {self.retention_days}-day retention: {', '.join(sorted(expired))}.")
+        return expired
+
+    def _rebuild_shards(self, index_type: str, quantization: str) -> Dict[str, Any]:
+        """Rebuilds every non-empty shard as `index_type` / `quantization`."""
+        start = time.perf_counter()
+        with self._write_lock:
+            shards = [shard for shard in self._shards.values() if shard._position_by_id]
+            results = [shard.rebuild_index(index_type, quantization) for shard in shards]
+            self.index_type = index_type
+            self.quantization = quantization
+            self._shard_options.update(index_type=index_type, quantization=quantization)
+        build_seconds = time.perf_counter() - start
+        num_vectors = sum(result["num_vectors"] for result in results)
+        print(f"RetrieverAgent: Rebuilt {len(results)} '{index_type}' ({quantization}) shards over {num_vectors} vectors in {build_seconds:.2f}s.")
+        return {"index_type": index_type, "quantization": quantization, "num_vectors": num_vectors,
+                "num_shards": len(results), "build_seconds": round(build_seconds, 3)}
+
+    def _fan_out_shards(self, search_shard, num_queries: int, k: int, date_from: Optional[datetime.date],
+                        date_to: Optional[datetime.date], higher_is_better: bool) -> List[List[Tuple[Document, float]]]:
+        """
+        Runs `search_shard(shard, date_from, date_to)` on the shards a date window needs, in parallel,
+        and merges the per-query hit lists by score. Shards entirely inside the window are searched
+        without a date filter.
+        """
+        # A copy of the shard map, so shards created or dropped meanwhile do not disturb this search
+        shards = dict(self._shards)
+        selected = [
+            (shards[key], fully_covered)
+            for key, fully_covered in select_partitions(sorted(shards), self.partition_by, date_from, date_to)
+        ]
+        if not selected:
+            return [[] for _ in range(num_queries)]
+
+        def run(shard_and_coverage):
+            shard, fully_covered = shard_and_coverage
+            return search_shard(shard, None, None) if fully_covered else search_shard(shard, date_from, date_to)
+
+        per_shard = list(self._shard_executor.map(run, selected))
+        merged = []
+        for query_row in range(num_queries):
+            hits = [hit for shard_results in per_shard for hit in shard_results[query_row]]
+            hits.sort(key=lambda hit: hit[1], reverse=higher_is_better)
+            merged.append(hits[:k])
+        return merged
+
+    def _date_window_filter(self, filters: Optional[Dict[str, Any]], date_from: Optional[datetime.date],
+                            date_to: Optional[datetime.date]) -> Optional[Dict[str, Any]]:
+        """
+        Folds a date window into `filters` as the list of stored metadata "date" values inside it,
+        intersected with any "date" filter already given.
+        """
+        if date_from is None and date_to is None:
+            return filters
+        self._ensure_metadata_index()
+        in_window = []
+        for value in self.metadata_index.values("date"):
+            date = parse_date(value)
+            if date is not None and (date_from is None or date >= date_from) and (date_to is None or date <= date_to):
+                in_window.append(value)
+        filters = dict(filters or {})
+        if "date" in filters:
+            requested = filters["date"] if isinstance(filters["date"], (list, tuple, set)) else [filters["date"]]
+            requested = {str(value) for value in requested}
+            in_window = [value for value in in_window if value in requested]
+        filters["date"] = in_window
+        return filters
+
+    def _rebuild_metadata_index(self):
+        """
+        Rebuilds the inverted metadata index from the documents currently in the vector store.
         """
-        if not self.vectorstore:
+        docstore = self.vectorstore.docstore
+        self.metadata_index.rebuild(
+            (doc_id, docstore.search(doc_id).metadata) for doc_id in self.vectorstore.index_to_docstore_id.values()
+        )
+        self._metadata_index_ready = True
+
+    def _apply_index_config(self):
+        """
+        Brings the loaded index in line with the configured index type and search tunables.
+        A stored index of a different type is rebuilt and the result saved as the new snapshot.
+        Read-only processes never write snapshots: they keep serving the stored index as it is.
+        """
+        index = self.vectorstore.index
+        if not self._index_is_mapped:
+            enable_reconstruction(index)
+        loaded_type = index_type_of(index)
+        loaded_quantization = quantization_of(index)
+        # An empty store has nothing to build from yet; the configured index is built when its first vectors are merged
+        is_empty = index.ntotal == 0 and len(self._float_vectors) == 0
+        if (loaded_type, loaded_quantization) != (self.index_type, self.quantization) and not is_empty and not self.is_writer:
+            print(f"RetrieverAgent: Stored index is '{loaded_type}' ({loaded_quantization}) but '{self.index_type}' ({self.quantization}) is configured. "
+                  "Serving the stored index read-only; the writer process decides how the store is indexed.")
+            self.index_type, self.quantization = loaded_type, loaded_quantization
+        elif (loaded_type, loaded_quantization) != (self.index_type, self.quantization) and not is_empty:
+            print(f"RetrieverAgent: Stored index is '{loaded_type}' ({loaded_quantization}) but '{self.index_type}' ({self.quantization}) is configured. Rebuilding...")
+            try:
+                with self._write_lock:
+                    self._rebuild_index_locked(self.index_type, self.quantization)
+                # The write-ahead log is replayed on top of this snapshot afterwards, so it is kept
+                self._save_snapshot(truncate_log=False)
+                return
+            except ValueError as e:
+                # E.g. too few vectors to train PQ yet; keep serving the stored index until /rebuild_index
+                print(f"RetrieverAgent: Could not rebuild the index as configured: {e} Keeping the stored index.")
+        self._apply_search_tunables()
+
+    def _apply_search_tunables(self):
+        """Sets the configured default IVF nprobe / HNSW efSearch on the current index."""
+        index = self.vectorstore.index
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = min(self.ivf_nprobe, ivf.nlist)
+        elif isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = self.hnsw_ef_search
+
+    def _replace_index(self, new_index, live_positions: np.ndarray):
+        """
+        Swaps in `new_index`, whose position i holds the vector previously at live_positions[i],
+        and renumbers the position mappings to match. Clears all tombstones.
+        Callers must hold self._write_lock.
+        """
+        old_mapping = self.vectorstore.index_to_docstore_id
+        self.vectorstore.index = new_index
+        self._index_is_mapped = False
+        self._float_vectors = FloatVectorStore(new_index.d, self._float_vectors.get(live_positions))
+        self._normalized_matrix = None # Positions changed; refilled from the renumbered float vectors
+        self._documents = PositionalDocuments.renumbered(self._documents, live_positions)
+        self.vectorstore.index_to_docstore_id = {
+            new_position: old_mapping[int(old_position)] for new_position, old_position in enumerate(live_positions)
+        }
+        self._position_by_id = {doc_id: position for position, doc_id in self.vectorstore.index_to_docstore_id.items()}
+        self._tombstones = set()
+        self._publish_view()
+
+    def _live_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (positions, vectors) of every non-tombstoned vector, in position order."""
+        live_positions = np.asarray(sorted(self.vectorstore.index_to_docstore_id), dtype=np.int64)
+        return live_positions, self._float_vectors.get(live_positions)
+
+    def _purge_tombstones(self):
+        """
+        Physically drops tombstoned vectors by re-adding the live ones into an empty copy of the index,
+        which keeps IVF training. Callers must hold self._write_lock.
+        """
+        if not self._tombstones:
+            return
+        self._ensure_writable_index()
+        live_positions, vectors = self._live_vectors()
+        new_index = empty_like(self.vectorstore.index)
+        if len(vectors):
+            new_index.add(vectors)
+        self._replace_index(new_index, live_positions)
+
+    def _rebuild_index_locked(self, index_type: str, quantization: str):
+        """
+        Builds a fresh index of `index_type` and `quantization` from the live float vectors,
+        training it where needed. Callers must hold self._write_lock.
+        """
+        live_positions, vectors = self._live_vectors()
+        self._replace_index(self._build_index(index_type, quantization, vectors), live_positions)
+
+    def _build_index(self, index_type: str, quantization: str, vectors: np.ndarray):
+        """Builds an index of `index_type` and `quantization` with the configured parameters over `vectors`."""
+        if (index_type == "ivf" or quantization != "none") and len(vectors) == 0:
+            raise ValueError(f"RetrieverAgent: Cannot train a '{index_type}' ({quantization}) index without any indexed vectors.")
+        return build_index(
+            index_type, vectors,
+            nlist=self.ivf_nlist, nprobe=self.ivf_nprobe,
+            hnsw_m=self.hnsw_m, ef_construction=self.hnsw_ef_construction, ef_search=self.hnsw_ef_search,
+            quantization=quantization, pq_m=self.pq_m,
+        )
+
+    def rebuild_index(self, index_type: Optional[str] = None, quantization: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Rebuilds (and for IVF or quantized indexes, retrains) the index from all live vectors,
+        optionally switching to another index type or quantization, then writes a snapshot.
+        IVF centroids and PQ codebooks are only as good as the data they were trained on,
+        so this should be run again after large ingests.
+        """
+        target_type = validate_index_type(index_type or self.index_type)
+        target_quantization = validate_quantization(quantization or self.quantization)
+        self._require_writer()
+        if self.partition_by:
+            return self._rebuild_shards(target_type, target_quantization)
+        with self._compaction_lock:
+            start = time.perf_counter()
+            with self._write_lock:
+                self._rebuild_index_locked(target_type, target_quantization)
+                self.index_type = target_type
+                self.quantization = target_quantization
+                num_vectors = self.vectorstore.index.ntotal
+            self._save_snapshot()
+        build_seconds = time.perf_counter() - start
+        print(f"RetrieverAgent: Rebuilt '{target_type}' ({target_quantization}) index over {num_vectors} vectors in {build_seconds:.2f}s.")
+        return {"index_type": target_type, "quantization": target_quantization, "num_vectors": num_vectors,
+                "build_seconds": round(build_seconds, 3)}
+
+    def _positions_for_ids(self, doc_ids) -> np.ndarray:
+        """
+        Maps document IDs to their current FAISS positions, in ascending position order.
+        """
+        return self._view.positions_for_ids(doc_ids)
+
+    def _search_by_vectors(self, query_vectors: List[List[float]], k: int,
+                           filters: Optional[Dict[str, Any]] = None, nprobe: Optional[int] = None,
+                           ef_search: Optional[int] = None, date_from: Optional[datetime.date] = None,
+                           date_to: Optional[datetime.date] = None, with_vectors: bool = False) -> List[List[Tuple]]:
+        """
+        Returns, for each query vector, up to k (document, L2 distance) pairs closest to it,
+        or (document, L2 distance, float vector) triples with `with_vectors`.
+        All queries are answered by a single matrix search. `nprobe` / `ef_search` override
+        the configured IVF / HNSW search breadth for this call.
+        With `filters`, the inverted metadata index is resolved first and only matching
+        documents are scored: small candidate sets are scored directly from their stored
+        vectors, larger ones through a FAISS search restricted by an ID selector.
+        `date_from` / `date_to` (inclusive) restrict results by metadata "date"; with partitioning
+        they also decide which shards are searched at all.
+        The search reads the latest published IndexView and takes no lock, so it runs in parallel
+        with other searches and with writes.
+        """
+        with self.latency.time("search"):
+            if self.partition_by:
+                return self._fan_out_shards(
+                    lambda shard, window_from, window_to: shard._search_by_vectors(
+                        query_vectors, k, filters, nprobe, ef_search, window_from, window_to, with_vectors),
+                    len(query_vectors), k, date_from, date_to, higher_is_better=False,
+                )
+            return self._search_view(self._view, query_vectors, k, filters, nprobe, ef_search, date_from, date_to, with_vectors)
+
+    def _search_view(self, view: IndexView, query_vectors: List[List[float]], k: int, filters: Optional[Dict[str, Any]],
+                     nprobe: Optional[int], ef_search: Optional[int], date_from: Optional[datetime.date],
+                     date_to: Optional[datetime.date], with_vectors: bool = False) -> List[List[Tuple]]:
+        """
+        Search of one published view behind _search_by_vectors. Positions in the FAISS index are
+        searched through it, positions written since are scanned exactly, and both are merged.
+        With the "numpy" engine, the view's normalized matrix is searched instead.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        filters = self._date_window_filter(filters, date_from, date_to)
+        if filters:
+            self._ensure_metadata_index()
+            positions = view.positions_for_ids(self.metadata_index.candidates(filters))
+            if len(positions) == 0:
+                return [[] for _ in range(len(queries))]
+            if view.matrix is not None:
+                distances, indices = view.search_matrix(queries, k, positions)
+            elif len(positions) <= FILTER_BRUTE_FORCE_MAX_CANDIDATES:
+                distances, indices = view.score_positions(queries, positions, k)
+            else:
+                indexed = positions[positions < view.indexed_count]
+                distances, indices = merge_nearest(
+                    self._search_index(view, queries, k, nprobe, ef_search, indexed),
+                    view.score_positions(queries, positions[positions >= view.indexed_count], k), k,
+                )
+        elif view.matrix is not None:
+            distances, indices = view.search_matrix(queries, k)
+        else:
+            distances, indices = merge_nearest(
+                self._search_index(view, queries, k, nprobe, ef_search),
+                view.scan_unindexed(queries, k), k,
+            )
+        return view.results(distances, indices, with_vectors)
+
+    def _ensure_lexical_index(self):
+        """Builds the BM25 index from the stored document texts on first use."""
+        if not self._lexical_index_ready:
+            with self._write_lock:
+                if not self._lexical_index_ready:
+                    docstore = self.vectorstore.docstore
+                    self.lexical_index.rebuild(
+                        (doc_id, docstore.search(doc_id).page_content) for doc_id in self.vectorstore.index_to_docstore_id.values()
+                    )
+                    self._lexical_index_ready = True
+
+    def _lexical_search(self, queries: List[str], k: int, filters: Optional[Dict[str, Any]] = None,
+                        date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                        with_vectors: bool = False) -> List[List[Tuple]]:
+        """
+        Returns, for each query, up to k (document, normalized BM25 score) pairs, best first, or
+        (document, score, float vector) triples with `with_vectors`.
+        Filters and date windows restrict the scored documents exactly as in _search_by_vectors.
+        """
+        if self.partition_by:
+            return self._fan_out_shards(
+                lambda shard, window_from, window_to: shard._lexical_search(queries, k, filters, window_from, window_to, with_vectors),
+                len(queries), k, date_from, date_to, higher_is_better=True,
+            )
+        self._ensure_lexical_index()
+        view = self._view
+        filters = self._date_window_filter(filters, date_from, date_to)
+        allowed = None
+        if filters:
+            self._ensure_metadata_index()
+            allowed = self.metadata_index.candidates(filters)
+        # The BM25 index is the writer's; hits on documents written after the view are dropped, so ask for as many more
+        fetch_k = k + max(0, len(self._documents) - view.count)
+        results = []
+        for query in queries:
+            positions_and_scores = [(view.position_of(doc_id), score) for doc_id, score in self.lexical_index.search(query, fetch_k, allowed)]
+            hits = [(view.documents.at(position), score) for position, score in positions_and_scores if position is not None][:k]
+            if with_vectors and hits:
+                positions = np.asarray([position for position, _ in positions_and_scores if position is not None][:k], dtype=np.int64)
+                hits = [hit + (vector,) for hit, vector in zip(hits, view.vectors.get(positions))]
+            results.append(hits)
+        return results
+
+    @staticmethod
+    def _validate_retrieval_mode(mode: str) -> str:
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}'. Expected one of {', '.join(RETRIEVAL_MODES)}.")
+        return mode
+
+    def _rerank_enabled(self, rerank: Optional[bool]) -> bool:
+        return self.rerank if rerank is None else rerank
+
+    @staticmethod
+    def _validate_mmr_lambda(mmr_lambda: Optional[float]) -> None:
+        if mmr_lambda is not None and not 0.0 <= mmr_lambda <= 1.0:
+            raise ValueError(f"mmr_lambda must be between 0 and 1, got {mmr_lambda}.")
+
+    @staticmethod
+    def _document_key(doc: Document) -> str:
+        """Identifies a document across result lists of different engines and shards."""
+        return doc.page_content + "\x00" + json.dumps(doc.metadata, sort_keys=True, default=str)
+
+    def _is_lexically_confident(self, hits: List[Tuple[Document, float]], k: int) -> bool:
+        """
+        Whether BM25 alone is trusted for a query answered with its top k hits: a strong best hit that
+        clearly beats the best hit left out. Comparing with the runner-up instead would reject most
+        structured queries, whose answer shares nearly all terms with a few neighbours (the close and
+        the news item of one company on one day) that the top k returns along with it.
+        """
+        if not hits or hits[0][1] < self.lexical_confidence:
+            return False
+        if len(hits) == 1:
+            return True
+        # When every hit fits in k there is none left out; the weakest one tells a flat score list apart
+        return hits[0][1] >= self.lexical_margin * hits[min(k, len(hits) - 1)][1]
+
+    def _retrieve(self, queries: List[str], k: int, filters: Optional[Dict[str, Any]], date_from: Optional[datetime.date],
+                  date_to: Optional[datetime.date], mode: str, mmr_lambda: Optional[float] = None,
+                  rerank: bool = False, min_score: Optional[float] = None) -> List[List[Tuple[Document, float]]]:
+        """
+        Answers queries in the given retrieval mode and returns up to k (document, score) pairs per
+        query, best first. Only queries that need dense retrieval are embedded.
+
+        The score is the cosine similarity for dense results, the normalized BM25 score (about 1.0
+        when every query term matches once) for lexical results and, for hybrid results, the reciprocal rank
+        fusion score scaled to 1.0 for a document ranked first by both engines. In every mode a
+        higher score is a better match and 1.0 is a strong one.
+
+        With `mmr_lambda`, k * mmr_fetch_factor candidates are retrieved together with their stored
+        vectors and k of them are picked by maximal marginal relevance (see _diversify), so the
+        results are in pick order rather than by score. Candidates scoring below `min_score` are
+        dropped before picking, since a score cutoff on pick order would stop at the first weak pick
+        and lose the stronger ones after it.
+
+        With `rerank`, at least k * rerank_fetch_factor candidates are retrieved and re-scored by the
+        re-ranker before the top k (or the MMR picks) are taken; scores are then the re-ranker's.
+
+        Queries that get embedded are first looked up in the semantic result cache: a query close
+        enough to an earlier one with the same options, on the same index generation, gets the
+        earlier results without a search, re-ranking or MMR.
+        """
+        diversify = mmr_lambda is not None
+        candidate_k = k * self.mmr_fetch_factor if diversify else k
+        if rerank:
+            candidate_k = max(candidate_k, k * self.rerank_fetch_factor)
+        results: List[Optional[List[Tuple]]] = [None] * len(queries)
+        lexical_hits: List[List[Tuple]] = [[] for _ in queries]
+        if mode != "dense":
+            lexical_hits = self._lexical_search(queries, candidate_k * self.hybrid_fanout, filters, date_from, date_to,
+                                                with_vectors=diversify)
+            for row, hits in enumerate(lexical_hits):
+                if mode == "lexical" or (mode == "auto" and self._is_lexically_confident(hits, candidate_k)):
+                    results[row] = hits[:candidate_k]
+            answered = sum(result is not None for result in results)
+            if mode == "auto" and answered:
+                print(f"RetrieverAgent: Answered {answered} of {len(queries)} queries lexically without an embedding call.")
+
+        pending = [row for row, result in enumerate(results) if result is None]
+        cached: Dict[int, List[Tuple[Document, float]]] = {}
+        query_vectors: List[List[float]] = []
+        if pending:
+            query_vectors = self._embed_queries([queries[row] for row in pending])
+            if self.result_cache is not None:
+                # The generation is read before searching, so results stored below can only be older than their key
+                cache_options = (k, json.dumps(filters, sort_keys=True, default=str), date_from, date_to, mode, mmr_lambda, rerank,
+                                 min_score if diversify else None)
+                generation = self._result_generation()
+                for row, vector in zip(pending, query_vectors):
+                    hits = self.result_cache.get(vector, cache_options + (query_key_terms(queries[row]),), generation)
+                    if hits is not None:
+                        cached[row] = hits
+                if cached:
+                    print(f"RetrieverAgent: Served {len(cached)} of {len(queries)} queries from the semantic result cache.")
+                    query_vectors = [vector for row, vector in zip(pending, query_vectors) if row not in cached]
+                    pending = [row for row in pending if row not in cached]
+        if pending:
+            dense_k = candidate_k if mode == "dense" else candidate_k * self.hybrid_fanout
+            dense_hits = self._search_by_vectors(query_vectors, dense_k, filters, date_from=date_from, date_to=date_to,
+                                                 with_vectors=diversify)
+            # Hits are (document, distance or score) pairs, with the document's vector appended when diversifying
+            for row, hits in zip(pending, dense_hits):
+                if mode == "dense":
+                    results[row] = [(hit[0], similarity_from_distance(hit[1])) + hit[2:] for hit in hits]
+                    continue
+                hits_by_key = {self._document_key(hit[0]): hit for hit in hits + lexical_hits[row]}
+                fused = reciprocal_rank_fusion([
+                    [self._document_key(hit[0]) for hit in hits],
+                    [self._document_key(hit[0]) for hit in lexical_hits[row]],
+                ], candidate_k)
+                results[row] = [(hits_by_key[key][0], score * (RRF_K + 1) / 2.0) + hits_by_key[key][2:] for key, score in fused]
+
+        rows = [row for row in range(len(queries)) if row not in cached]
+        computed = [results[row] for row in rows]
+        if rerank and computed:
+            start = time.perf_counter()
+            budget_seconds = None if self.rerank_budget_ms is None else self.rerank_budget_ms / 1000.0
+            computed = rerank_hits(self.reranker, [queries[row] for row in rows], computed, self.rerank_batch_size, budget_seconds)
+            print(f"RetrieverAgent: Re-ranked {sum(len(hits) for hits in computed)} candidates in {(time.perf_counter() - start) * 1000:.1f}ms.")
+        for row, hits in zip(rows, computed):
+            if diversify:
+                results[row] = self._diversify([hit for hit in hits if min_score is None or hit[1] >= min_score], k, mmr_lambda)
+            else:
+                # Candidates the re-ranker had no time for follow the re-scored ones with their retrieval
+                # score; sorting keeps every list best first by its final score, as cut_off expects
+                results[row] = sorted(hits, key=lambda hit: hit[1], reverse=True)[:k]
+        if self.result_cache is not None:
+            for row, vector in zip(pending, query_vectors):
+                self.result_cache.put(vector, cache_options + (query_key_terms(queries[row]),), generation, results[row])
+        for row, hits in cached.items():
+            results[row] = hits
+        return results
+
+    def _result_generation(self):
+        """Identifies the searchable index state: the view generation, or every shard's when partitioned."""
+        if self.partition_by:
+            return tuple(sorted((key, shard._view.generation) for key, shard in dict(self._shards).items()))
+        return self._view.generation
+
+    @staticmethod
+    def _diversify(hits: List[Tuple[Document, float, np.ndarray]], k: int, mmr_lambda: float) -> List[Tuple[Document, float]]:
+        """
+        Picks k of the (document, score, vector) candidates by maximal marginal relevance, trading
+        each candidate's score against its cosine similarity to the ones already picked, so
+        near-duplicate chunks do not fill the results. Works on the candidates' stored vectors;
+        nothing is re-embedded.
+        """
+        if len(hits) <= 1:
+            return [hit[:2] for hit in hits]
+        picked = maximal_marginal_relevance(
+            np.fromiter((hit[1] for hit in hits), dtype=np.float32, count=len(hits)),
+            np.stack([hit[2] for hit in hits]), k, mmr_lambda,
+        )
+        return [hits[i][:2] for i in picked]
+
+    def _search_index(self, view: IndexView, queries: np.ndarray, k: int, nprobe: Optional[int], ef_search: Optional[int],
+                      allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Runs a FAISS search on the view's index, restricted to the sorted `allowed` positions if given
+        and skipping tombstoned positions otherwise. A quantized index only yields approximate distances,
+        so it is asked for k * rerank_factor candidates, which are re-ranked by exact distance to their
+        float vectors.
+
+        A flat PQ index (IndexPQ) takes no search parameters, so no selector: it is searched unrestricted
+        for enough extra candidates to cover the excluded ones, and those are dropped before re-ranking.
+        """
+        index = view.index
+        if not supports_selector(index):
+            fetch_k = k * self.rerank_factor
+            if allowed is not None:
+                # Twice the candidates expected to contain k * rerank_factor allowed ones if they are spread evenly
+                fetch_k = int(np.ceil(2 * fetch_k * view.indexed_count / max(1, len(allowed))))
+            else:
+                fetch_k += len(view.tombstones)
+            _, candidates = index.search(queries, max(1, min(fetch_k, index.ntotal)))
+            if allowed is not None:
+                keep = np.isin(candidates, allowed)
+            else:
+                keep = ~np.isin(candidates, view.tombstone_positions()) if view.tombstones else candidates >= 0
+            return rerank_exact(queries, np.where(keep, candidates, -1), view.vectors, k)
+        selector = faiss.IDSelectorBatch(allowed) if allowed is not None else view.exclusion_selector()
+        params = make_search_params(index, selector, nprobe=nprobe, ef_search=ef_search)
+        if quantization_of(index) == "none":
+            return index.search(queries, k, params=params)
+        _, candidates = index.search(queries, k * self.rerank_factor, params=params)
+        return rerank_exact(queries, candidates, view.vectors, k)
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embeds queries, serving repeats from the query embedding cache. The remaining queries
+        are embedded with one call, using the retrieval-query task type when the model supports it.
+        """
+        if self.query_cache is None:
+            vectors: List[Optional[List[float]]] = [None] * len(queries)
+        else:
+            vectors = [self.query_cache.get(query) for query in queries]
+        missing_queries = list(dict.fromkeys(query for query, vector in zip(queries, vectors) if vector is None))
+        if missing_queries:
+            with self.latency.time("embed_query"):
+                if len(missing_queries) == 1:
+                    new_vectors = [self.embeddings.embed_query(missing_queries[0])]
+                else:
+                    new_vectors = self.embeddings.embed_documents(missing_queries, **self._batch_query_embed_kwargs)
+            vector_by_query = dict(zip(missing_queries, new_vectors))
+            if self.query_cache is not None:
+                for query, vector in vector_by_query.items():
+                    self.query_cache.put(query, vector)
+            vectors = [vector if vector is not None else vector_by_query[query] for query, vector in zip(queries, vectors)]
+        return vectors
+
+    def _scored_chunks(self, hits: List[Tuple[Document, float]], include_parent: bool = False) -> List[Dict[str, Any]]:
+        chunks = [{"text": doc.page_content, "score": score, "metadata": doc.metadata} for doc, score in hits]
+        if include_parent:
+            for chunk, (doc, _) in zip(chunks, hits):
+                chunk["parent_context"] = self._parent_context(doc)
+        return chunks
+
+    def retrieve_scored_chunks(self, query: str, k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                               date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                               mode: Optional[str] = None, min_score: Optional[float] = None,
+                               max_chars: Optional[int] = None, max_tokens: Optional[int] = None,
+                               mmr_lambda: Optional[float] = None, rerank: Optional[bool] = None,
+                               include_parent: bool = False) -> List[Dict[str, Any]]:
+        """
+        Retrieves up to k chunks for a query, best first, each as a dict with its `text`,
+        similarity `score` (see _retrieve; higher is better) and stored `metadata`.
+
+        Args:
+            query (str): The query text.
+            k (int): Maximum number of chunks to return.
+            filters (Optional[Dict[str, Any]]): Metadata filters, e.g. {"type": "earnings_surprise", "symbol": "TSM"};
+                                                a list of values for one key matches any of them.
+            date_from / date_to (Optional[datetime.date]): Only documents dated inside this (inclusive) window.
+            mode (Optional[str]): One of RETRIEVAL_MODES; defaults to the configured retrieval mode.
+            min_score (Optional[float]): Stop at the first chunk scoring below this; with mmr_lambda, leave
+                                         candidates below it out of the selection.
+            max_chars (Optional[int]): Stop before the chunk that would take the total text length past this.
+            max_tokens (Optional[int]): Like max_chars, counted in estimated tokens (about 4 characters each).
+            mmr_lambda (Optional[float]): Diversify the results: pick k of k * mmr_fetch_factor candidates by
+                                          maximal marginal relevance, from 1 (relevance only) down to 0
+                                          (diversity only). None returns the top k by score.
+            rerank (Optional[bool]): Re-score an over-fetched candidate pool with the re-ranker before
+                                     taking the top k; defaults to the configured `rerank`.
+            include_parent (bool): Add each chunk's `parent_context`: the surrounding stretch of the long
+                                   document it was cut from (see _parent_context), or None for whole documents.
+        """
+        if self.vectorstore is None and not self.partition_by:
             raise HTTPException(status_code=500, detail="RetrieverAgent: Vector store not initialized. Cannot perform retrieval.")
+        try:
+            mode = self._validate_retrieval_mode(mode or self.retrieval_mode)
+            self._validate_mmr_lambda(mmr_lambda)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        print(f"RetrieverAgent: Retrieving top {k} chunks for query: '{query}'...")
+        print(f"RetrieverAgent: Retrieving top {k} chunks for query: '{query}' with filters {filters}...")
         try:
-            # Use as_retriever and invoke for LangChain's recommended retrieval pattern
-            # search_kwargs={"k": k} sets the number of results to retrieve
-            retriever = self.vectorstore.as_retriever(search_kwargs={"k": k})
-            retrieved_docs = retriever.invoke(query)
-
-            # Extract just the page_content (the text) from the Document objects
-            chunks = [doc.page_content for doc in retrieved_docs]
-            print(f"RetrieverAgent: Successfully retrieved {len(chunks)} chunks for the query.")
-            return chunks
+            # Dense retrieval takes the query vector from the query embedding cache when this text was seen
+            # recently and searches the index directly; lexical and auto modes may skip the embedding entirely
+            hits = self._retrieve([query], k, filters, date_from, date_to, mode, mmr_lambda, self._rerank_enabled(rerank), min_score)[0]
+            hits = cut_off(hits, min_score, max_chars, max_tokens)
+            print(f"RetrieverAgent: Successfully retrieved {len(hits)} chunks for the query.")
+            return self._scored_chunks(hits, include_parent)
         except Exception as e:
             print(f"RetrieverAgent: Error during document retrieval: {e}")
             raise HTTPException(status_code=500, detail=f"An unexpected error occurred during retrieval: {e}")
 
+    def retrieve_top_k_chunks(self, query: str, k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                              date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                              mode: Optional[str] = None, min_score: Optional[float] = None,
+                              max_chars: Optional[int] = None, max_tokens: Optional[int] = None,
+                              mmr_lambda: Optional[float] = None, rerank: Optional[bool] = None) -> List[str]:
+        """
+        Retrieves the top-k most relevant text chunks from the vector store
+        for a given query. Takes the arguments of retrieve_scored_chunks and returns
+        only the chunk texts.
+        """
+        return [chunk["text"] for chunk in self.retrieve_scored_chunks(query, k, filters, date_from, date_to, mode,
+                                                                       min_score, max_chars, max_tokens, mmr_lambda, rerank)]
+
+    def retrieve_scored_chunks_batch(self, queries: List[str], k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                                     date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                                     mode: Optional[str] = None, min_score: Optional[float] = None,
+                                     max_chars: Optional[int] = None,
+                                     max_tokens: Optional[int] = None,
+                                     mmr_lambda: Optional[float] = None, rerank: Optional[bool] = None,
+                                     include_parent: bool = False) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieves scored chunks (see retrieve_scored_chunks) for each of several queries in one pass:
+        all queries are embedded with a single embedding call and searched with a single matrix search.
+        `min_score` and the budgets apply to each query's results separately.
+        Returns one list of chunks per query, in the order of `queries`.
+        """
+        if self.vectorstore is None and not self.partition_by:
+            raise HTTPException(status_code=500, detail="RetrieverAgent: Vector store not initialized. Cannot perform retrieval.")
+        if not queries:
+            return []
+        try:
+            mode = self._validate_retrieval_mode(mode or self.retrieval_mode)
+            self._validate_mmr_lambda(mmr_lambda)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        print(f"RetrieverAgent: Retrieving top {k} chunks for a batch of {len(queries)} queries with filters {filters}...")
+        try:
+            results = [cut_off(hits, min_score, max_chars, max_tokens)
+                       for hits in self._retrieve(queries, k, filters, date_from, date_to, mode, mmr_lambda,
+                                                  self._rerank_enabled(rerank), min_score)]
+            print(f"RetrieverAgent: Successfully retrieved {sum(len(hits) for hits in results)} chunks for {len(queries)} queries.")
+            return [self._scored_chunks(hits, include_parent) for hits in results]
+        except Exception as e:
+            print(f"RetrieverAgent: Error during batch document retrieval: {e}")
+            raise HTTPException(status_code=500, detail=f"An unexpected error occurred during batch retrieval: {e}")
+
+    def retrieve_top_k_chunks_batch(self, queries: List[str], k: int = 5, filters: Optional[Dict[str, Any]] = None,
+                                    date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None,
+                                    mode: Optional[str] = None, min_score: Optional[float] = None,
+                                    max_chars: Optional[int] = None, max_tokens: Optional[int] = None,
+                                    mmr_lambda: Optional[float] = None, rerank: Optional[bool] = None) -> List[List[str]]:
+        """
+        Retrieves the top-k chunks for each of several queries in one pass, like
+        retrieve_scored_chunks_batch, and returns only the chunk texts.
+        """
+        return [[chunk["text"] for chunk in chunks]
+                for chunks in self.retrieve_scored_chunks_batch(queries, k, filters, date_from, date_to, mode,
+                                                                min_score, max_chars, max_tokens, mmr_lambda, rerank)]
+
 
 # --- FastAPI Endpoints for Retriever Agent Microservice ---
 
+# Name under which the "faiss_index" store is served when a request names no collection
+DEFAULT_COLLECTION = "default"
+
 # Initialize the RetrieverAgent instance. This happens once when the FastAPI application starts.
 try:
     # 'faiss_index' is the default path where the vector store will be saved.
     # It will create a directory with this name.
-    retriever_agent_instance = RetrieverAgent(vector_store_path="faiss_index")
+    # RETRIEVER_EMBEDDING_BACKEND=hashed runs the service with local embeddings and no GOOGLE_API_KEY;
+    # RETRIEVER_SEARCH_ENGINE=numpy searches an in-memory matrix instead of the FAISS index
+    retriever_agent_instance = RetrieverAgent(
+        vector_store_path="faiss_index",
+        embedding_backend=os.getenv("RETRIEVER_EMBEDDING_BACKEND", "google"),
+        search_engine=os.getenv("RETRIEVER_SEARCH_ENGINE", "faiss"),
+    )
+
+    def open_collection(path: str) -> RetrieverAgent:
+        # Collections share the default store's embedding model, so every desk's vectors are comparable;
+        # each keeps its own embedding cache, which is dropped with it
+        return RetrieverAgent(
+            vector_store_path=path, embeddings=retriever_agent_instance.embeddings,
+            embedding_cache_path=os.path.join(path, "embedding_cache.sqlite3"),
+            search_engine=os.getenv("RETRIEVER_SEARCH_ENGINE", "faiss"),
+        )
+
+    # Named collections (one per desk) live under RETRIEVER_COLLECTIONS_PATH; idle ones are closed
+    # least recently used first once the loaded ones need more than RETRIEVER_COLLECTIONS_MEMORY_MB
+    max_loaded_collections = os.getenv("RETRIEVER_MAX_LOADED_COLLECTIONS")
+    collection_registry = CollectionRegistry(
+        os.getenv("RETRIEVER_COLLECTIONS_PATH", "collections"), open_collection,
+        memory_budget_bytes=int(float(os.getenv("RETRIEVER_COLLECTIONS_MEMORY_MB", "1024")) * 2 ** 20),
+        max_loaded=int(max_loaded_collections) if max_loaded_collections else None,
+        pinned={DEFAULT_COLLECTION: retriever_agent_instance},
+    )
 except Exception as e:
     print(f"CRITICAL ERROR: RetrieverAgent failed to initialize. Service will not be functional.")
     print(f"Initialization Details: {e}")
     # Set the instance to None to prevent calls to an uninitialized agent
     retriever_agent_instance = None
+    collection_registry = None
     # For a production system, you might want to uncomment this to prevent the service from running in a bad state
     # sys.exit(1) # Requires 'import sys'
 
@@ -175,33 +1915,129 @@ class IndexRequest(BaseModel):
     """Request model for indexing documents."""
     documents: List[str]
     metadata: Optional[List[Dict[str, Any]]] = None # Optional metadata for each document
+    ids: Optional[List[Optional[str]]] = None # Optional stable IDs; re-indexing an existing ID replaces it
+    wait: bool = False # Respond only once the ingest job has finished, with its final status
+    collection: Optional[str] = None # Named collection (see /collections); the default store if omitted
 
 class RetrieveRequest(BaseModel):
     """Request model for retrieving document chunks."""
     query: str
     k: int = 5 # Default number of chunks to retrieve
+    filters: Optional[Dict[str, Any]] = None # Metadata filters, e.g. {"type": "earnings_surprise", "symbol": "TSM"}
+    date_from: Optional[datetime.date] = None # Only documents dated on or after this day
+    date_to: Optional[datetime.date] = None # Only documents dated on or before this day
+    mode: Optional[str] = None # "dense", "lexical", "hybrid" or "auto"; defaults to the configured mode
+    min_score: Optional[float] = None # Stop at the first chunk scoring below this
+    max_chars: Optional[int] = None # Stop before the chunk that would take the total text length past this
+    max_tokens: Optional[int] = None # Like max_chars, in estimated tokens
+    mmr_lambda: Optional[float] = None # Diversify results by maximal marginal relevance: 1 = relevance only, 0 = diversity only
+    rerank: Optional[bool] = None # Re-score over-fetched candidates on CPU before taking the top k; defaults to the configured setting
+    include_parent: bool = False # Add each chunk's parent context to `results`
+    collection: Optional[str] = None # Named collection (see /collections); the default store if omitted
+
+class ScoredChunk(BaseModel):
+    """A retrieved chunk with its similarity score (higher is better) and stored metadata."""
+    text: str
+    score: float
+    metadata: Dict[str, Any] = {}
+    parent_context: Optional[str] = None # With include_parent, the surrounding text of a chunked document
 
 class RetrieveResponse(BaseModel):
     """Response model for retrieved document chunks."""
-    chunks: List[str]
+    chunks: List[str] # Chunk texts, best first
+    results: List[ScoredChunk] = [] # The same chunks with scores and metadata
+
+class RebuildIndexRequest(BaseModel):
+    """Request model for rebuilding (and retraining) the vector index."""
+    index_type: Optional[str] = None # "flat", "ivf" or "hnsw"; defaults to the configured type
+    quantization: Optional[str] = None # "none", "sq8" or "pq"; defaults to the configured mode
+    collection: Optional[str] = None # Named collection (see /collections); the default store if omitted
+
+class RetrieveBatchRequest(BaseModel):
+    """Request model for retrieving document chunks for several queries in one round trip."""
+    queries: List[str]
+    k: int = 5 # Number of chunks to retrieve per query
+    filters: Optional[Dict[str, Any]] = None # Metadata filters applied to every query
+    date_from: Optional[datetime.date] = None # Only documents dated on or after this day
+    date_to: Optional[datetime.date] = None # Only documents dated on or before this day
+    mode: Optional[str] = None # "dense", "lexical", "hybrid" or "auto"; defaults to the configured mode
+    min_score: Optional[float] = None # Per query, stop at the first chunk scoring below this
+    max_chars: Optional[int] = None # Per query text budget in characters
+    max_tokens: Optional[int] = None # Per query text budget in estimated tokens
+    mmr_lambda: Optional[float] = None # Diversify each query's results by maximal marginal relevance
+    rerank: Optional[bool] = None # Re-score over-fetched candidates on CPU before taking the top k
+    include_parent: bool = False # Add each chunk's parent context to `scored_results`
+    collection: Optional[str] = None # Named collection (see /collections); the default store if omitted
+
+class RetrieveBatchResponse(BaseModel):
+    """Response model for batch retrieval: one list of chunks per query, in request order."""
+    results: List[List[str]]
+    scored_results: List[List[ScoredChunk]] = [] # The same chunks with scores and metadata
+
+class CreateCollectionRequest(BaseModel):
+    """Request model for creating a named collection."""
+    name: str # 1-64 letters, digits, "-" or "_", e.g. "asia-tech"
+
+def acquire_collection(name: Optional[str]) -> RetrieverAgent:
+    """
+    Returns the RetrieverAgent of collection `name`, or of the default store if None, loading it if
+    needed and keeping it from being evicted until release_collection(name). Unknown collections are a 404.
+    """
+    if collection_registry is None:
+        raise HTTPException(status_code=500, detail="Retriever Agent is not initialized. Check server logs for initialization errors.")
+    try:
+        return collection_registry.acquire(name)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"RetrieverAgent: {e.args[0]}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"RetrieverAgent: {e}")
+
+def release_collection(name: Optional[str]) -> None:
+    collection_registry.release(name)
+
+@contextmanager
+def use_collection(name: Optional[str]):
+    """Yields the RetrieverAgent of collection `name` (see acquire_collection) for the duration of the block."""
+    agent = acquire_collection(name)
+    try:
+        yield agent
+    finally:
+        release_collection(name)
 
 @app.get("/")
 def root():
     """Root endpoint for Retriever Agent Microservice."""
     return {"message": "Retriever Agent Microservice is running. Visit /docs for API documentation."}
 
-@app.post("/index_data")
+@app.post("/index_data", status_code=202)
 async def index_data_endpoint(request: IndexRequest):
     """
-    API endpoint to index a list of documents (text strings) into the vector store.
+    API endpoint to index a list of documents (text strings) into the vector store,
+    or into the named `collection`.
     This would typically be called by the Orchestrator or a data pipeline
     after fetching and preprocessing raw data.
+
+    The documents are queued as a background ingest job and the response returns its
+    `job_id` immediately; poll /index_jobs/{job_id} for progress. With `wait`, the response
+    is sent once the job has finished (the event loop stays free meanwhile) and carries
+    its final status and `indexed_count`.
     """
-    if retriever_agent_instance is None:
-        raise HTTPException(status_code=500, detail="Retriever Agent is not initialized. Check server logs for initialization errors.")
     try:
-        indexed_count = retriever_agent_instance.index_documents(request.documents, request.metadata)
-        return {"status": "success", "indexed_count": indexed_count}
+        # Loading the collection, or closing others to make room for it, reads and writes snapshots;
+        # both run on a worker thread so the event loop keeps serving other requests
+        agent = await asyncio.to_thread(acquire_collection, request.collection)
+        try:
+            job = agent.submit_index_job(request.documents, request.metadata, request.ids)
+            if request.wait:
+                future = agent.ingest_jobs.future(job["job_id"])
+                if future is not None:
+                    await asyncio.wrap_future(future)
+                job = agent.get_index_job(job["job_id"])
+                if job["status"] == "failed":
+                    raise HTTPException(status_code=500, detail=f"Failed to index documents into vector store: {job['error']}")
+        finally:
+            await asyncio.to_thread(release_collection, request.collection)
+        return job
     except HTTPException as e:
         # Re-raise HTTPException raised by the agent method to pass proper status codes
         raise e
@@ -210,23 +2046,149 @@ async def index_data_endpoint(request: IndexRequest):
         print(f"RetrieverAgent: !!! UNCAUGHT EXCEPTION in /index_data endpoint: {type(e).__name__} - {e}")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred during indexing: {e}")
 
+@app.get("/index_jobs/{job_id}")
+def index_job_status_endpoint(job_id: str, collection: Optional[str] = None):
+    """
+    API endpoint reporting an ingest job queued by /index_data: its status ("queued", "running",
+    "succeeded" or "failed"), documents processed and indexed so far, `progress` from 0 to 1,
+    timestamps and, for failed jobs, the error. Jobs of a named collection are looked up with
+    ?collection=, also after the collection has been evicted.
+    """
+    if collection_registry is None:
+        raise HTTPException(status_code=500, detail="Retriever Agent is not initialized. Check server logs for initialization errors.")
+    try:
+        job = collection_registry.get_job(collection, job_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"RetrieverAgent: {e.args[0]}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"RetrieverAgent: {e}")
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"RetrieverAgent: Unknown ingest job '{job_id}'.")
+    return job
+
+@app.post("/collections", status_code=201)
+def create_collection_endpoint(request: CreateCollectionRequest):
+    """API endpoint creating an empty named collection, e.g. one per desk. 409 if the name is taken."""
+    if collection_registry is None:
+        raise HTTPException(status_code=500, detail="Retriever Agent is not initialized. Check server logs for initialization errors.")
+    try:
+        return collection_registry.create(request.name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"RetrieverAgent: {e}")
+    except FileExistsError as e:
+        raise HTTPException(status_code=409, detail=f"RetrieverAgent: {e}")
+
+@app.get("/collections")
+def list_collections_endpoint():
+    """
+    API endpoint listing every collection, whether it is loaded and its memory use, together with
+    the registry's memory budget and load/eviction counters.
+    """
+    if collection_registry is None:
+        raise HTTPException(status_code=500, detail="Retriever Agent is not initialized. Check server logs for initialization errors.")
+    return {"collections": collection_registry.list_collections(), **collection_registry.stats()}
+
+@app.delete("/collections/{name}")
+def drop_collection_endpoint(name: str):
+    """API endpoint deleting a named collection and all of its data. 409 while it is in use."""
+    if collection_registry is None:
+        raise HTTPException(status_code=500, detail="Retriever Agent is not initialized. Check server logs for initialization errors.")
+    try:
+        collection_registry.drop(name)
+        return {"status": "success", "dropped": name}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"RetrieverAgent: {e.args[0]}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"RetrieverAgent: {e}")
+    except CollectionInUseError as e:
+        raise HTTPException(status_code=409, detail=f"RetrieverAgent: {e}")
+
+@app.get("/stats")
+def stats_endpoint(collection: Optional[str] = None):
+    """
+    API endpoint reporting what the Retriever Agent holds: document counts by `type` and `symbol`,
+    vector memory, on-disk size, index generation and last commit time, cache counters, and
+    p50/p95/p99 timings of recent embed, search and save calls. ?collection= reports a named collection.
+    """
+    try:
+        with use_collection(collection) as agent:
+            return agent.stats()
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"RetrieverAgent: !!! UNCAUGHT EXCEPTION in /stats endpoint: {type(e).__name__} - {e}")
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred while collecting stats: {e}")
+
+# Retrieval and rebuild are blocking (embedding call, FAISS search), so they are plain functions:
+# FastAPI runs them in its threadpool and concurrent requests do not queue behind each other on the event loop
 @app.post("/retrieve_chunks", response_model=RetrieveResponse)
-async def retrieve_chunks_endpoint(request: RetrieveRequest):
+def retrieve_chunks_endpoint(request: RetrieveRequest):
     """
     API endpoint to retrieve the top-k most relevant text chunks from the
     vector store based on a given query.
     This would typically be called by the Orchestrator before interacting
     with the Language Agent for RAG.
+
+    `results` carries each chunk's score and metadata. With `min_score`, `max_chars` or
+    `max_tokens`, collection stops at the first chunk that is too weak or would overrun
+    the budget, so fewer than k chunks may come back. With `mmr_lambda`, near-duplicate chunks
+    are traded for different ones by maximal marginal relevance. With `rerank`, an over-fetched
+    candidate pool is re-scored locally (term overlap, symbol match) within a latency budget.
+    Long documents are indexed as chunks; `include_parent` adds each chunk's surrounding text.
+    `collection` searches a named collection instead of the default store.
     """
-    if retriever_agent_instance is None:
-        raise HTTPException(status_code=500, detail="Retriever Agent is not initialized. Check server logs for initialization errors.")
     try:
-        chunks = retriever_agent_instance.retrieve_top_k_chunks(request.query, request.k)
-        return {"chunks": chunks}
+        with use_collection(request.collection) as agent:
+            results = agent.retrieve_scored_chunks(request.query, request.k, request.filters,
+                                                   request.date_from, request.date_to, request.mode,
+                                                   request.min_score, request.max_chars, request.max_tokens,
+                                                   request.mmr_lambda, request.rerank, request.include_parent)
+        return {"chunks": [chunk["text"] for chunk in results], "results": results}
     except HTTPException as e:
         # Re-raise HTTPException raised by the agent method
         raise e
     except Exception as e:
         # Catch any other unexpected errors during retrieval
         print(f"RetrieverAgent: !!! UNCAUGHT EXCEPTION in /retrieve_chunks endpoint: {type(e).__name__} - {e}")
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred during retrieval: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred during retrieval: {e}")
+
+@app.post("/retrieve_chunks_batch", response_model=RetrieveBatchResponse)
+def retrieve_chunks_batch_endpoint(request: RetrieveBatchRequest):
+    """
+    API endpoint to retrieve the top-k chunks for many queries in a single request.
+    The queries are embedded together and searched with one matrix search,
+    saving one HTTP round trip and one embedding call per query.
+    """
+    try:
+        with use_collection(request.collection) as agent:
+            scored_results = agent.retrieve_scored_chunks_batch(
+                request.queries, request.k, request.filters, request.date_from, request.date_to, request.mode,
+                request.min_score, request.max_chars, request.max_tokens, request.mmr_lambda, request.rerank,
+                request.include_parent,
+            )
+        return {"results": [[chunk["text"] for chunk in chunks] for chunks in scored_results], "scored_results": scored_results}
+    except HTTPException as e:
+        # Re-raise HTTPException raised by the agent method
+        raise e
+    except Exception as e:
+        # Catch any other unexpected errors during retrieval
+        print(f"RetrieverAgent: !!! UNCAUGHT EXCEPTION in /retrieve_chunks_batch endpoint: {type(e).__name__} - {e}")
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred during batch retrieval: {e}")
+
+@app.post("/rebuild_index")
+def rebuild_index_endpoint(request: RebuildIndexRequest):
+    """
+    API endpoint to rebuild the vector index from the stored vectors, optionally switching
+    between exact (flat) and approximate (IVF, HNSW) search. IVF centroids are retrained
+    on the current corpus, so call this after large ingests when running IVF.
+    """
+    try:
+        with use_collection(request.collection) as agent:
+            return {"status": "success", **agent.rebuild_index(request.index_type, request.quantization)}
+    except HTTPException as e:
+        raise e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"RetrieverAgent: !!! UNCAUGHT EXCEPTION in /rebuild_index endpoint: {type(e).__name__} - {e}")
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred while rebuilding the index: {e}")
\ No newline at end of file
@@ -13,7 +13,7 @@ def format_market_data_for_retrieval(market_data: Dict[str, Any]) -> List[Dict[s
             f"{stock['name']} ({stock['symbol']}) closed at ${stock['price']:.2f} "
             f"on {stock['date']}."
         )
-        documents.append({"content": doc_content, "metadata": {"type": "stock_price", "symbol": stock['symbol']}})
+        documents.append({"content": doc_content, "metadata": {"type": "stock_price", "symbol": stock['symbol'], "date": stock['date']}})
 
     # Example: Convert earnings surprises into a retrievable document
     for earnings in market_data.get("earnings_surprises", []):
@@ -25,7 +25,7 @@ def format_market_data_for_retrieval(market_data: Dict[str, Any]) -> List[Dict[s
         )
         if earnings.get('reason_keywords'):
              doc_content += f" Reason: {earnings['reason_keywords']}."
-        documents.append({"content": doc_content, "metadata": {"type": "earnings_surprise", "symbol": earnings['symbol']}})
+        documents.append({"content": doc_content, "metadata": {"type": "earnings_surprise", "symbol": earnings['symbol'], "date": earnings['date']}})
 
     # Add logic to process scraped filings here too when you implement Scraping Agent
     print(f"DataIngestion: Preprocessed {len(documents)} documents for retrieval from raw market data.")
@@ -25,6 +25,21 @@ ANALYSIS_AGENT_BASE_URL = "https://market-brief-rag-system-analysis-agent.onrend
 STT_AGENT_BASE_URL = "https://market-brief-rag-system-sst-agent.onrender.com"
 TTS_AGENT_BASE_URL = "https://market-brief-rag-system-tts-agent.onrender.com"
 
+# --- Retrieval limits for the LLM context ---
+# Chunks are requested best first and collection stops at the first one scoring below
+# RETRIEVAL_MIN_SCORE or overrunning RETRIEVAL_MAX_TOKENS, instead of always padding the prompt with k chunks.
+# No score floor is set until one has been calibrated on labelled queries for the retrieval mode and
+# re-ranker in use: dense, hybrid and re-ranked scores are on different scales
+RETRIEVAL_K = 5
+RETRIEVAL_MIN_SCORE = None
+RETRIEVAL_MAX_TOKENS = 1500
+# Set (e.g. to 0.7) to trade near-duplicate chunks, such as several about one company's earnings, for different
+# ones by maximal marginal relevance; None returns the top k by score
+RETRIEVAL_MMR_LAMBDA = None
+# Set to True to re-score candidates with the Retriever Agent's local re-ranker (term overlap, ticker match)
+# before the top k; off until its effect on answer quality has been measured (scripts/retrieval_benchmark.py)
+RETRIEVAL_RERANK = False
+
 # Initialize LanguageAgent (as it's directly imported)
 try:
     language_agent_instance = LanguageAgent()
@@ -90,7 +105,8 @@ async def generate_market_brief_endpoint(request: BriefRequest):
     try:
         index_payload = {
             "documents": [d["content"] for d in documents_for_retrieval],
-            "metadata": [d["metadata"] for d in documents_for_retrieval]
+            "metadata": [d["metadata"] for d in documents_for_retrieval],
+            "wait": True # The retrieval step below needs these documents indexed
         }
         index_response = requests.post(f"{RETRIEVER_AGENT_BASE_URL}/index_data", json=index_payload)
         index_response.raise_for_status()
@@ -118,7 +134,14 @@ async def generate_market_brief_endpoint(request: BriefRequest):
     retrieval_query = request.text_query
     print(f"Orchestrator: Calling Retriever Agent to retrieve chunks for query: '{retrieval_query}'...")
     try:
-        retrieve_payload = {"query": retrieval_query, "k": 5}
+        retrieve_payload = {
+            "query": retrieval_query,
+            "k": RETRIEVAL_K,
+            "min_score": RETRIEVAL_MIN_SCORE,
+            "max_tokens": RETRIEVAL_MAX_TOKENS,
+            "mmr_lambda": RETRIEVAL_MMR_LAMBDA,
+            "rerank": RETRIEVAL_RERANK,
+        }
         retrieve_response = requests.post(f"{RETRIEVER_AGENT_BASE_URL}/retrieve_chunks", json=retrieve_payload)
         retrieve_response.raise_for_status()
         retrieved_chunks = retrieve_response.json().get("chunks", [])
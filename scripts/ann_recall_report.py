@@ -0,0 +1,158 @@
+# scripts/ann_recall_report.py
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+# Add the project root to sys.path so the vector_store package can be imported
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store.float_vectors import FloatVectorStore, rerank_exact
+from vector_store.index_factory import QUANTIZATION_MODES, build_index, effective_nlist, make_search_params
+
+# Operating points swept for each approximate index type
+IVF_NPROBE_VALUES = [1, 2, 4, 8, 16, 32, 64]
+HNSW_EF_SEARCH_VALUES = [16, 32, 64, 128, 256]
+
+def make_synthetic_embeddings(num_vectors: int, dimension: int, num_clusters: int, seed: int) -> np.ndarray:
+    """
+    Generates unit-length vectors grouped around random topic centres, which resembles
+    the clustered structure of real text embeddings better than uniform noise.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((num_clusters, dimension)).astype(np.float32)
+    assignments = rng.integers(0, num_clusters, size=num_vectors)
+    vectors = centres[assignments] + 0.6 * rng.standard_normal((num_vectors, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def index_memory_bytes(index) -> int:
+    """Size of the index in its serialized form, which is what it occupies in RAM or mapped from disk."""
+    return int(faiss.serialize_index(index).nbytes)
+
+def measure(index, queries: np.ndarray, ground_truth: np.ndarray, k: int, nprobe=None, ef_search=None,
+            float_vectors: FloatVectorStore = None, rerank_factor: int = 1) -> dict:
+    """
+    Runs queries one at a time (as the Retriever Agent does) and reports recall@k and latency.
+    With `float_vectors` and rerank_factor > 1, k * rerank_factor candidates are re-ranked exactly.
+    """
+    params = make_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    latencies_ms = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        if float_vectors is not None and rerank_factor > 1:
+            _, candidates = index.search(query[None, :], k * rerank_factor, params=params)
+            _, indices = rerank_exact(query[None, :], candidates, float_vectors, k)
+        else:
+            _, indices = index.search(query[None, :], k, params=params)
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+        found.append(indices[0])
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, ground_truth)])
+    return {
+        "recall_at_k": round(float(recall), 4),
+        "latency_ms_p50": round(float(np.percentile(latencies_ms, 50)), 4),
+        "latency_ms_p99": round(float(np.percentile(latencies_ms, 99)), 4),
+        "qps": round(len(queries) / (sum(latencies_ms) / 1000), 1),
+    }
+
+def run_report(num_vectors: int, dimension: int, num_queries: int, k: int, nlist: int, hnsw_m: int, seed: int,
+               pq_m: int = 96, rerank_factor: int = 4) -> dict:
+    corpus = make_synthetic_embeddings(num_vectors + num_queries, dimension, num_clusters=max(8, num_vectors // 500), seed=seed)
+    vectors, queries = corpus[:num_vectors], corpus[num_vectors:]
+    rows = []
+
+    start = time.perf_counter()
+    flat = build_index("flat", vectors)
+    flat_build = time.perf_counter() - start
+    _, ground_truth = flat.search(queries, k)
+    rows.append({"index_type": "flat", "setting": "exact", "build_seconds": round(flat_build, 3),
+                 **measure(flat, queries, ground_truth, k)})
+
+    start = time.perf_counter()
+    ivf = build_index("ivf", vectors, nlist=nlist)
+    ivf_build = time.perf_counter() - start
+    lists = effective_nlist(nlist, num_vectors)
+    for nprobe in [n for n in IVF_NPROBE_VALUES if n <= lists]:
+        rows.append({"index_type": "ivf", "setting": f"nlist={lists} nprobe={nprobe}", "build_seconds": round(ivf_build, 3),
+                     **measure(ivf, queries, ground_truth, k, nprobe=nprobe)})
+
+    start = time.perf_counter()
+    hnsw = build_index("hnsw", vectors, hnsw_m=hnsw_m)
+    hnsw_build = time.perf_counter() - start
+    for ef_search in HNSW_EF_SEARCH_VALUES:
+        rows.append({"index_type": "hnsw", "setting": f"M={hnsw_m} efSearch={ef_search}", "build_seconds": round(hnsw_build, 3),
+                     **measure(hnsw, queries, ground_truth, k, ef_search=ef_search)})
+
+    return {
+        "num_vectors": num_vectors,
+        "dimension": dimension,
+        "num_queries": num_queries,
+        "k": k,
+        "results": rows,
+        "quantization": run_quantization_report(vectors, queries, ground_truth, k, nlist, hnsw_m, pq_m, rerank_factor),
+    }
+
+def run_quantization_report(vectors: np.ndarray, queries: np.ndarray, ground_truth: np.ndarray, k: int,
+                            nlist: int, hnsw_m: int, pq_m: int, rerank_factor: int) -> list:
+    """
+    Memory footprint and recall@k of every index type under each quantization mode, at the
+    default nprobe / efSearch, both from the quantized distances alone and after exact re-ranking.
+    """
+    float_vectors = FloatVectorStore(vectors.shape[1], vectors)
+    rows = []
+    for index_type in ("flat", "ivf", "hnsw"):
+        for quantization in QUANTIZATION_MODES:
+            start = time.perf_counter()
+            index = build_index(index_type, vectors, nlist=nlist, hnsw_m=hnsw_m, quantization=quantization, pq_m=pq_m)
+            build_seconds = time.perf_counter() - start
+            memory_mb = round(index_memory_bytes(index) / 2 ** 20, 2)
+            factors = [1] if quantization == "none" else [1, rerank_factor]
+            for factor in factors:
+                rows.append({"index_type": index_type, "quantization": quantization, "rerank_factor": factor,
+                             "memory_mb": memory_mb, "build_seconds": round(build_seconds, 3),
+                             **measure(index, queries, ground_truth, k, float_vectors=float_vectors, rerank_factor=factor)})
+    return rows
+
+def print_report(report: dict):
+    print(f"\nRecall vs latency: {report['num_vectors']} vectors x {report['dimension']} dims, "
+          f"{report['num_queries']} queries, k={report['k']}")
+    print("-" * 100)
+    print(f"{'index':<6} {'setting':<28} {'build s':>8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} {'QPS':>9}")
+    for row in report["results"]:
+        print(f"{row['index_type']:<6} {row['setting']:<28} {row['build_seconds']:>8} {row['recall_at_k']:>9} "
+              f"{row['latency_ms_p50']:>8} {row['latency_ms_p99']:>8} {row['qps']:>9}")
+
+    print(f"\nMemory vs recall by quantization (float vectors for re-ranking stay on disk, memory-mapped)")
+    print("-" * 100)
+    print(f"{'index':<6} {'quant':<6} {'rerank':>6} {'memory MB':>10} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} {'QPS':>9}")
+    for row in report["quantization"]:
+        print(f"{row['index_type']:<6} {row['quantization']:<6} {'x' + str(row['rerank_factor']):>6} {row['memory_mb']:>10} "
+              f"{row['recall_at_k']:>9} {row['latency_ms_p50']:>8} {row['latency_ms_p99']:>8} {row['qps']:>9}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall-vs-latency report for the Retriever Agent's FAISS index types.")
+    parser.add_argument("--num-vectors", type=int, default=50_000)
+    parser.add_argument("--dimension", type=int, default=768) # text-embedding-004 output size
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--pq-m", type=int, default=96)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Optional path to also write the report as JSON.")
+    args = parser.parse_args()
+
+    report = run_report(args.num_vectors, args.dimension, args.num_queries, args.k, args.nlist, args.hnsw_m, args.seed,
+                        pq_m=args.pq_m, rerank_factor=args.rerank_factor)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
@@ -3,12 +3,14 @@
 import requests
 import json
 import os
+import time
 
 # --- IMPORTANT: Replace with your actual Render service URL for the Retriever Agent ---
 # Example: "https://my-retriever-agent-xyz.onrender.com"
 RETRIEVER_AGENT_URL = "https://your-retriever-agent-service.onrender.com" 
 
 INDEX_ENDPOINT = f"{RETRIEVER_AGENT_URL}/index_data"
+JOB_STATUS_ENDPOINT = f"{RETRIEVER_AGENT_URL}/index_jobs"
 
 print(f"--- INDEXING SCRIPT ---")
 print(f"Targeting Retriever Agent URL: {RETRIEVER_AGENT_URL}")
@@ -47,8 +49,20 @@ print(f"\nAttempting to index {len(documents_for_indexing)} sample documents..."
 try:
     response = requests.post(INDEX_ENDPOINT, json=index_payload)
     response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-    print("Indexing successful!")
-    print("Response from server:", response.json())
+    job = response.json()
+    print(f"Indexing job {job['job_id']} queued.")
+    # The Retriever Agent indexes in the background; poll the job until it finishes
+    while job["status"] in ("queued", "running"):
+        time.sleep(1)
+        response = requests.get(f"{JOB_STATUS_ENDPOINT}/{job['job_id']}")
+        response.raise_for_status()
+        job = response.json()
+        print(f"Progress: {job['processed_count']}/{job['document_count']} documents")
+    if job["status"] == "succeeded":
+        print("Indexing successful!")
+    else:
+        print(f"CRITICAL ERROR: Indexing job failed: {job['error']}")
+    print("Response from server:", job)
 except requests.exceptions.RequestException as e:
     print(f"CRITICAL ERROR: Failed to index documents: {e}")
     if response and hasattr(response, 'status_code') and hasattr(response, 'text'):
@@ -0,0 +1,234 @@
+# scripts/retrieval_benchmark.py
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add the project root to sys.path so the agents, data_ingestion and vector_store packages can be imported
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.retrieval_agent import RetrieverAgent
+from data_ingestion.preprocess import format_market_data_for_retrieval
+from vector_store.embedding_backends import HashedNGramEmbeddings
+
+SECTORS = ["semiconductor", "software", "energy", "banking", "retail", "biotech", "automotive", "telecom"]
+NEWS_EVENTS = [
+    "announced a share buyback", "cut its full-year guidance", "opened a new factory", "won a government contract",
+    "named a new chief executive", "settled a patent dispute", "raised its dividend", "delayed a product launch",
+]
+
+# Labelled query templates per document type; each query has exactly one relevant document
+QUERY_TEMPLATES = {
+    "stock_price": "What did {name} ({symbol}) close at on {date}?",
+    "earnings_surprise": "How did {name} earnings compare with estimates on {date}?",
+    "news": "What news was there about {name} on {date}?",
+}
+
+def make_market_corpus(num_documents: int, num_queries: int, seed: int):
+    """
+    Builds a synthetic market corpus of about `num_documents` documents: daily closes, earnings
+    surprises and news items for generated companies, formatted by format_market_data_for_retrieval
+    like real ingested data. Returns (documents, queries), where every query is labelled with the
+    ID of the one document that answers it.
+    """
+    rng = np.random.default_rng(seed)
+    num_days = 20
+    num_companies = max(1, num_documents // (num_days * 2 + num_days // 5))
+    letters = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    symbols, companies = set(), []
+    while len(companies) < num_companies:
+        symbol = "".join(rng.choice(letters, size=int(rng.integers(3, 5))))
+        if symbol not in symbols:
+            symbols.add(symbol)
+            sector = SECTORS[len(companies) % len(SECTORS)]
+            companies.append({"symbol": symbol, "name": f"{symbol.title()} {sector.title()} Corp", "sector": sector})
+    start = datetime.date(2025, 1, 6)
+    dates = [(start + datetime.timedelta(days=day)).isoformat() for day in range(num_days)]
+
+    market_data = {"stocks": [], "earnings_surprises": []}
+    documents = []
+    for company in companies:
+        price = float(rng.uniform(10, 500))
+        for date in dates:
+            price *= float(1 + rng.normal(0, 0.02))
+            market_data["stocks"].append({**company, "price": price, "date": date})
+            event = NEWS_EVENTS[int(rng.integers(len(NEWS_EVENTS)))]
+            documents.append({
+                "content": f"{company['name']} ({company['symbol']}), a {company['sector']} company, {event} on {date}.",
+                "metadata": {"type": "news", "symbol": company["symbol"], "date": date},
+            })
+        for date in rng.choice(dates, size=num_days // 5, replace=False):
+            estimated = round(float(rng.uniform(0.2, 5.0)), 2)
+            actual = round(estimated * float(1 + rng.normal(0, 0.1)), 2)
+            market_data["earnings_surprises"].append({
+                **company, "date": str(date), "actual_eps": actual, "estimated_eps": estimated,
+                "surprise_percent": (actual - estimated) / estimated * 100,
+            })
+    with contextlib.redirect_stdout(io.StringIO()):
+        documents = format_market_data_for_retrieval(market_data) + documents
+
+    queries = []
+    for position in rng.choice(len(documents), size=min(num_queries, len(documents)), replace=False):
+        metadata = documents[position]["metadata"]
+        company = next(company for company in companies if company["symbol"] == metadata["symbol"])
+        queries.append({
+            "query": QUERY_TEMPLATES[metadata["type"]].format(name=company["name"], symbol=company["symbol"], date=metadata["date"]),
+            "relevant_id": RetrieverAgent.make_document_id(metadata),
+        })
+    return documents, queries
+
+def build_agent(path: str, documents: list, index_type: str, dimension: int) -> RetrieverAgent:
+    """A RetrieverAgent over `documents`, embedded locally and compacted so every vector is in the index."""
+    agent = RetrieverAgent(
+        vector_store_path=path, embeddings=HashedNGramEmbeddings(dimension=dimension), embedding_cache_path=None,
+        compaction_interval_seconds=None, wal_fsync=False, index_type=index_type,
+        # Every query is timed end to end, so nothing may be answered from a cache
+        query_cache_max_entries=0, result_cache_max_entries=0,
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        for offset in range(0, len(documents), 1000):
+            batch = documents[offset:offset + 1000]
+            agent.index_documents([doc["content"] for doc in batch], [doc["metadata"] for doc in batch])
+        agent.compact()
+    return agent
+
+def evaluate(agent: RetrieverAgent, queries: list, k: int, mode: str, batch_size: int) -> dict:
+    """
+    Runs the labelled queries one at a time, as /retrieve_chunks does, and reports recall@k (share of
+    queries whose relevant document is in the top k), MRR@k, latency and the share of queries answered
+    without embedding them (auto mode's lexical fast path); then in batches for batch QPS.
+    One untimed query and batch run first: the BM25 and metadata indexes are built on first use,
+    which would otherwise land in the first timed query of each mode.
+    """
+    latencies_ms, reciprocal_ranks = [], []
+    # The agent logs every query; writing that to a terminal would be timed along with the search
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent.retrieve_scored_chunks(queries[0]["query"], k=k, mode=mode)
+        agent.retrieve_scored_chunks_batch([labelled["query"] for labelled in queries[:batch_size]], k=k, mode=mode)
+        # Query caches are off, so every query not answered lexically is one embedding call
+        embeddings_before = agent.latency.summary().get("embed_query", {}).get("count", 0)
+        for labelled in queries:
+            start = time.perf_counter()
+            chunks = agent.retrieve_scored_chunks(labelled["query"], k=k, mode=mode)
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+            ids = [RetrieverAgent.make_document_id(chunk["metadata"]) for chunk in chunks]
+            reciprocal_ranks.append(1.0 / (ids.index(labelled["relevant_id"]) + 1) if labelled["relevant_id"] in ids else 0.0)
+        embedded = agent.latency.summary().get("embed_query", {}).get("count", 0) - embeddings_before
+        start = time.perf_counter()
+        for offset in range(0, len(queries), batch_size):
+            agent.retrieve_scored_chunks_batch([labelled["query"] for labelled in queries[offset:offset + batch_size]], k=k, mode=mode)
+        batch_seconds = time.perf_counter() - start
+    return {
+        "recall_at_k": round(float(np.mean([rank > 0 for rank in reciprocal_ranks])), 4),
+        "mrr_at_k": round(float(np.mean(reciprocal_ranks)), 4),
+        "lexical_share": round(1.0 - embedded / len(queries), 4),
+        "latency_ms_p50": round(float(np.percentile(latencies_ms, 50)), 4),
+        "latency_ms_p95": round(float(np.percentile(latencies_ms, 95)), 4),
+        "latency_ms_p99": round(float(np.percentile(latencies_ms, 99)), 4),
+        "qps": round(len(queries) / (sum(latencies_ms) / 1000), 1),
+        "batch_qps": round(len(queries) / batch_seconds, 1),
+    }
+
+def git_commit() -> str:
+    """The checked-out commit, so saved reports can be matched to the code they measured."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_benchmark(corpus_sizes: list, index_types: list, modes: list, num_queries: int, k: int, dimension: int,
+                  batch_size: int, seed: int) -> dict:
+    rows = []
+    for corpus_size in corpus_sizes:
+        documents, queries = make_market_corpus(corpus_size, num_queries, seed)
+        for index_type in index_types:
+            with tempfile.TemporaryDirectory() as directory:
+                start = time.perf_counter()
+                agent = build_agent(os.path.join(directory, "faiss_index"), documents, index_type, dimension)
+                build_seconds = time.perf_counter() - start
+                try:
+                    for mode in modes:
+                        rows.append({"num_documents": len(documents), "index_type": index_type, "mode": mode,
+                                     "build_seconds": round(build_seconds, 3), **evaluate(agent, queries, k, mode, batch_size)})
+                        print(f"  {len(documents)} docs, {index_type}, {mode}: recall@{k} {rows[-1]['recall_at_k']}, QPS {rows[-1]['qps']}")
+                finally:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        agent.close()
+    return {
+        "git_commit": git_commit(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "embeddings": HashedNGramEmbeddings(dimension=dimension).model_name,
+        "num_queries": num_queries,
+        "k": k,
+        "batch_size": batch_size,
+        "seed": seed,
+        "results": rows,
+    }
+
+def compare_reports(report: dict, baseline: dict) -> list:
+    """Differences to a saved report, per (corpus size, index type, mode) measured by both."""
+    baseline_rows = {(row["num_documents"], row["index_type"], row["mode"]): row for row in baseline["results"]}
+    deltas = []
+    for row in report["results"]:
+        before = baseline_rows.get((row["num_documents"], row["index_type"], row["mode"]))
+        if before is not None:
+            deltas.append({
+                "num_documents": row["num_documents"], "index_type": row["index_type"], "mode": row["mode"],
+                **{f"{metric}_delta": round(row[metric] - before[metric], 4)
+                   for metric in ("recall_at_k", "mrr_at_k", "latency_ms_p50", "latency_ms_p99", "qps")},
+            })
+    return deltas
+
+def print_report(report: dict):
+    print(f"\nRetrieval quality and speed at commit {report['git_commit']}: {report['num_queries']} labelled queries, "
+          f"k={report['k']}, {report['embeddings']} embeddings")
+    print("-" * 118)
+    print(f"{'docs':>7} {'index':<6} {'mode':<7} {'recall@k':>9} {'MRR':>7} {'lexical':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'QPS':>8} {'batch QPS':>10} {'build s':>8}")
+    for row in report["results"]:
+        print(f"{row['num_documents']:>7} {row['index_type']:<6} {row['mode']:<7} {row['recall_at_k']:>9} {row['mrr_at_k']:>7} "
+              f"{row['lexical_share']:>7} {row['latency_ms_p50']:>8} {row['latency_ms_p95']:>8} {row['latency_ms_p99']:>8} {row['qps']:>8} "
+              f"{row['batch_qps']:>10} {row['build_seconds']:>8}")
+    if report.get("baseline"):
+        print(f"\nChange since {report['baseline']['git_commit']}")
+        print("-" * 110)
+        print(f"{'docs':>7} {'index':<6} {'mode':<7} {'recall@k':>9} {'MRR':>7} {'p50 ms':>8} {'p99 ms':>8} {'QPS':>8}")
+        for row in report["baseline"]["deltas"]:
+            print(f"{row['num_documents']:>7} {row['index_type']:<6} {row['mode']:<7} {row['recall_at_k_delta']:>+9} "
+                  f"{row['mrr_at_k_delta']:>+7} {row['latency_ms_p50_delta']:>+8} {row['latency_ms_p99_delta']:>+8} {row['qps_delta']:>+8}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall, MRR and speed of the Retriever Agent on synthetic market corpora.")
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--index-types", nargs="+", default=["flat", "ivf", "hnsw"])
+    parser.add_argument("--modes", nargs="+", default=["dense", "hybrid", "auto"])
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--baseline", help="Optional path of an earlier JSON report to compare against.")
+    parser.add_argument("--output", help="Optional path to also write the report as JSON.")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.corpus_sizes, args.index_types, args.modes, args.num_queries, args.k, args.dimension,
+                           args.batch_size, args.seed)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["baseline"] = {"git_commit": baseline.get("git_commit", "unknown"), "deltas": compare_reports(report, baseline)}
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
@@ -8,7 +8,7 @@ import time # For a small delay if running right after indexing
 # --- IMPORTANT: Replace with your actual Render service URL for the Retriever Agent ---
 RETRIEVER_AGENT_URL = "https://your-retriever-agent-service.onrender.com" 
 
-RETRIEVE_ENDPOINT = f"{RETRIEVER_AGENT_URL}/retrieve_chunks"
+RETRIEVE_BATCH_ENDPOINT = f"{RETRIEVER_AGENT_URL}/retrieve_chunks_batch"
 
 print(f"--- RETRIEVAL SCRIPT ---")
 print(f"Targeting Retriever Agent URL: {RETRIEVER_AGENT_URL}")
@@ -28,20 +28,23 @@ project_queries = [
 # Optional: Add a small delay if you run this immediately after indexing
 # time.sleep(5) 
 
-for query_text in project_queries:
-    retrieve_payload = {
-        "query": query_text,
-        "k": 2 # Retrieve the top 2 most relevant chunks for each query
-    }
+# All queries go out in a single request: the Retriever Agent embeds them together
+# and runs one matrix search, instead of one round trip per query
+retrieve_payload = {
+    "queries": project_queries,
+    "k": 2 # Retrieve the top 2 most relevant chunks for each query
+}
 
-    print(f"\n--- Retrieving chunks for query: '{query_text}' ---")
-    try:
-        response = requests.post(RETRIEVE_ENDPOINT, json=retrieve_payload)
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+print(f"\n--- Retrieving chunks for {len(project_queries)} queries in one batch request ---")
+response = None
+try:
+    response = requests.post(RETRIEVE_BATCH_ENDPOINT, json=retrieve_payload)
+    response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
 
-        retrieved_data = response.json()
-        chunks = retrieved_data.get("chunks", [])
+    batch_results = response.json().get("results", [])
 
+    for query_text, chunks in zip(project_queries, batch_results):
+        print(f"\n--- Retrieved chunks for query: '{query_text}' ---")
         if chunks:
             print("Successfully retrieved chunks:")
             for i, chunk in enumerate(chunks):
@@ -52,10 +55,10 @@ for query_text in project_queries:
             print(f"  No chunks retrieved for '{query_text}'.")
             print("  Consider checking if relevant data was indexed or if query needs refinement.")
 
-    except requests.exceptions.RequestException as e:
-        print(f"  Error during retrieval for query '{query_text}': {e}")
-        if response and hasattr(response, 'status_code') and hasattr(response, 'text'):
-            print(f"  Response status: {response.status_code}")
-            print(f"  Response body: {response.text}")
-        else:
-            print("No response object available or attributes missing.")
\ No newline at end of file
+except requests.exceptions.RequestException as e:
+    print(f"  Error during batch retrieval: {e}")
+    if response is not None and hasattr(response, 'status_code') and hasattr(response, 'text'):
+        print(f"  Response status: {response.status_code}")
+        print(f"  Response body: {response.text}")
+    else:
+        print("No response object available or attributes missing.")
\ No newline at end of file
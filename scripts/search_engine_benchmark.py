@@ -0,0 +1,112 @@
+# scripts/search_engine_benchmark.py
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add the project root to sys.path so the agents and vector_store packages can be imported
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.retrieval_agent import RetrieverAgent
+from scripts.ann_recall_report import make_synthetic_embeddings
+from vector_store.embedding_backends import HashedNGramEmbeddings
+
+def latency_summary(latencies_ms: list, num_queries: int) -> dict:
+    return {
+        "latency_ms_p50": round(float(np.percentile(latencies_ms, 50)), 4),
+        "latency_ms_p99": round(float(np.percentile(latencies_ms, 99)), 4),
+        "qps": round(num_queries / (sum(latencies_ms) / 1000), 1),
+    }
+
+def make_agent(path: str, vectors: np.ndarray, search_engine: str) -> RetrieverAgent:
+    """A RetrieverAgent over `vectors` (already embedded, so nothing is embedded or sent anywhere)."""
+    agent = RetrieverAgent(
+        vector_store_path=path, embeddings=HashedNGramEmbeddings(dimension=vectors.shape[1]),
+        embedding_cache_path=None, compaction_interval_seconds=None, wal_fsync=False, search_engine=search_engine,
+    )
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    agent._index_vectors(ids, [f"Chunk {i}" for i in range(len(vectors))], [{"type": "news"} for _ in ids], vectors.tolist())
+    with agent._write_lock:
+        agent._save_snapshot() # Everything in the index, as after a compaction
+    return agent
+
+def measure(search, queries: np.ndarray, batch_size: int) -> dict:
+    """Times `search(query_rows)` one query at a time and in batches of `batch_size`."""
+    single_ms = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query[None, :])
+        single_ms.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch_size):
+        search(queries[offset:offset + batch_size])
+    batch_seconds = time.perf_counter() - start
+    return {**latency_summary(single_ms, len(queries)), "batch_qps": round(len(queries) / batch_seconds, 1)}
+
+def run_benchmark(num_vectors: int, dimension: int, num_queries: int, k: int, batch_size: int, seed: int) -> dict:
+    corpus = make_synthetic_embeddings(num_vectors + num_queries, dimension, num_clusters=max(8, num_vectors // 500), seed=seed)
+    vectors, queries = corpus[:num_vectors], corpus[num_vectors:]
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        faiss_agent = make_agent(os.path.join(directory, "faiss"), vectors, "faiss")
+        numpy_agent = make_agent(os.path.join(directory, "numpy"), vectors, "numpy")
+        try:
+            # The LangChain wrapper call the agent used to make per query, for reference
+            wrapper = faiss_agent.vectorstore
+            rows.append({"path": "langchain FAISS wrapper", **measure(
+                lambda rows_: [wrapper.similarity_search_with_score_by_vector(row.tolist(), k=k) for row in rows_], queries, batch_size)})
+            rows.append({"path": "agent, faiss engine", **measure(
+                lambda rows_: faiss_agent._search_by_vectors(rows_, k), queries, batch_size)})
+            rows.append({"path": "agent, numpy engine", **measure(
+                lambda rows_: numpy_agent._search_by_vectors(rows_, k), queries, batch_size)})
+            rows.append({"path": "agent, numpy engine, filtered", **measure(
+                lambda rows_: numpy_agent._search_by_vectors(rows_, k, {"type": "news"}), queries, batch_size)})
+
+            # Both engines are exact, so they must agree
+            expected = [[doc.page_content for doc, _ in hits] for hits in faiss_agent._search_by_vectors(queries, k)]
+            found = [[doc.page_content for doc, _ in hits] for hits in numpy_agent._search_by_vectors(queries, k)]
+            agreement = np.mean([len(set(a) & set(b)) / k for a, b in zip(expected, found)])
+        finally:
+            faiss_agent.close()
+            numpy_agent.close()
+    return {
+        "num_vectors": num_vectors,
+        "dimension": dimension,
+        "num_queries": num_queries,
+        "k": k,
+        "batch_size": batch_size,
+        "engine_agreement_at_k": round(float(agreement), 4),
+        "results": rows,
+    }
+
+def print_report(report: dict):
+    print(f"\nDense search paths: {report['num_vectors']} vectors x {report['dimension']} dims, "
+          f"{report['num_queries']} queries, k={report['k']}, batches of {report['batch_size']}")
+    print("-" * 90)
+    print(f"{'path':<32} {'p50 ms':>8} {'p99 ms':>8} {'QPS':>9} {'batch QPS':>10}")
+    for row in report["results"]:
+        print(f"{row['path']:<32} {row['latency_ms_p50']:>8} {row['latency_ms_p99']:>8} {row['qps']:>9} {row['batch_qps']:>10}")
+    print(f"\nnumpy vs faiss top-{report['k']} agreement: {report['engine_agreement_at_k']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency of the Retriever Agent's FAISS and NumPy search engines.")
+    parser.add_argument("--num-vectors", type=int, default=5_000) # A few days of market chunks
+    parser.add_argument("--dimension", type=int, default=768) # text-embedding-004 output size
+    parser.add_argument("--num-queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Optional path to also write the report as JSON.")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.num_vectors, args.dimension, args.num_queries, args.k, args.batch_size, args.seed)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
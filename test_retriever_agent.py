@@ -0,0 +1,1289 @@
+# test_retriever_agent.py
+
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from langchain_core.embeddings import Embeddings
+
+import agents.retrieval_agent as retrieval_agent
+from vector_store.embedding_backends import HashedNGramEmbeddings
+from vector_store.embedding_cache import EmbeddingCache
+from vector_store.embedding_pipeline import BatchEmbedder
+from vector_store.index_factory import index_type_of, quantization_of
+from vector_store.ingest_jobs import IngestJobQueue
+from vector_store.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+from vector_store.metadata_index import MetadataIndex
+from vector_store.mmap_snapshot import MmapDocstore
+from vector_store.query_cache import QueryEmbeddingCache
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic bag-of-words embeddings so the Retriever Agent can be exercised
+    without GOOGLE_API_KEY or network access.
+    """
+    dimension = 32
+
+    def __init__(self, model: str = "fake-embedding-model", google_api_key: str = None, **kwargs):
+        self.model = model
+        self.document_calls = []
+        self.query_calls = []
+
+    def _vector(self, text: str):
+        vector = [0.0] * self.dimension
+        for token in text.lower().split():
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            vector[digest[0] % self.dimension] += 1.0
+        norm = sum(v * v for v in vector) ** 0.5 or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts):
+        self.document_calls.append(list(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.query_calls.append(text)
+        return self._vector(text)
+
+
+def make_agent(tmp_path, monkeypatch, **overrides):
+    """Builds a RetrieverAgent backed by FakeEmbeddings and a temporary index directory."""
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.setattr(retrieval_agent, "GoogleGenerativeAIEmbeddings", FakeEmbeddings)
+    options = dict(
+        vector_store_path=str(tmp_path / "faiss_index"),
+        embed_batch_size=2,
+        embedding_cache_path=str(tmp_path / "embedding_cache.sqlite3"),
+        compaction_interval_seconds=None,
+    )
+    options.update(overrides)
+    return retrieval_agent.RetrieverAgent(**options)
+
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    """A RetrieverAgent backed by FakeEmbeddings and a temporary index directory."""
+    agent = make_agent(tmp_path, monkeypatch)
+    yield agent
+    agent.close()
+
+
+def test_batch_embedder_keeps_order_across_workers():
+    """
+    Batches finishing out of order must still produce vectors in input order.
+    """
+    class SlowFirstBatchEmbeddings(FakeEmbeddings):
+        def embed_documents(self, texts):
+            if texts[0] == "doc 0":
+                time.sleep(0.05)
+            return super().embed_documents(texts)
+
+    embeddings = SlowFirstBatchEmbeddings()
+    texts = [f"doc {i}" for i in range(10)]
+    embedder = BatchEmbedder(embeddings, batch_size=3, max_workers=4)
+
+    vectors = embedder.embed_documents(texts)
+
+    assert vectors == [embeddings._vector(t) for t in texts]
+    assert sorted(len(call) for call in embeddings.document_calls) == [1, 3, 3, 3]
+
+
+def test_batch_embedder_retries_failed_batches():
+    """
+    A transient failure is retried; a persistent one is raised after max_retries attempts.
+    """
+    class FlakyEmbeddings(FakeEmbeddings):
+        def __init__(self, failures):
+            super().__init__()
+            self.failures = failures
+            self.lock = threading.Lock()
+
+        def embed_documents(self, texts):
+            with self.lock:
+                if self.failures > 0:
+                    self.failures -= 1
+                    raise RuntimeError("503 Service Unavailable")
+            return super().embed_documents(texts)
+
+    embedder = BatchEmbedder(FlakyEmbeddings(failures=1), batch_size=2, max_workers=2, retry_backoff_seconds=0)
+    assert len(embedder.embed_documents(["a", "b", "c"])) == 3
+
+    embedder = BatchEmbedder(FlakyEmbeddings(failures=5), batch_size=2, max_workers=1, max_retries=2, retry_backoff_seconds=0)
+    with pytest.raises(RuntimeError):
+        embedder.embed_documents(["a", "b"])
+
+
+def test_index_documents_embeds_in_batches(agent):
+    """
+    index_documents sends documents to the embedding model in configured batch sizes.
+    """
+    agent.embeddings.document_calls.clear()
+    documents = [
+        "TSMC (TSM) closed at $150.00 on 2025-05-29.",
+        "Samsung Electronics (005930.KS) closed at $75000.00 on 2025-05-29.",
+        "Alibaba (BABA) closed at $80.00 on 2025-05-29.",
+    ]
+
+    indexed = agent.index_documents(documents, [{"symbol": "TSM"}, {"symbol": "005930.KS"}, {"symbol": "BABA"}])
+
+    assert indexed == 3
+    assert [len(call) for call in agent.embeddings.document_calls] == [2, 1]
+    assert agent.retrieve_top_k_chunks("TSMC TSM closed", k=1) == [documents[0]]
+
+
+def test_embedding_cache_lru_eviction_and_persistence(tmp_path):
+    """
+    The cache evicts least recently used entries above its cap and survives a reopen.
+    """
+    path = str(tmp_path / "cache.sqlite3")
+    cache = EmbeddingCache(path, max_entries=2)
+    cache.put_many("model-a", ["alpha", "beta"], [[1.0, 0.0], [0.0, 1.0]])
+    cache.get_many("model-a", ["alpha"])  # alpha is now more recent than beta
+    cache.put_many("model-a", ["gamma"], [[0.5, 0.5]])
+
+    assert cache.get_many("model-a", ["alpha", "beta", "gamma"]) == [[1.0, 0.0], None, [0.5, 0.5]]
+    assert cache.get_many("model-b", ["alpha"]) == [None]
+    assert cache.evictions == 1
+    cache.close()
+
+    reopened = EmbeddingCache(path, max_entries=2)
+    assert reopened.get_many("model-a", ["gamma"]) == [[0.5, 0.5]]
+    assert reopened.stats()["hits"] == 1
+
+
+def test_index_documents_skips_cached_embeddings(agent):
+    """
+    Re-indexing the same sentences is served from the embedding cache.
+    """
+    documents = ["TSMC (TSM) closed at $150.00 on 2025-05-29.", "Alibaba (BABA) closed at $80.00 on 2025-05-29."]
+    agent.index_documents(documents)
+    agent.embeddings.document_calls.clear()
+
+    agent.index_documents(documents + ["Tencent (TCEHY) closed at $45.00 on 2025-05-29."])
+
+    assert agent.embeddings.document_calls == [["Tencent (TCEHY) closed at $45.00 on 2025-05-29."]]
+    assert agent.embedding_cache.stats()["hits"] == 2
+
+
+def test_index_documents_upserts_by_stable_id(agent):
+    """
+    Re-indexing a price for the same type/symbol/date replaces the stored document.
+    """
+    metadata = {"type": "stock_price", "symbol": "TSM", "date": "2025-05-29"}
+    agent.index_documents(["TSMC (TSM) closed at $150.00 on 2025-05-29."], [metadata])
+    size_after_first_index = len(agent._float_vectors)
+
+    agent.index_documents(["TSMC (TSM) closed at $151.25 on 2025-05-29."], [dict(metadata)])
+
+    # The replaced vector is tombstoned until compaction physically drops it
+    assert len(agent.vectorstore.index_to_docstore_id) == size_after_first_index
+    agent.compact()
+    assert agent.vectorstore.index.ntotal == size_after_first_index
+    stored = agent.vectorstore.docstore.search("stock_price:TSM:2025-05-29")
+    assert stored.page_content == "TSMC (TSM) closed at $151.25 on 2025-05-29."
+
+
+def test_index_documents_explicit_ids_last_duplicate_wins(agent):
+    """
+    Explicit IDs take precedence, and a repeated ID within one request keeps the last document.
+    """
+    indexed = agent.index_documents(["first draft", "other note", "final draft"], ids=["note-1", "note-2", "note-1"])
+
+    assert indexed == 2
+    assert agent.vectorstore.docstore.search("note-1").page_content == "final draft"
+
+
+def test_write_ahead_log_recovery_and_compaction(agent, tmp_path):
+    """
+    Indexing only appends to the write-ahead log; a restart replays it, and compaction folds it into the snapshot.
+    """
+    # A new store writes no snapshot until its first compaction
+    pointer_path = tmp_path / "faiss_index" / "CURRENT"
+    agent.index_documents(["TSMC (TSM) closed at $150.00 on 2025-05-29."], ids=["tsm-price"])
+    agent.index_documents(["Tencent (TCEHY) closed at $45.00 on 2025-05-29."], ids=["tcehy-price"])
+    agent.delete_documents(["tcehy-price"])
+
+    assert not pointer_path.exists()
+    assert agent.write_ahead_log.record_count == 3
+
+    # Simulate a crash, which releases the writer lock: a second agent on the same path must recover from snapshot + log
+    agent._writer_lock.release()
+    recovered = retrieval_agent.RetrieverAgent(
+        vector_store_path=str(tmp_path / "faiss_index"),
+        embedding_cache_path=None,
+        compaction_interval_seconds=None,
+    )
+    recovered_ids = set(recovered.vectorstore.index_to_docstore_id.values())
+    assert "tsm-price" in recovered_ids and "tcehy-price" not in recovered_ids
+
+    assert recovered.compact() is True
+    assert pointer_path.exists()
+    assert recovered.write_ahead_log.record_count == 0
+    assert recovered.compact() is False
+    reloaded = retrieval_agent.RetrieverAgent(
+        vector_store_path=str(tmp_path / "faiss_index"),
+        embedding_cache_path=None,
+        compaction_interval_seconds=None,
+    )
+    assert set(reloaded.vectorstore.index_to_docstore_id.values()) == recovered_ids
+
+
+def test_compaction_writes_without_blocking_writes_and_keeps_few_tombstones(tmp_path, monkeypatch):
+    """
+    Writes go ahead while a compaction writes its snapshot and stay in the log it truncates. A few
+    deletions are written as tombstones rather than rebuilding the index; many of them are purged.
+    """
+    agent = make_agent(tmp_path, monkeypatch, tombstone_purge_fraction=0.5)
+    texts = [f"Company {i} (TICK{i}) closed at ${100 + i}.00 on 2025-05-29." for i in range(5)]
+    agent.index_documents(texts, ids=[f"price-{i}" for i in range(5)])
+    agent.delete_documents(["price-0"])
+
+    writing, release = threading.Event(), threading.Event()
+    original_write_snapshot = retrieval_agent.write_snapshot
+    def blocking_write_snapshot(*args, **kwargs):
+        writing.set()
+        assert release.wait(10)
+        return original_write_snapshot(*args, **kwargs)
+    monkeypatch.setattr(retrieval_agent, "write_snapshot", blocking_write_snapshot)
+    compaction = threading.Thread(target=agent.compact)
+    compaction.start()
+    assert writing.wait(10)
+    writer = threading.Thread(target=lambda: (
+        agent.index_documents(["Tencent (TCEHY) closed at $45.00 on 2025-05-29."], ids=["tcehy-price"]),
+        agent.delete_documents(["price-1"]),
+    ))
+    writer.start()
+    writer.join(5)
+    assert not writer.is_alive()
+    release.set()
+    compaction.join(10)
+
+    # The snapshot holds what was captured; the two writes made during it are still in the log
+    assert agent.write_ahead_log.record_count == 2
+    live_ids = {"price-2", "price-3", "price-4", "tcehy-price"}
+    assert set(agent._position_by_id) == live_ids
+    assert agent.vectorstore.docstore.search("tcehy-price").page_content.startswith("Tencent")
+    assert agent.retrieve_top_k_chunks("Tencent TCEHY closed", k=1) == ["Tencent (TCEHY) closed at $45.00 on 2025-05-29."]
+    agent.close()
+
+    # 2 of 6 vectors deleted is under the purge fraction: the snapshot keeps them as tombstones
+    restarted = make_agent(tmp_path, monkeypatch, tombstone_purge_fraction=0.5)
+    assert restarted.vectorstore.index.ntotal == 6
+    assert set(restarted._position_by_id) == live_ids
+    assert len(restarted._tombstones) == 2
+    assert "price-0" not in restarted.vectorstore.docstore
+
+    restarted.delete_documents(["price-2", "price-3"])
+    assert restarted.compact() is True
+    assert restarted.vectorstore.index.ntotal == 2 and not restarted._tombstones
+    assert set(restarted._position_by_id) == {"price-4", "tcehy-price"}
+    restarted.close()
+
+
+def test_one_writer_per_store_directory(tmp_path, monkeypatch):
+    """
+    Only the first agent on a directory writes; others serve it read-only, refuse writes with 409 and
+    pick up the writer's commits on refresh. A later agent takes over once the writer closes.
+    """
+    writer = make_agent(tmp_path, monkeypatch)
+    reader = make_agent(tmp_path, monkeypatch, embedding_cache_path=None, refresh_interval_seconds=None)
+    assert writer.is_writer and not reader.is_writer
+
+    with pytest.raises(HTTPException) as excinfo:
+        reader.index_documents(["Tencent (TCEHY) closed at $45.00 on 2025-05-29."], ids=["tcehy-price"])
+    assert excinfo.value.status_code == 409
+    with pytest.raises(HTTPException):
+        reader.delete_documents(["tsm-price"])
+    assert reader.compact() is False
+
+    writer.index_documents(["TSMC (TSM) closed at $150.00 on 2025-05-29."], ids=["tsm-price"])
+    assert reader.refresh() is True
+    assert reader.retrieve_top_k_chunks("TSMC closed", k=1) == ["TSMC (TSM) closed at $150.00 on 2025-05-29."]
+    writer.index_documents(["Tencent (TCEHY) closed at $45.00 on 2025-05-29."], ids=["tcehy-price"])
+    writer.compact()
+    assert reader.refresh() is True
+    assert set(reader._position_by_id) == {"tsm-price", "tcehy-price"}
+    assert reader.refresh() is False
+
+    writer.close()
+    successor = make_agent(tmp_path, monkeypatch, embedding_cache_path=None)
+    assert successor.is_writer
+    assert successor.delete_documents(["tcehy-price"]) == 1
+    successor.close()
+    reader.close()
+
+
+def test_reader_configured_differently_never_writes_snapshots(tmp_path, monkeypatch):
+    """
+    A read-only worker configured for another index type serves the stored index as it is instead of
+    rebuilding it and replacing the writer's snapshot, also when refreshing.
+    """
+    pointer_path = tmp_path / "faiss_index" / "CURRENT"
+    writer = make_agent(tmp_path, monkeypatch)
+    reader = None
+    try:
+        writer.index_documents(["TSMC (TSM) closed at $150.00 on 2025-05-29."], ids=["tsm-price"])
+        writer.compact()
+        snapshot = pointer_path.read_text()
+
+        reader = make_agent(tmp_path, monkeypatch, embedding_cache_path=None, refresh_interval_seconds=None, index_type="hnsw")
+        assert not reader.is_writer and reader.index_type == "flat"
+        assert index_type_of(reader.vectorstore.index) == "flat"
+        assert pointer_path.read_text() == snapshot
+
+        writer.index_documents(["Tencent (TCEHY) closed at $45.00 on 2025-05-29."], ids=["tcehy-price"])
+        writer.compact()
+        snapshot = pointer_path.read_text()
+        assert reader.refresh() is True
+        assert pointer_path.read_text() == snapshot
+        assert reader.retrieve_top_k_chunks("Tencent closed", k=1) == ["Tencent (TCEHY) closed at $45.00 on 2025-05-29."]
+    finally:
+        writer.close()
+        if reader is not None:
+            reader.close()
+
+
+def test_metadata_index_candidates():
+    """
+    Filters AND across keys and OR across the values given for one key.
+    """
+    index = MetadataIndex()
+    index.add("a", {"type": "earnings_surprise", "symbol": "TSM"})
+    index.add("b", {"type": "stock_price", "symbol": "TSM"})
+    index.add("c", {"type": "earnings_surprise", "symbol": "005930.KS"})
+
+    assert index.candidates({"type": "earnings_surprise", "symbol": "TSM"}) == {"a"}
+    assert index.candidates({"type": "earnings_surprise", "symbol": ["TSM", "005930.KS"]}) == {"a", "c"}
+    assert index.candidates({"symbol": "BABA"}) == set()
+
+    index.add("a", {"type": "stock_price", "symbol": "TSM"})
+    index.remove("b")
+    assert index.candidates({"type": "stock_price"}) == {"a"}
+
+
+@pytest.mark.parametrize("brute_force_max", [4096, 0])
+def test_retrieve_with_metadata_filters(agent, monkeypatch, brute_force_max):
+    """
+    Filtered retrieval only returns matching documents, via both the direct-scoring and FAISS selector paths.
+    """
+    monkeypatch.setattr(retrieval_agent, "FILTER_BRUTE_FORCE_MAX_CANDIDATES", brute_force_max)
+    agent.index_documents(
+        [
+            "TSMC (TSM) closed at $150.00 on 2025-05-29.",
+            "TSMC (TSM) reported earnings with an actual EPS of 1.55 vs estimated 1.49.",
+            "Samsung Electronics (005930.KS) reported earnings with an actual EPS of 1.20 vs estimated 1.22.",
+        ],
+        [
+            {"type": "stock_price", "symbol": "TSM", "date": "2025-05-29"},
+            {"type": "earnings_surprise", "symbol": "TSM", "date": "2025-04-25"},
+            {"type": "earnings_surprise", "symbol": "005930.KS", "date": "2025-04-30"},
+        ],
+    )
+
+    chunks = agent.retrieve_top_k_chunks("TSMC closed", k=5, filters={"type": "earnings_surprise", "symbol": "TSM"})
+    assert chunks == ["TSMC (TSM) reported earnings with an actual EPS of 1.55 vs estimated 1.49."]
+
+    chunks = agent.retrieve_top_k_chunks("earnings", k=5, filters={"type": "earnings_surprise"})
+    assert len(chunks) == 2
+    assert agent.retrieve_top_k_chunks("earnings", k=5, filters={"symbol": "BABA"}) == []
+
+
+def test_retrieve_batch_matches_single_queries(agent):
+    """
+    Batch retrieval embeds all queries in one call and returns the same chunks as per-query retrieval.
+    """
+    agent.index_documents(
+        [
+            "TSMC (TSM) closed at $150.00 on 2025-05-29.",
+            "Samsung Electronics (005930.KS) closed at $75000.00 on 2025-05-29.",
+            "Alibaba (BABA) closed at $80.00 on 2025-05-29.",
+        ],
+        [{"symbol": "TSM"}, {"symbol": "005930.KS"}, {"symbol": "BABA"}],
+    )
+    queries = ["TSMC price", "Samsung Electronics price", "Alibaba price"]
+    agent.embeddings.document_calls.clear()
+
+    results = agent.retrieve_top_k_chunks_batch(queries, k=2)
+
+    assert agent.embeddings.document_calls == [queries]
+    assert results == [agent.retrieve_top_k_chunks(query, k=2) for query in queries]
+
+    filtered = agent.retrieve_top_k_chunks_batch(queries, k=2, filters={"symbol": ["TSM", "BABA"]})
+    assert filtered == [agent.retrieve_top_k_chunks(query, k=2, filters={"symbol": ["TSM", "BABA"]}) for query in queries]
+
+
+def test_query_embedding_cache_lru_and_ttl(monkeypatch):
+    """
+    Entries expire after the TTL and the least recently used entry is evicted when full.
+    """
+    now = [100.0]
+    monkeypatch.setattr("vector_store.query_cache.time.monotonic", lambda: now[0])
+    cache = QueryEmbeddingCache(max_entries=2, ttl_seconds=60)
+    cache.put("q1", [1.0])
+    cache.put("q2", [2.0])
+    assert cache.get("q1") == [1.0]
+    cache.put("q3", [3.0])  # evicts q2, the least recently used
+
+    assert cache.get("q2") is None
+    now[0] += 61
+    assert cache.get("q1") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["evictions"]) == (1, 2, 1, 1)
+
+
+def test_repeated_query_skips_embedding_call(agent):
+    """
+    A repeated query is answered with the cached query embedding.
+    """
+    agent.index_documents(["TSMC (TSM) closed at $150.00 on 2025-05-29."])
+    query = "What's our risk exposure in Asia tech stocks today?"
+
+    first = agent.retrieve_top_k_chunks(query, k=1)
+    second = agent.retrieve_top_k_chunks(query, k=1)
+    agent.retrieve_top_k_chunks_batch([query, "Alibaba price"], k=1)
+
+    assert first == second
+    assert agent.embeddings.query_calls == [query, "Alibaba price"]
+    assert agent.query_cache.stats()["hits"] == 2
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_upserts_and_search_for_each_index_type(tmp_path, monkeypatch, index_type):
+    """
+    Replaced documents never show up in results, before or after compaction, for every index type.
+    """
+    agent = make_agent(tmp_path, monkeypatch, index_type=index_type, ivf_nlist=4)
+    agent.index_documents([f"filler note number {i} about markets" for i in range(200)])
+    agent.rebuild_index()
+    assert index_type_of(agent.vectorstore.index) == index_type
+
+    metadata = {"type": "stock_price", "symbol": "TSM", "date": "2025-05-29"}
+    agent.index_documents(["TSMC TSM closed at 150.00"], [metadata])
+    agent.index_documents(["TSMC TSM closed at 151.25"], [dict(metadata)])
+
+    for _ in range(2):
+        chunks = agent.retrieve_top_k_chunks("TSMC TSM closed at", k=3)
+        assert "TSMC TSM closed at 151.25" in chunks
+        assert "TSMC TSM closed at 150.00" not in chunks
+        agent.compact()
+    agent.close()
+
+
+def test_configured_index_type_is_applied_on_restart(tmp_path, monkeypatch):
+    """
+    A snapshot written as a flat index is rebuilt as HNSW when the agent restarts configured for HNSW.
+    """
+    agent = make_agent(tmp_path, monkeypatch)
+    agent.index_documents(["TSMC (TSM) closed at $150.00 on 2025-05-29."], ids=["tsm-price"])
+    agent.close()
+
+    restarted = make_agent(tmp_path, monkeypatch, index_type="hnsw", hnsw_ef_search=128)
+
+    assert index_type_of(restarted.vectorstore.index) == "hnsw"
+    assert restarted.vectorstore.index.hnsw.efSearch == 128
+    assert restarted.retrieve_top_k_chunks("TSMC closed", k=1) == ["TSMC (TSM) closed at $150.00 on 2025-05-29."]
+    with pytest.raises(ValueError):
+        restarted.rebuild_index("annoy")
+    restarted.close()
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_snapshot_is_memory_mapped_and_copied_on_merge(tmp_path, monkeypatch, index_type):
+    """
+    A restarted agent serves reads from the mapped snapshot; writes are searched exactly next to it and
+    the index is only copied into memory when they are merged into it.
+    """
+    agent = make_agent(tmp_path, monkeypatch, index_type=index_type, ivf_nlist=4)
+    agent.index_documents([f"filler note number {i} about markets" for i in range(200)])
+    agent.index_documents(["TSMC (TSM) closed at $150.00 on 2025-05-29."], [{"type": "stock_price", "symbol": "TSM"}], ids=["tsm-price"])
+    agent.rebuild_index()
+    agent.close()
+
+    restarted = make_agent(tmp_path, monkeypatch, index_type=index_type, ivf_nlist=4, max_unindexed_vectors=2)
+    assert restarted._index_is_mapped
+    assert isinstance(restarted.vectorstore.docstore, MmapDocstore)
+    assert restarted.retrieve_top_k_chunks("TSMC closed", k=1, filters={"symbol": "TSM"}) == ["TSMC (TSM) closed at $150.00 on 2025-05-29."]
+
+    restarted.delete_documents(["tsm-price"])
+    restarted.index_documents(["Tencent (TCEHY) closed at $45.00 on 2025-05-29."], ids=["tcehy-price"])
+    assert restarted._index_is_mapped
+    assert restarted.retrieve_top_k_chunks("Tencent closed", k=1) == ["Tencent (TCEHY) closed at $45.00 on 2025-05-29."]
+    restarted.index_documents(["Alibaba (BABA) closed at $80.00 on 2025-05-29."], ids=["baba-price"])
+    assert not restarted._index_is_mapped
+    assert restarted._view.indexed_count == restarted._view.count
+    assert restarted.retrieve_top_k_chunks("Tencent closed", k=1) == ["Tencent (TCEHY) closed at $45.00 on 2025-05-29."]
+    restarted.close()
+
+    reopened = make_agent(tmp_path, monkeypatch, index_type=index_type, ivf_nlist=4)
+    ids = set(reopened.vectorstore.index_to_docstore_id.values())
+    assert "tcehy-price" in ids and "tsm-price" not in ids
+    assert len([name for name in os.listdir(tmp_path / "faiss_index") if name.startswith("snapshot-")]) == 1
+
+
+@pytest.mark.parametrize("index_type,quantization", [("flat", "sq8"), ("flat", "pq"), ("ivf", "pq"), ("hnsw", "sq8")])
+def test_quantized_index_reranks_with_exact_distances(tmp_path, monkeypatch, index_type, quantization):
+    """
+    Quantized indexes shrink the stored codes, and re-ranking restores the exact float distances of the top hits.
+    """
+    agent = make_agent(tmp_path, monkeypatch, index_type=index_type, ivf_nlist=4, pq_m=8, quantization=quantization)
+    agent.index_documents([f"market note {i} sector{i % 23} region{i % 7} desk{i % 11}" for i in range(300)])
+    agent.index_documents(["TSMC (TSM) closed at $150.00 on 2025-05-29."], ids=["tsm-price"])
+    result = agent.rebuild_index()
+    assert result["quantization"] == quantization
+    assert quantization_of(agent.vectorstore.index) == quantization
+
+    query_vector = agent.embeddings.embed_query("TSMC (TSM) closed at")
+    hits = agent._search_by_vectors([query_vector], k=3)[0]
+    stored = agent._float_vectors.get(agent._positions_for_ids(["tsm-price"]))[0]
+    assert hits[0][0].page_content == "TSMC (TSM) closed at $150.00 on 2025-05-29."
+    assert hits[0][1] == pytest.approx(float(((np.asarray(query_vector) - stored) ** 2).sum()), rel=1e-4)
+    assert [distance for _, distance in hits] == sorted(distance for _, distance in hits)
+
+    # A replacement tombstones the old position; IndexPQ takes no selector, so it must be dropped after the search
+    agent.index_documents(["TSMC (TSM) closed at $152.00 on 2025-05-29."], ids=["tsm-price"])
+    assert agent._view.tombstones
+    chunks = agent.retrieve_top_k_chunks("TSMC (TSM) closed at", k=3)
+    assert "TSMC (TSM) closed at $150.00 on 2025-05-29." not in chunks
+    agent.delete_documents(["tsm-price"])
+    assert not any("TSMC" in chunk for chunk in agent.retrieve_top_k_chunks("TSMC (TSM) closed at", k=3))
+
+    # Large filtered searches restrict the index search to the matching positions
+    monkeypatch.setattr(retrieval_agent, "FILTER_BRUTE_FORCE_MAX_CANDIDATES", 0)
+    agent.index_documents([f"desk{i} TSMC (TSM) closed at ${140 + i}.00." for i in range(5)], [{"type": "stock_price"}] * 5)
+    agent.rebuild_index()
+    filtered = agent.retrieve_top_k_chunks("market note sector1 TSMC closed", k=3, filters={"type": "stock_price"})
+    assert len(filtered) == 3 and all("TSMC (TSM) closed" in chunk for chunk in filtered)
+    agent.close()
+
+    restarted = make_agent(tmp_path, monkeypatch, index_type=index_type, ivf_nlist=4, pq_m=8, quantization=quantization)
+    assert quantization_of(restarted.vectorstore.index) == quantization
+    assert "TSMC (TSM) closed at" in restarted.retrieve_top_k_chunks("TSMC (TSM) closed at", k=1)[0]
+    with pytest.raises(ValueError):
+        restarted.rebuild_index(quantization="fp4")
+    restarted.close()
+
+
+def test_time_partitioned_shards_window_and_retention(tmp_path, monkeypatch):
+    """
+    Documents land in per-day shards, date windows only search the shards they cover, and expired shards are dropped whole.
+    """
+    agent = make_agent(tmp_path, monkeypatch, partition_by="day", retention_days=30)
+    today = datetime.date.today()
+    days = [(today - datetime.timedelta(days=offset)).isoformat() for offset in (0, 1, 2)]
+    agent.index_documents(
+        [f"TSMC (TSM) closed at ${150 + offset}.00 on {day}." for offset, day in enumerate(days)] + ["TSMC desk notes"],
+        [{"type": "stock_price", "symbol": "TSM", "date": day} for day in days] + [{"type": "note"}],
+    )
+    old_day = (today - datetime.timedelta(days=90)).isoformat()
+    assert agent.index_documents(["TSMC (TSM) closed at $90.00."], [{"type": "stock_price", "symbol": "TSM", "date": old_day}]) == 0
+    assert sorted(agent._shards) == sorted(days + ["undated"])
+
+    everything = agent.retrieve_top_k_chunks("TSMC (TSM) closed at", k=10, filters={"symbol": "TSM"})
+    assert len(everything) == 3
+    window = agent.retrieve_top_k_chunks("TSMC (TSM) closed at", k=10, filters={"symbol": "TSM"},
+                                         date_from=today - datetime.timedelta(days=1), date_to=today)
+    assert sorted(window) == sorted(f"TSMC (TSM) closed at ${150 + offset}.00 on {days[offset]}." for offset in (0, 1))
+
+    (tmp_path / "weekly").mkdir()
+    week_agent = make_agent(tmp_path / "weekly", monkeypatch, partition_by="week")
+    week_agent.index_documents(["Mon note", "Wed note"], [{"date": "2025-05-26"}, {"date": "2025-05-28"}])
+    assert list(week_agent._shards) == ["2025-W22"]
+    assert week_agent.retrieve_top_k_chunks("note", k=5, date_from=datetime.date(2025, 5, 27)) == ["Wed note"]
+    week_agent.close()
+
+    agent.delete_documents([agent.make_document_id({"type": "stock_price", "symbol": "TSM", "date": days[2]})])
+    dropped = agent.drop_expired_shards(today=today + datetime.timedelta(days=29))
+    assert dropped == [days[2]]
+    assert not os.path.exists(tmp_path / "faiss_index" / "shards" / days[2])
+    agent.close()
+
+    restarted = make_agent(tmp_path, monkeypatch, partition_by="day", retention_days=30)
+    assert sorted(restarted._shards) == sorted(days[:2] + ["undated"])
+    assert len(restarted.retrieve_top_k_chunks("TSMC (TSM) closed at", k=10, filters={"symbol": "TSM"})) == 2
+    restarted.close()
+
+
+def test_bm25_keeps_tickers_whole_and_normalizes_scores():
+    index = BM25Index()
+    index.add("samsung", "Samsung Electronics (005930.KS) closed at 56,000 KRW.")
+    index.add("tsmc", "TSMC (2330.TW) closed at 950 TWD.")
+    index.add("note", "Asia tech stocks closed mixed.")
+
+    assert tokenize("Samsung (005930.KS) on 2025-05-29") == ["samsung", "005930.ks", "2025-05-29"]
+    hits = index.search("What did 005930.KS close at?", k=3)
+    assert hits[0][0] == "samsung" and hits[0][1] > 0.8
+    assert {doc_id for doc_id, _ in index.search("closed", k=3, allowed={"tsmc", "note"})} == {"tsmc", "note"}
+    index.remove("samsung")
+    assert index.search("005930.KS", k=3) == []
+    assert [key for key, _ in reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=2)] == ["a", "c"]
+
+
+def test_lexical_and_hybrid_retrieval_modes(agent):
+    """
+    Ticker lookups are answered from BM25 without an embedding call in lexical and auto modes; hybrid fuses both engines.
+    """
+    agent.index_documents(
+        ["Samsung Electronics (005930.KS) closed at 56,000 KRW.", "TSMC (2330.TW) closed at 950 TWD.",
+         "Asia tech stocks closed mixed on chip demand."],
+        [{"type": "stock_price", "symbol": "005930.KS"}, {"type": "stock_price", "symbol": "2330.TW"}, {"type": "news"}],
+    )
+    agent.embeddings.query_calls.clear()
+
+    assert agent.retrieve_top_k_chunks("005930.KS price", k=1, mode="lexical") == ["Samsung Electronics (005930.KS) closed at 56,000 KRW."]
+    assert agent.retrieve_top_k_chunks("2330.TW", k=1, mode="auto") == ["TSMC (2330.TW) closed at 950 TWD."]
+    assert agent.embeddings.query_calls == []
+
+    # "closed" appears everywhere, so auto mode is not confident and falls back to hybrid retrieval
+    hybrid = agent.retrieve_top_k_chunks("closed", k=3, mode="auto", filters={"type": "stock_price"})
+    assert agent.embeddings.query_calls == ["closed"]
+    assert sorted(hybrid) == ["Samsung Electronics (005930.KS) closed at 56,000 KRW.", "TSMC (2330.TW) closed at 950 TWD."]
+
+    # Appending a document keeps the BM25 index current
+    agent.index_documents(["SK Hynix (000660.KS) closed at 180,000 KRW."], [{"type": "stock_price", "symbol": "000660.KS"}])
+    assert agent.retrieve_top_k_chunks_batch(["000660.KS", "005930.KS"], k=1, mode="lexical") == [
+        ["SK Hynix (000660.KS) closed at 180,000 KRW."], ["Samsung Electronics (005930.KS) closed at 56,000 KRW."],
+    ]
+    with pytest.raises(HTTPException) as excinfo:
+        agent.retrieve_top_k_chunks("005930.KS", mode="keyword")
+    assert excinfo.value.status_code == 400
+
+
+def test_hashed_embeddings_are_deterministic_and_batch_consistent():
+    embeddings = HashedNGramEmbeddings(dimension=64)
+    texts = ["Samsung (005930.KS) closed at 56,000 KRW.", "Samsung 005930.KS price", "Gold futures fell", ""]
+    batch = np.asarray(embeddings.embed_documents(texts))
+
+    assert batch.shape == (4, 64)
+    assert np.allclose(batch[1], embeddings.embed_query(texts[1]), atol=1e-6)
+    assert np.allclose(batch, HashedNGramEmbeddings(dimension=64).embed_documents(texts))
+    assert np.allclose(np.linalg.norm(batch[:3], axis=1), 1.0, atol=1e-5) and not batch[3].any()
+    assert batch[0] @ batch[1] > batch[0] @ batch[2]
+
+
+def test_local_embedding_backend_runs_without_api_key(tmp_path, monkeypatch):
+    """
+    The hashed backend needs neither GOOGLE_API_KEY nor the Google client, and a store built with it
+    refuses to open with a model of another dimension.
+    """
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    monkeypatch.setattr(retrieval_agent, "GoogleGenerativeAIEmbeddings", None)
+    agent = retrieval_agent.RetrieverAgent(
+        vector_store_path=str(tmp_path / "faiss_index"), embedding_backend="hashed", embedding_dimension=128,
+        embedding_cache_path=None, compaction_interval_seconds=None,
+    )
+    agent.index_documents(["Samsung Electronics (005930.KS) closed at 56,000 KRW.", "Gold futures fell 1%."])
+    assert agent.retrieve_top_k_chunks("Samsung 005930.KS", k=1) == ["Samsung Electronics (005930.KS) closed at 56,000 KRW."]
+    agent.close()
+
+    with pytest.raises(ValueError):
+        retrieval_agent.RetrieverAgent(
+            vector_store_path=str(tmp_path / "faiss_index"), embedding_backend="hashed", embedding_dimension=256,
+            embedding_cache_path=None, compaction_interval_seconds=None,
+        )
+
+
+def wait_for_job(agent, job_id):
+    future = agent.ingest_jobs.future(job_id)
+    if future is not None:
+        future.result(timeout=10)
+
+
+def test_ingest_job_runs_in_background_while_retrieval_continues(tmp_path, monkeypatch):
+    agent = make_agent(tmp_path, monkeypatch, embedding_cache_path=None, ingest_batch_size=2)
+    try:
+        agent.index_documents(["TSMC (TSM) closed at 180"], [{"type": "stock_price", "symbol": "TSM", "date": "2025-05-29"}])
+        release = threading.Event()
+        embed_documents = agent.embeddings.embed_documents
+
+        def blocking_embed_documents(texts, **kwargs):
+            release.wait(5)
+            return embed_documents(texts, **kwargs)
+
+        monkeypatch.setattr(agent.embeddings, "embed_documents", blocking_embed_documents)
+        job = agent.submit_index_job(
+            [f"Samsung note {i}" for i in range(5)],
+            [{"type": "news", "symbol": "005930.KS", "date": f"2025-05-2{i}"} for i in range(5)],
+        )
+        assert job["status"] == "queued" and job["document_count"] == 5
+
+        deadline = time.monotonic() + 5
+        while agent.get_index_job(job["job_id"])["status"] == "queued" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert agent.get_index_job(job["job_id"])["status"] == "running"
+
+        # The job is stuck embedding; searches are not blocked behind it
+        start = time.perf_counter()
+        assert agent.retrieve_top_k_chunks("TSMC (TSM) closed at", k=1) == ["TSMC (TSM) closed at 180"]
+        assert time.perf_counter() - start < 2
+
+        release.set()
+        wait_for_job(agent, job["job_id"])
+        status = agent.get_index_job(job["job_id"])
+        assert status["status"] == "succeeded"
+        assert status["indexed_count"] == status["processed_count"] == 5 and status["progress"] == 1.0
+        assert agent.retrieve_top_k_chunks("Samsung note 3", k=1, filters={"symbol": "005930.KS"}) == ["Samsung note 3"]
+
+        def failing_embed_documents(texts, **kwargs):
+            raise RuntimeError("quota exceeded")
+
+        monkeypatch.setattr(agent.embeddings, "embed_documents", failing_embed_documents)
+        failed = agent.submit_index_job(["doomed"])
+        wait_for_job(agent, failed["job_id"])
+        failed = agent.get_index_job(failed["job_id"])
+        assert failed["status"] == "failed" and "quota exceeded" in failed["error"]
+
+        with pytest.raises(HTTPException) as missing:
+            agent.get_index_job("no-such-job")
+        assert missing.value.status_code == 404
+        with pytest.raises(HTTPException) as mismatch:
+            agent.submit_index_job(["a", "b"], [{}])
+        assert mismatch.value.status_code == 400
+    finally:
+        agent.close()
+
+
+def test_searches_read_an_isolated_snapshot_while_writes_continue(tmp_path, monkeypatch):
+    """
+    A published view keeps answering from its own state after later writes, and concurrent searches
+    during a stream of replacements always see exactly one complete version of a document.
+    """
+    agent = make_agent(tmp_path, monkeypatch, embedding_cache_path=None, max_unindexed_vectors=3)
+    try:
+        metadata = {"type": "stock_price", "symbol": "TSM", "date": "2025-05-29"}
+        agent.index_documents([f"filler note number {i} about markets" for i in range(10)])
+        agent.index_documents(["TSMC TSM closed at 150.00"], [metadata])
+        query_vector = agent.embeddings.embed_query("TSMC TSM closed at")
+        old_view = agent._view
+        old_index_size = old_view.index.ntotal
+
+        agent.index_documents(["TSMC TSM closed at 151.25"], [dict(metadata)])
+        agent.index_documents([f"extra note {i}" for i in range(5)])
+        assert agent._view.generation > old_view.generation
+        assert old_view.index.ntotal == old_index_size
+        old_hits = agent._search_view(old_view, [query_vector], 1, None, None, None, None, None)[0]
+        assert [doc.page_content for doc, _ in old_hits] == ["TSMC TSM closed at 150.00"]
+        assert agent.retrieve_top_k_chunks("TSMC TSM closed at", k=1) == ["TSMC TSM closed at 151.25"]
+
+        versions = {f"TSMC TSM closed at {price}.00" for price in range(200, 260)}
+        errors, seen = [], []
+        stop = threading.Event()
+
+        def search_loop():
+            try:
+                while not stop.is_set():
+                    chunks = agent.retrieve_top_k_chunks("TSMC TSM closed at", k=1, filters={"symbol": "TSM"})
+                    seen.append(chunks)
+            except Exception as e:
+                errors.append(e)
+
+        readers = [threading.Thread(target=search_loop) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for price in range(200, 260):
+            agent.index_documents([f"TSMC TSM closed at {price}.00"], [dict(metadata)])
+            if price % 20 == 0:
+                agent.compact()
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+        assert not errors
+        assert seen and all(len(chunks) <= 1 for chunks in seen)
+        assert all(chunks[0] in versions | {"TSMC TSM closed at 151.25"} for chunks in seen if chunks)
+        assert agent.retrieve_top_k_chunks("TSMC TSM closed at", k=1) == ["TSMC TSM closed at 259.00"]
+    finally:
+        agent.close()
+
+
+def test_scored_retrieval_stops_at_min_score_and_budget(agent):
+    """
+    Chunks come back with scores and metadata, best first; collection stops at the first chunk below
+    min_score or past the text budget.
+    """
+    agent.index_documents(
+        ["Apple shares rose after strong iPhone sales.", "Apple iPhone sales beat estimates.", "Oil prices fell on weak demand."],
+        [{"type": "news", "symbol": "AAPL"}, {"type": "news", "symbol": "AAPL"}, {"type": "news", "symbol": "XOM"}],
+    )
+    scored = agent.retrieve_scored_chunks("Apple iPhone sales", k=3)
+    assert [chunk["metadata"]["symbol"] for chunk in scored[:2]] == ["AAPL", "AAPL"]
+    scores = [chunk["score"] for chunk in scored]
+    assert scores == sorted(scores, reverse=True) and scores[0] <= 1.0
+
+    threshold = (scores[1] + scores[2]) / 2
+    assert [chunk["text"] for chunk in agent.retrieve_scored_chunks("Apple iPhone sales", k=3, min_score=threshold)] == \
+        [chunk["text"] for chunk in scored[:2]]
+    first_length = len(scored[0]["text"])
+    assert agent.retrieve_top_k_chunks("Apple iPhone sales", k=3, max_chars=first_length + 5) == [scored[0]["text"]]
+    assert agent.retrieve_top_k_chunks("Apple iPhone sales", k=3, max_tokens=1) == []
+
+    lexical = agent.retrieve_scored_chunks_batch(["iPhone", "oil"], k=1, mode="lexical")
+    assert [chunks[0]["metadata"]["symbol"] for chunks in lexical] == ["AAPL", "XOM"]
+    hybrid = agent.retrieve_scored_chunks("Apple iPhone sales", k=1, mode="hybrid")
+    assert 0.0 < hybrid[0]["score"] <= 1.0
+
+
+def test_mmr_diversifies_near_duplicate_chunks(agent):
+    """
+    With mmr_lambda, a near-duplicate of the best chunk gives way to a different relevant one.
+    """
+    agent.index_documents([
+        "TSMC earnings surprise beat estimates by 4%.",
+        "TSMC earnings surprise beat estimates by 4% again.",
+        "Samsung earnings surprise missed estimates by 2%.",
+    ], [{"type": "earnings_surprise"}] * 3)
+    earnings = {"type": "earnings_surprise"}
+    assert agent.retrieve_top_k_chunks("TSMC earnings surprise estimates", k=2)[1] == "TSMC earnings surprise beat estimates by 4% again."
+    diverse = agent.retrieve_top_k_chunks("TSMC earnings surprise estimates", k=2, filters=earnings, mmr_lambda=0.5)
+    assert diverse == ["TSMC earnings surprise beat estimates by 4%.", "Samsung earnings surprise missed estimates by 2%."]
+    assert agent.retrieve_top_k_chunks("TSMC earnings surprise estimates", k=2, mmr_lambda=1.0) == \
+        agent.retrieve_top_k_chunks("TSMC earnings surprise estimates", k=2)
+    assert len(agent.retrieve_top_k_chunks_batch(["TSMC earnings", "Samsung"], k=2, mode="hybrid", mmr_lambda=0.5)[0]) == 2
+
+    # A score floor applies to the candidates, not to the pick order: the weaker Samsung chunk picked second
+    # must not cut off the stronger near-duplicate picked after it
+    scores = [chunk["score"] for chunk in agent.retrieve_scored_chunks("TSMC earnings surprise estimates", k=3)]
+    floor = (scores[1] + scores[2]) / 2
+    assert agent.retrieve_top_k_chunks("TSMC earnings surprise estimates", k=3, mmr_lambda=0.5, min_score=floor) == [
+        "TSMC earnings surprise beat estimates by 4%.", "TSMC earnings surprise beat estimates by 4% again.",
+    ]
+    with pytest.raises(HTTPException) as excinfo:
+        agent.retrieve_top_k_chunks("TSMC", mmr_lambda=1.5)
+    assert excinfo.value.status_code == 400
+
+
+def test_reranker_promotes_symbol_and_term_matches(agent):
+    """
+    The re-ranker re-scores an over-fetched pool, so the chunk naming the queried ticker wins; with no
+    time budget left, candidates keep their retrieval order.
+    """
+    from vector_store.reranker import TermOverlapReranker, rerank_hits
+
+    agent.index_documents(
+        ["Chip maker results beat estimates on strong demand.", "Quarterly results for TSM: revenue beat estimates."],
+        [{"type": "news", "symbol": "NVDA"}, {"type": "news", "symbol": "TSM"}],
+    )
+    reranked = agent.retrieve_scored_chunks("TSM results beat estimates", k=1, rerank=True)
+    assert reranked[0]["metadata"]["symbol"] == "TSM"
+    assert 0.0 < reranked[0]["score"] <= 1.0
+
+    hits = agent._retrieve(["TSM results"], 3, None, None, None, "dense")[0]
+    assert rerank_hits(TermOverlapReranker(), ["TSM results"], [hits], batch_size=1, budget_seconds=-1.0) == [hits]
+
+    class SlowLowReranker:
+        def score_batch(self, query, documents, retrieval_scores):
+            time.sleep(0.02)
+            return np.zeros(len(documents), dtype=np.float32)
+
+    # Only the first candidate is re-scored (to 0) before the budget runs out; results stay best first by
+    # final score, so a score floor drops that candidate instead of everything after it
+    agent.index_documents(["TSM results were in line with estimates."], [{"type": "news", "symbol": "TSM", "date": "2025-05-29"}])
+    agent.reranker, agent.rerank_batch_size, agent.rerank_budget_ms = SlowLowReranker(), 1, 1.0
+    chunks = agent.retrieve_scored_chunks("TSM results beat estimates", k=2, rerank=True, min_score=0.01)
+    assert len(chunks) == 2 and chunks[0]["score"] >= chunks[1]["score"] > 0.0
+
+
+def test_empty_store_starts_without_embedding_calls(tmp_path, monkeypatch):
+    """
+    A new store is an empty index of the model's dimension: startup embeds nothing, searches return
+    nothing, and the configured index is built once vectors are merged.
+    """
+    agent = make_agent(tmp_path, monkeypatch, index_type="hnsw", max_unindexed_vectors=2)
+    try:
+        assert agent.embeddings.document_calls == [] and agent.embeddings.query_calls == []
+        assert agent.vectorstore.index.ntotal == 0 and agent.vectorstore.index.d == FakeEmbeddings.dimension
+        assert agent.retrieve_top_k_chunks("anything", k=3) == []
+
+        agent.index_documents(["TSMC closed higher.", "Samsung closed lower."])
+        assert index_type_of(agent.vectorstore.index) == "hnsw"
+        assert agent.retrieve_top_k_chunks("TSMC closed higher", k=5) == ["TSMC closed higher.", "Samsung closed lower."]
+    finally:
+        agent.close()
+
+
+def test_numpy_search_engine_matches_faiss(tmp_path, monkeypatch):
+    """
+    The NumPy engine returns the same results as FAISS, including after replacements, deletes and compaction.
+    """
+    documents = ["TSMC closed higher on chip demand.", "Samsung closed lower.", "Oil rose on supply cuts.",
+                 "Gold held steady.", "Yen weakened against the dollar."]
+    metadata = [{"type": "stock_price"}, {"type": "stock_price"}, {"type": "news"}, {"type": "news"}, {"type": "news"}]
+    agents = [make_agent(tmp_path, monkeypatch, vector_store_path=str(tmp_path / engine), search_engine=engine)
+              for engine in ("faiss", "numpy")]
+    try:
+        for agent in agents:
+            agent.index_documents(documents, metadata, ids=[f"doc-{i}" for i in range(len(documents))])
+            agent.index_documents(["TSMC closed sharply higher."], [{"type": "stock_price"}], ids=["doc-0"])
+            agent.delete_documents(["doc-3"])
+        def scores(agent, **options):
+            # Scores only: bag-of-words embeddings tie often, and engines may order ties differently
+            return [chunk["score"] for chunks in agent.retrieve_scored_chunks_batch(queries, **options) for chunk in chunks]
+
+        queries = ["TSMC closed higher", "oil supply", "gold"]
+        expected = agents[0].retrieve_top_k_chunks_batch(queries, k=1)
+        assert agents[1].retrieve_top_k_chunks_batch(queries, k=1) == expected
+        assert expected[2] != ["Gold held steady."]
+        assert scores(agents[1], k=4) == pytest.approx(scores(agents[0], k=4), abs=1e-5)
+        assert scores(agents[1], k=4, filters={"type": "stock_price"}) == \
+            pytest.approx(scores(agents[0], k=4, filters={"type": "stock_price"}), abs=1e-5)
+
+        agents[1].compact()
+        assert scores(agents[1], k=4) == pytest.approx(scores(agents[0], k=4), abs=1e-5)
+        with pytest.raises(ValueError):
+            make_agent(tmp_path, monkeypatch, vector_store_path=str(tmp_path / "other"), search_engine="annoy")
+    finally:
+        for agent in agents:
+            agent.close()
+
+
+def test_long_documents_are_chunked_with_parent_context(tmp_path, monkeypatch):
+    """
+    Long documents are indexed as sentence-aligned chunks of their parent ID; re-indexing a shorter
+    version drops the extra chunks, and retrieval can return the chunk's surrounding text.
+    """
+    agent = make_agent(tmp_path, monkeypatch, chunk_size=80, chunk_overlap=30, parent_context_chunks=1)
+    try:
+        sentences = [f"Section {i} of the TSMC annual filing covers topic {i}. " for i in range(8)]
+        filing = "".join(sentences).strip()
+        metadata = {"type": "filing", "symbol": "TSM"}
+        indexed = agent.index_documents([filing], [metadata], ids=["tsm-10k"])
+        assert indexed > 1 and agent._has_document("tsm-10k#0") and not agent._has_document("tsm-10k")
+        chunks = [agent._document_by_id(f"tsm-10k#{i}") for i in range(indexed)]
+        assert all(len(doc.page_content) <= 80 and doc.metadata["parent_id"] == "tsm-10k" for doc in chunks)
+        assert all(filing[doc.metadata["chunk_start"]:].startswith(doc.page_content) for doc in chunks)
+
+        hit = agent.retrieve_scored_chunks("topic 4", k=1, filters={"type": "filing"}, include_parent=True)[0]
+        assert hit["text"] in hit["parent_context"] and len(hit["text"]) < len(hit["parent_context"]) < len(filing)
+        assert hit["parent_context"] in filing
+
+        assert agent.index_documents(["Short TSMC filing."], [metadata], ids=["tsm-10k"]) == 1
+        assert agent._has_document("tsm-10k") and not agent._has_document("tsm-10k#0")
+
+        streamed = agent.index_document_stream(iter(sentences), metadata, doc_id="tsm-10k")
+        assert streamed == indexed and not agent._has_document("tsm-10k")
+        agent.index_documents(["Samsung closed lower."], [{"type": "stock_price"}])
+        short_hit = agent.retrieve_scored_chunks("Samsung closed lower", k=1, filters={"type": "stock_price"}, include_parent=True)
+        assert short_hit[0]["parent_context"] is None
+    finally:
+        agent.close()
+
+
+def test_stream_without_sentence_ends_is_chunked_as_it_arrives():
+    """
+    Text without sentence ends, such as a table streamed line by line, yields chunks before the stream
+    ends, with only about one chunk of it buffered, and reassembles to the input.
+    """
+    from vector_store.chunking import TextChunker, iter_sentences
+
+    lines = [f"2330.TW\t{day}\t{580 + day % 7}\t{day * 1000}\n" for day in range(20000)]
+    consumed = []
+
+    def stream():
+        for line in lines:
+            consumed.append(line)
+            yield line
+
+    chunks = TextChunker(chunk_size=500, chunk_overlap=0).chunks(stream())
+    first_start, first_text = next(chunks)
+    assert first_start == 0 and len(first_text) <= 500 and len(consumed) < 100
+    assert sum(1 for _ in chunks) > 1000
+
+    pieces = list(iter_sentences(lines, max_length=500))
+    assert "".join(pieces) == "".join(lines) and max(len(piece) for piece in pieces) <= 500
+
+
+def test_semantic_result_cache_serves_paraphrases_until_index_changes(tmp_path, monkeypatch):
+    """
+    A query whose embedding is close to an earlier one's gets the earlier results without a search,
+    for the same options only, until a write publishes a new index generation.
+    """
+    agent = make_agent(tmp_path, monkeypatch, result_cache_max_entries=256, result_cache_similarity=0.85)
+    try:
+        agent.index_documents(["TSMC closed higher.", "Samsung closed lower."], [{"type": "stock_price"}] * 2)
+        searches = []
+        search_by_vectors = agent._search_by_vectors
+        monkeypatch.setattr(agent, "_search_by_vectors", lambda *args, **kwargs: searches.append(args) or search_by_vectors(*args, **kwargs))
+
+        first = agent.retrieve_scored_chunks("TSMC closed higher", k=1, rerank=True)
+        assert agent.retrieve_scored_chunks("TSMC closed higher today", k=1, rerank=True) == first
+        assert len(searches) == 1 and agent.result_cache.hits == 1
+        agent.retrieve_scored_chunks("TSMC closed higher today", k=2, rerank=True)
+        agent.retrieve_scored_chunks("Samsung results", k=1, rerank=True)
+        assert len(searches) == 3
+
+        agent.index_documents(["TSMC closed higher after earnings."], [{"type": "news"}])
+        assert agent.retrieve_top_k_chunks("TSMC closed higher", k=2)[0] != "Samsung closed lower."
+        assert len(searches) == 4 and agent.result_cache.invalidations == 1
+    finally:
+        agent.close()
+
+
+def test_semantic_result_cache_keeps_tickers_and_dates_apart(tmp_path, monkeypatch):
+    """
+    Questions that differ only by ticker or date embed almost identically, but must not be answered
+    with each other's cached results.
+    """
+    agent = make_agent(tmp_path, monkeypatch, embeddings=HashedNGramEmbeddings(dimension=384), embedding_cache_path=None,
+                       result_cache_max_entries=256, result_cache_similarity=0.9)
+    try:
+        agent.index_documents(
+            ["TSM reported earnings above estimates on 2025-05-29.", "AMD reported earnings below estimates on 2025-05-29.",
+             "TSM reported earnings below estimates on 2025-05-30."],
+            [{"type": "news", "symbol": "TSM", "date": "2025-05-29"}, {"type": "news", "symbol": "AMD", "date": "2025-05-29"},
+             {"type": "news", "symbol": "TSM", "date": "2025-05-30"}],
+        )
+        question = "What is our risk exposure in {} today, and did it report earnings surprises on {}?"
+        tsm = agent.retrieve_scored_chunks(question.format("TSM", "2025-05-29"), k=1, mode="hybrid", rerank=True)
+        amd = agent.retrieve_scored_chunks(question.format("AMD", "2025-05-29"), k=1, mode="hybrid", rerank=True)
+        later = agent.retrieve_scored_chunks(question.format("TSM", "2025-05-30"), k=1, mode="hybrid", rerank=True)
+        assert agent.result_cache.hits == 0
+        assert [tsm[0]["metadata"], amd[0]["metadata"]] == [
+            {"type": "news", "symbol": "TSM", "date": "2025-05-29"}, {"type": "news", "symbol": "AMD", "date": "2025-05-29"},
+        ]
+        assert later[0]["metadata"]["date"] == "2025-05-30"
+        # The same question asked again is still served from the cache
+        assert agent.retrieve_scored_chunks(question.format("AMD", "2025-05-29"), k=1, mode="hybrid", rerank=True) == amd
+        assert agent.result_cache.hits == 1
+    finally:
+        agent.close()
+
+
+def test_stats_report_counts_sizes_and_stage_latencies(tmp_path, monkeypatch):
+    """
+    stats() breaks documents down by type and symbol, sizes vectors and files, and times embed, search and save.
+    """
+    agent = make_agent(tmp_path, monkeypatch)
+    try:
+        agent.index_documents(
+            ["TSMC closed higher.", "Samsung closed lower.", "TSMC beat estimates."],
+            [{"type": "stock_price", "symbol": "TSM"}, {"type": "stock_price", "symbol": "005930.KS"},
+             {"type": "earnings_surprise", "symbol": "TSM"}],
+        )
+        agent.retrieve_top_k_chunks("TSMC closed higher", k=2)
+        agent.compact()
+        stats = agent.stats()
+        assert stats["documents"] == 3 and stats["dimension"] == FakeEmbeddings.dimension
+        assert stats["counts_by_type"] == {"stock_price": 2, "earnings_surprise": 1}
+        assert stats["counts_by_symbol"] == {"TSM": 2, "005930.KS": 1}
+        assert stats["vector_bytes"] == 3 * FakeEmbeddings.dimension * 4 and stats["disk_bytes"] > stats["vector_bytes"]
+        assert stats["generation"] == agent._view.generation and stats["last_commit_at"] is not None
+        assert {"embed", "embed_query", "search", "save"} <= set(stats["latency"])
+        assert stats["latency"]["search"]["count"] == 1 and stats["latency"]["search"]["p99_ms"] >= stats["latency"]["search"]["p50_ms"]
+        assert stats["caches"]["result"] is None # Off by default
+        assert stats["caches"]["query_embedding"]["misses"] == 1
+    finally:
+        agent.close()
+
+    partitioned = make_agent(tmp_path, monkeypatch, vector_store_path=str(tmp_path / "partitioned"), partition_by="day")
+    try:
+        today = datetime.date.today().isoformat()
+        partitioned.index_documents(["TSMC closed higher.", "TSMC desk notes"],
+                                    [{"type": "stock_price", "symbol": "TSM", "date": today}, {"type": "note"}])
+        stats = partitioned.stats()
+        assert stats["documents"] == 2 and stats["counts_by_type"] == {"stock_price": 1, "note": 1}
+        assert sorted(stats["generation"]) == sorted([today, "undated"])
+    finally:
+        partitioned.close()
+
+
+def test_retrieval_benchmark_reports_quality_and_latency(capsys):
+    """
+    A small benchmark run reports recall, MRR and latency per configuration, without the agent's
+    per-query logs (which would be timed along with the searches).
+    """
+    from scripts.retrieval_benchmark import run_benchmark
+
+    report = run_benchmark([200], ["flat"], ["dense"], num_queries=10, k=5, dimension=64, batch_size=4, seed=7)
+    assert "Retrieving top" not in capsys.readouterr().out
+    (row,) = report["results"]
+    assert {"recall_at_k", "mrr_at_k", "latency_ms_p50", "latency_ms_p95", "latency_ms_p99", "qps", "batch_qps"} <= set(row)
+    assert 0.0 <= row["mrr_at_k"] <= row["recall_at_k"] <= 1.0
+    assert row["latency_ms_p50"] <= row["latency_ms_p99"]
+    assert report["num_queries"] == 10 and report["k"] == 5
+
+
+def test_auto_mode_answers_structured_benchmark_queries_lexically():
+    """
+    On the benchmark corpus, where BM25 ranks the labelled answer among a few near-identical
+    neighbours, auto mode takes the lexical fast path instead of matching hybrid row for row.
+    """
+    from scripts.retrieval_benchmark import run_benchmark
+
+    report = run_benchmark([200], ["flat"], ["hybrid", "auto"], num_queries=20, k=5, dimension=64, batch_size=4, seed=7)
+    hybrid, auto = report["results"]
+    assert hybrid["lexical_share"] == 0.0
+    assert auto["lexical_share"] >= 0.9
+    assert auto["recall_at_k"] >= hybrid["recall_at_k"]
+
+
+def test_retrieval_benchmark_builds_lazy_indexes_before_timing(tmp_path, monkeypatch):
+    """
+    The BM25 index of lexical and hybrid search is built by an untimed warm-up query, not inside
+    the first timed one.
+    """
+    import scripts.retrieval_benchmark as retrieval_benchmark
+
+    documents, queries = retrieval_benchmark.make_market_corpus(200, 5, seed=7)
+    agent = retrieval_benchmark.build_agent(str(tmp_path / "faiss_index"), documents, "flat", 64)
+    index_ready_when_timed = []
+    def perf_counter():
+        index_ready_when_timed.append(agent._lexical_index_ready)
+        return time.perf_counter()
+    monkeypatch.setattr(retrieval_benchmark, "time", type("Clock", (), {"perf_counter": staticmethod(perf_counter)}))
+    try:
+        retrieval_benchmark.evaluate(agent, queries, k=5, mode="hybrid", batch_size=2)
+    finally:
+        agent.close()
+    assert index_ready_when_timed and all(index_ready_when_timed)
+
+
+def test_collection_registry_loads_lazily_and_evicts_idle_collections(tmp_path, monkeypatch):
+    """
+    Named collections are opened on first use, keep their own documents, are closed least recently
+    used first when over the memory budget (and reloaded intact), and can be listed and dropped.
+    """
+    from vector_store.collection_registry import CollectionInUseError, CollectionRegistry
+
+    default = make_agent(tmp_path, monkeypatch)
+    opened = []
+
+    def open_collection(path):
+        opened.append(path)
+        return make_agent(tmp_path, monkeypatch, vector_store_path=path, embedding_cache_path=None)
+
+    # Room for one collection of two vectors; the pinned default store does not count toward it
+    default.index_documents(["The default store holds its own notes.", "It is never evicted."])
+    budget = 2 * FakeEmbeddings.dimension * 4
+    registry = CollectionRegistry(str(tmp_path / "collections"), open_collection, memory_budget_bytes=budget,
+                                  pinned={"default": default})
+    try:
+        registry.create("asia-tech")
+        registry.create("us-macro")
+        with pytest.raises(FileExistsError):
+            registry.create("asia-tech")
+        with pytest.raises(ValueError):
+            registry.create("../escape")
+        assert opened == []
+
+        with registry.use("asia-tech") as agent:
+            job = agent.submit_index_job(["TSMC closed higher.", "Samsung closed lower."])
+            wait_for_job(agent, job["job_id"])
+        with registry.use("us-macro") as agent:
+            agent.index_documents(["The Fed held rates steady."])
+            assert agent.retrieve_top_k_chunks("TSMC closed higher", k=5) == ["The Fed held rates steady."]
+        loaded = {info["name"]: info["loaded"] for info in registry.list_collections()}
+        assert loaded == {"asia-tech": False, "default": True, "us-macro": True} and registry.evictions == 1
+        # The job's status outlives the eviction and is reported without reloading the collection
+        assert registry.get_job("asia-tech", job["job_id"])["status"] == "succeeded" and len(opened) == 2
+        assert registry.get_job("asia-tech", "no-such-job") is None
+
+        with registry.use("asia-tech") as agent:
+            assert agent.retrieve_top_k_chunks("TSMC closed higher", k=1) == ["TSMC closed higher."]
+            with pytest.raises(CollectionInUseError):
+                registry.drop("asia-tech")
+        with registry.use() as agent:
+            assert agent is default
+        with pytest.raises(ValueError):
+            registry.drop("default")
+
+        registry.drop("asia-tech")
+        assert registry.names() == ["default", "us-macro"] and not (tmp_path / "collections" / "asia-tech").exists()
+        with pytest.raises(KeyError):
+            with registry.use("asia-tech"):
+                pass
+    finally:
+        registry.close()
+        default.close()
+
+
+def test_evicted_collection_releases_its_embedding_cache(tmp_path, monkeypatch):
+    """
+    Closing an evicted collection closes its embedding cache's SQLite connection, so evicting and
+    reloading collections does not leak one connection per cycle.
+    """
+    from vector_store.collection_registry import CollectionRegistry
+
+    opened = []
+
+    def open_collection(path):
+        store = make_agent(tmp_path, monkeypatch, vector_store_path=path,
+                           embedding_cache_path=os.path.join(path, "embedding_cache.sqlite3"))
+        opened.append(store)
+        return store
+
+    registry = CollectionRegistry(str(tmp_path / "collections"), open_collection, max_loaded=1)
+    try:
+        registry.create("asia-tech")
+        registry.create("us-macro")
+        for _ in range(2):
+            for name in ("asia-tech", "us-macro"):
+                with registry.use(name) as agent:
+                    agent.index_documents([f"{name} desk note."])
+        assert len(opened) == 4 and registry.evictions == 3
+        for store in opened[:-1]:
+            with pytest.raises(sqlite3.ProgrammingError):
+                store.embedding_cache._conn.execute("SELECT 1")
+        # The reloaded collection's cache still serves the embedding its earlier instance stored
+        assert opened[-1].embedding_cache.stats()["hits"] == 1
+    finally:
+        registry.close()
+
+
+def test_collection_registry_loads_outside_its_lock(tmp_path):
+    """
+    A collection that is slow to open holds up only callers of that collection: others are served
+    meanwhile, and concurrent callers of the slow one share a single load.
+    """
+    from vector_store.collection_registry import CollectionRegistry
+
+    class Store:
+        def __init__(self, path):
+            self.path = path
+            self.ingest_jobs = IngestJobQueue(lambda documents, metadata, ids: len(documents))
+
+        def memory_bytes(self):
+            return 0
+
+        def close(self):
+            self.ingest_jobs.shutdown()
+
+    opening, release_open = threading.Event(), threading.Event()
+    opened = []
+
+    def open_collection(path):
+        opened.append(path)
+        if path.endswith("slow"):
+            opening.set()
+            release_open.wait(5)
+        return Store(path)
+
+    registry = CollectionRegistry(str(tmp_path / "collections"), open_collection)
+    registry.create("slow")
+    registry.create("fast")
+    stores = []
+
+    def use_slow():
+        with registry.use("slow") as store:
+            stores.append(store)
+
+    threads = [threading.Thread(target=use_slow) for _ in range(2)]
+    try:
+        for thread in threads:
+            thread.start()
+        assert opening.wait(5)
+        with registry.use("fast") as store:
+            assert store.path.endswith("fast")
+        assert registry.list_collections()[1]["loaded"] is False # "slow" is still loading
+    finally:
+        release_open.set()
+        for thread in threads:
+            thread.join(5)
+        registry.close()
+    assert len(stores) == 2 and stores[0] is stores[1]
+    assert sorted(os.path.basename(path) for path in opened) == ["fast", "slow"]
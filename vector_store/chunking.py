@@ -0,0 +1,173 @@
+# vector_store/chunking.py
+
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Chunks of a long document get the IDs "<parent ID>#0", "<parent ID>#1", ... in text order
+CHUNK_ID_SEPARATOR = "#"
+
+# A sentence ends at ., ! or ?, optionally followed by closing quotes or brackets, then whitespace
+SENTENCE_BOUNDARY = re.compile(r"[.!?][\"')\]]*\s+")
+# The word before a sentence-ending period, to tell abbreviations from sentence ends
+LAST_WORD = re.compile(r"(\S+)$")
+
+# Words ending in a period that usually do not end a sentence in filings and market news
+ABBREVIATIONS = frozenset(
+    "inc corp co ltd plc llc mr mrs ms dr st no vs etc approx est dept fig jan feb mar apr jun jul aug sep sept "
+    "oct nov dec u.s u.k e.g i.e a.m p.m".split()
+)
+
+def chunk_id(parent_id: str, index: int) -> str:
+    return f"{parent_id}{CHUNK_ID_SEPARATOR}{index}"
+
+def _is_abbreviation(text_before: str) -> bool:
+    match = LAST_WORD.search(text_before)
+    if not match:
+        return False
+    word = match.group(1).lower().lstrip("(\"'")
+    # Single letters are initials ("J. Smith"); dotted words are checked without their final period
+    return (len(word) == 1 and word.isalpha()) or word in ABBREVIATIONS
+
+def _pending_boundary(text: str) -> int:
+    """
+    Where a sentence boundary may still start once more text arrives: at a trailing ".", "!" or "?"
+    (possibly followed by closing quotes or brackets) that has no whitespace after it yet. Otherwise
+    the end of `text`, since everything before has already been scanned.
+    """
+    end = len(text)
+    while end and text[end - 1] in "\"')]":
+        end -= 1
+    return end - 1 if end and text[end - 1] in ".!?" else len(text)
+
+def iter_sentences(pieces: Iterable[str], max_length: Optional[int] = None) -> Iterator[str]:
+    """
+    Splits text arriving in pieces (lines of a file, blocks of an HTTP response, or one string)
+    into sentences. Each sentence keeps its trailing whitespace, so the sentences concatenate back
+    to the exact input. Only the unfinished sentence at the end of the input read so far is buffered,
+    and every piece is scanned once.
+
+    With `max_length`, an unfinished sentence is not buffered past that length: text without sentence
+    ends (tables, line-oriented data) is yielded in pieces of at most max_length characters, cut at
+    whitespace where possible, as it streams in.
+    """
+    buffer = ""
+    scan = 0 # Offset in buffer up to which no sentence boundary can start
+    for piece in pieces:
+        buffer += piece
+        start = 0
+        pending = None
+        for match in SENTENCE_BOUNDARY.finditer(buffer, scan):
+            if match.end() == len(buffer):
+                # The whitespace may continue in the next piece
+                pending = match.start()
+                break
+            # Only the last word matters; a longer one is no abbreviation either way
+            if _is_abbreviation(buffer[max(start, match.start() - 64):match.start()]):
+                continue
+            yield buffer[start:match.end()]
+            start = match.end()
+        buffer = buffer[start:]
+        scan = pending - start if pending is not None else _pending_boundary(buffer)
+        if max_length is not None:
+            while len(buffer) > max_length:
+                cut = min(buffer.rfind(" ", 0, max_length) + 1 or max_length, scan)
+                if cut <= 0:
+                    break
+                yield buffer[:cut]
+                buffer = buffer[cut:]
+                scan -= cut
+    if buffer:
+        yield buffer
+
+def _hard_split(text: str, size: int) -> Iterator[str]:
+    """Splits text without usable sentence ends into pieces of at most `size` characters, at whitespace where possible."""
+    while len(text) > size:
+        cut = text.rfind(" ", 0, size) + 1 or size
+        yield text[:cut]
+        text = text[cut:]
+    if text:
+        yield text
+
+class TextChunker:
+    """
+    Sentence-aware chunker for long documents such as filings and news articles. Sentences are packed
+    into chunks of at most `chunk_size` characters; consecutive chunks share up to `chunk_overlap`
+    characters of whole sentences, so a fact spanning a chunk boundary is found in one chunk intact.
+    Sentences longer than a chunk are split at whitespace.
+
+    The input is consumed as a stream of text pieces and chunks are produced as soon as they are full,
+    so a long document never has to be held in memory as a whole.
+    """
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 150):
+        """
+        Initializes the TextChunker.
+
+        Args:
+            chunk_size (int): Maximum characters per chunk.
+            chunk_overlap (int): Maximum characters of trailing sentences repeated at the start of the next chunk.
+        """
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}.")
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError(f"chunk_overlap must be at least 0 and less than chunk_size, got {chunk_overlap}.")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def chunks(self, pieces: Iterable[str]) -> Iterator[Tuple[int, str]]:
+        """
+        Yields (start offset in the document, chunk text) pairs in document order. The chunk text is
+        the document slice starting at that offset, with surrounding whitespace trimmed.
+        """
+        window: List[Tuple[int, str]] = [] # (offset, sentence) pairs of the chunk being filled
+        window_length = 0
+        has_new_text = False # Whether the window holds more than the overlap carried from the last chunk
+        offset = 0
+        for sentence in iter_sentences(pieces, self.chunk_size):
+            for part in _hard_split(sentence, self.chunk_size):
+                if window and window_length + len(part) > self.chunk_size:
+                    if has_new_text:
+                        yield from self._emit(window)
+                    window, window_length = self._overlap(window, len(part))
+                    has_new_text = False
+                window.append((offset, part))
+                window_length += len(part)
+                has_new_text = True
+                offset += len(part)
+        if has_new_text:
+            yield from self._emit(window)
+
+    def _overlap(self, window: List[Tuple[int, str]], next_length: int) -> Tuple[List[Tuple[int, str]], int]:
+        """The trailing sentences of `window` to repeat in the next chunk, leaving room for the next sentence."""
+        budget = min(self.chunk_overlap, self.chunk_size - next_length)
+        kept: List[Tuple[int, str]] = []
+        length = 0
+        for offset, sentence in reversed(window[1:]):
+            if length + len(sentence) > budget:
+                break
+            kept.insert(0, (offset, sentence))
+            length += len(sentence)
+        return kept, length
+
+    @staticmethod
+    def _emit(window: List[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        text = "".join(sentence for _, sentence in window)
+        stripped = text.lstrip()
+        if stripped.strip():
+            yield window[0][0] + len(text) - len(stripped), stripped.rstrip()
+
+def join_chunks(chunks: Iterable[Tuple[int, str]]) -> str:
+    """
+    Reassembles a stretch of a document from (start offset, text) chunks of it, in any order:
+    overlapping text is included once and a gap between chunks becomes a single space.
+    """
+    text = ""
+    end = None
+    for start, chunk in sorted(chunks):
+        if end is None:
+            text = chunk
+        elif start + len(chunk) > end:
+            text += chunk[end - start:] if start <= end else " " + chunk
+        else:
+            continue
+        end = start + len(chunk)
+    return text
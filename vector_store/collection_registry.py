@@ -0,0 +1,297 @@
+# vector_store/collection_registry.py
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Collection names double as directory names, so they are restricted to a safe alphabet
+COLLECTION_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+# Marks a directory under the registry root as a collection and records when it was created
+COLLECTION_FILENAME = "collection.json"
+# Finished ingest jobs of evicted collections kept for status lookups, oldest first out
+MAX_EVICTED_JOBS = 1000
+
+def validate_collection_name(name: str) -> str:
+    if not isinstance(name, str) or not COLLECTION_NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid collection name '{name}'. Use 1-64 letters, digits, '-' or '_', starting with a letter or digit.")
+    return name
+
+class CollectionInUseError(RuntimeError):
+    """Raised when dropping a collection that a request or an ingest job is still using."""
+
+class CollectionRegistry:
+    """
+    Named, independent stores (one per desk, say "asia-tech" or "us-macro") served by one process.
+    Each collection lives in its own directory under `root_path` and is opened on first use by
+    `open_collection(path)`. Loaded collections are kept in least-recently-used order; when their
+    combined memory_bytes() exceeds `memory_budget_bytes`, or more than `max_loaded` are open, the
+    least recently used idle ones are closed (which persists them) until the limits hold again.
+
+    A collection is idle when no caller holds it through use() and its ingest queue is empty, so
+    nothing is closed under a running request or job. Pinned collections, such as the service's
+    default store, are never evicted or dropped.
+
+    Opening and closing a store reads or writes its snapshot, so both run outside the registry lock:
+    a collection being loaded or closed is marked as such, and callers wanting it wait for that one
+    collection while requests for every other collection go ahead.
+
+    Ingest job statuses outlive eviction: the finished jobs of an evicted collection are kept here,
+    so get_job() still reports them without loading the collection again.
+    """
+    def __init__(self, root_path: str, open_collection: Callable[[str], Any], memory_budget_bytes: Optional[int] = None,
+                 max_loaded: Optional[int] = None, pinned: Optional[Dict[str, Any]] = None):
+        """
+        Initializes the CollectionRegistry.
+
+        Args:
+            root_path (str): Directory holding one subdirectory per collection.
+            open_collection (Callable[[str], Any]): Opens the store at a path; the store needs close(),
+                                                    memory_bytes() and ingest_jobs.pending_count().
+            memory_budget_bytes (Optional[int]): Memory the loaded collections may use together, pinned ones excluded.
+                                                 None is unlimited.
+            max_loaded (Optional[int]): Maximum number of collections open at once, pinned ones excluded. None is unlimited.
+            pinned (Optional[Dict[str, Any]]): Already open stores by name, served as collections but never evicted.
+        """
+        self.root_path = root_path
+        self.open_collection = open_collection
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_loaded = max_loaded
+        self._pinned: Dict[str, Any] = {validate_collection_name(name): store for name, store in (pinned or {}).items()}
+        self._loaded: "OrderedDict[str, Any]" = OrderedDict() # Least recently used first
+        self._users: Dict[str, int] = {}
+        self._last_used: Dict[str, float] = {}
+        # Collections being opened or closed outside the lock; set when that finishes
+        self._loading: Dict[str, threading.Event] = {}
+        self._closing: Dict[str, threading.Event] = {}
+        # Statuses of finished ingest jobs of evicted collections by (collection, job ID), oldest first
+        self._evicted_jobs: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root_path, name)
+
+    def exists(self, name: str) -> bool:
+        return name in self._pinned or os.path.isfile(os.path.join(self._path(name), COLLECTION_FILENAME))
+
+    def create(self, name: str) -> Dict[str, Any]:
+        """Creates an empty collection. Raises FileExistsError if the name is taken."""
+        validate_collection_name(name)
+        with self._lock:
+            if self.exists(name):
+                raise FileExistsError(f"Collection '{name}' already exists.")
+            os.makedirs(self._path(name), exist_ok=True)
+            with open(os.path.join(self._path(name), COLLECTION_FILENAME), "w", encoding="utf-8") as f:
+                json.dump({"name": name, "created_at": time.time()}, f)
+            print(f"RetrieverAgent: Created collection '{name}'.")
+            return self._info(name)
+
+    def drop(self, name: str) -> None:
+        """
+        Deletes a collection and everything stored in it. Raises KeyError for unknown names,
+        ValueError for pinned collections and CollectionInUseError while it is being used.
+        """
+        validate_collection_name(name)
+        with self._lock:
+            if name in self._pinned:
+                raise ValueError(f"Collection '{name}' is the service's default store and cannot be dropped.")
+            if not self.exists(name):
+                raise KeyError(f"Unknown collection '{name}'.")
+            store = self._loaded.get(name)
+            if name in self._loading or name in self._closing or (store is not None and not self._is_idle(name, store)):
+                raise CollectionInUseError(f"Collection '{name}' is in use; retry once its requests and ingest jobs finish.")
+            self._loaded.pop(name, None)
+            self._last_used.pop(name, None)
+            for key in [key for key in self._evicted_jobs if key[0] == name]:
+                del self._evicted_jobs[key]
+            # Callers wanting the collection wait until it is gone, then find it unknown
+            closed = self._closing[name] = threading.Event()
+        try:
+            if store is not None:
+                store.close()
+            shutil.rmtree(self._path(name))
+        finally:
+            with self._lock:
+                del self._closing[name]
+            closed.set()
+        print(f"RetrieverAgent: Dropped collection '{name}'.")
+
+    def names(self) -> List[str]:
+        stored = []
+        if os.path.isdir(self.root_path):
+            stored = [name for name in os.listdir(self.root_path) if COLLECTION_NAME_PATTERN.match(name) and self.exists(name)]
+        return sorted(set(stored) | set(self._pinned))
+
+    def list_collections(self) -> List[Dict[str, Any]]:
+        """Every collection with whether it is loaded, its memory use if so, and when it was last used."""
+        with self._lock:
+            return [self._info(name) for name in self.names()]
+
+    def _info(self, name: str) -> Dict[str, Any]:
+        store = self._pinned.get(name)
+        if store is None:
+            store = self._loaded.get(name)
+        return {
+            "name": name,
+            "loaded": store is not None,
+            "pinned": name in self._pinned,
+            "memory_bytes": store.memory_bytes() if store is not None else None,
+            "last_used_at": self._last_used.get(name),
+        }
+
+    @contextmanager
+    def use(self, name: Optional[str] = None) -> Iterator[Any]:
+        """
+        Yields the store of collection `name`, opening it if needed; without a name, the only pinned
+        store. The store is not evicted or dropped before the block ends. Raises KeyError for unknown names.
+        """
+        store = self.acquire(name)
+        try:
+            yield store
+        finally:
+            self.release(name)
+
+    def _resolve(self, name: Optional[str]) -> str:
+        if name is None:
+            if len(self._pinned) != 1:
+                raise ValueError("A collection name is required.")
+            return next(iter(self._pinned))
+        return validate_collection_name(name)
+
+    def acquire(self, name: Optional[str] = None) -> Any:
+        """
+        Returns the store of collection `name` like use(), for callers that cannot hold a `with` block
+        (e.g. across an await); every acquire() must be paired with a release() of the same name.
+        Blocks while the collection is being opened or closed by another caller.
+        """
+        name = self._resolve(name)
+        while True:
+            with self._lock:
+                store = self._pinned.get(name, self._loaded.get(name))
+                if store is not None:
+                    if name in self._loaded:
+                        self._loaded.move_to_end(name)
+                    self._users[name] = self._users.get(name, 0) + 1
+                    self._last_used[name] = time.time()
+                    return store
+                pending = self._loading.get(name) or self._closing.get(name)
+                if pending is None:
+                    if not self.exists(name):
+                        raise KeyError(f"Unknown collection '{name}'.")
+                    loaded = self._loading[name] = threading.Event()
+                    break
+            pending.wait()
+
+        start = time.perf_counter()
+        try:
+            store = self.open_collection(self._path(name))
+        except BaseException:
+            with self._lock:
+                del self._loading[name]
+            loaded.set()
+            raise
+        with self._lock:
+            del self._loading[name]
+            self._loaded[name] = store
+            self._users[name] = self._users.get(name, 0) + 1
+            self._last_used[name] = time.time()
+            self.loads += 1
+            victims = self._select_victims(keep=name)
+        loaded.set()
+        print(f"RetrieverAgent: Loaded collection '{name}' in {time.perf_counter() - start:.2f}s.")
+        self._close_victims(victims)
+        return store
+
+    def release(self, name: Optional[str] = None) -> None:
+        """Ends a use of collection `name` started by acquire(), closing idle collections if over budget."""
+        name = self._resolve(name)
+        with self._lock:
+            self._users[name] -= 1
+            victims = self._select_victims()
+        self._close_victims(victims)
+
+    def get_job(self, name: Optional[str], job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Status of ingest job `job_id` of collection `name`, or None if unknown. Jobs of an evicted
+        collection are answered from the statuses kept at eviction, without loading it.
+        Raises KeyError for unknown collections.
+        """
+        name = self._resolve(name)
+        with self._lock:
+            store = self._pinned.get(name, self._loaded.get(name))
+            if store is None and not self.exists(name):
+                raise KeyError(f"Unknown collection '{name}'.")
+            evicted = self._evicted_jobs.get((name, job_id))
+        job = store.ingest_jobs.get(job_id) if store is not None else None
+        return job if job is not None else evicted
+
+    def _is_idle(self, name: str, store: Any) -> bool:
+        return not self._users.get(name) and store.ingest_jobs.pending_count() == 0
+
+    def _memory_bytes(self) -> int:
+        # Pinned stores cannot be evicted, so counting them would only leave less room for the rest
+        return sum(store.memory_bytes() for store in self._loaded.values())
+
+    def _select_victims(self, keep: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Unloads least recently used idle collections until the memory budget and max_loaded hold, or
+        none is left to unload, and marks them as closing. Returns them by name for _close_victims,
+        which closes them outside the lock. Callers must hold self._lock.
+        """
+        def over_budget() -> bool:
+            if self.max_loaded is not None and len(self._loaded) > self.max_loaded:
+                return True
+            return self.memory_budget_bytes is not None and self._memory_bytes() > self.memory_budget_bytes
+
+        victims: Dict[str, Any] = {}
+        while over_budget():
+            victim = next((name for name, store in self._loaded.items() if name != keep and self._is_idle(name, store)), None)
+            if victim is None:
+                break
+            victims[victim] = self._loaded.pop(victim)
+            self._closing[victim] = threading.Event()
+            # An idle collection has no queued or running jobs left; keep the finished ones' statuses
+            for job in victims[victim].ingest_jobs.finished_jobs():
+                self._evicted_jobs[(victim, job["job_id"])] = job
+            while len(self._evicted_jobs) > MAX_EVICTED_JOBS:
+                self._evicted_jobs.popitem(last=False)
+            self.evictions += 1
+        return victims
+
+    def _close_victims(self, victims: Dict[str, Any]) -> None:
+        for name, store in victims.items():
+            try:
+                store.close()
+                print(f"RetrieverAgent: Evicted idle collection '{name}' to stay within the memory budget.")
+            finally:
+                with self._lock:
+                    closed = self._closing.pop(name)
+                closed.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "collection_count": len(self.names()),
+                "loaded": len(self._loaded) + len(self._pinned),
+                "memory_bytes": self._memory_bytes(),
+                "pinned_memory_bytes": sum(store.memory_bytes() for store in self._pinned.values()),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "max_loaded": self.max_loaded,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+    def close(self) -> None:
+        """Closes every loaded collection; pinned stores are left to their owner."""
+        with self._lock:
+            stores = list(self._loaded.values())
+            self._loaded.clear()
+        for store in stores:
+            store.close()
@@ -0,0 +1,46 @@
+# vector_store/diversity.py
+
+import numpy as np
+
+def maximal_marginal_relevance(relevance: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float = 0.5) -> np.ndarray:
+    """
+    Picks k of n candidates by maximal marginal relevance: each step takes the candidate maximizing
+    lambda_mult * relevance - (1 - lambda_mult) * (its highest cosine similarity to a candidate
+    already picked). With lambda_mult = 1 this is the relevance order; lower values trade relevance
+    for covering different content.
+
+    Each step computes the similarities of the new pick to all candidates with one matrix-vector
+    product and folds them into every candidate's running maximum, so only k of the n x n
+    similarities are ever computed and a pool of a few hundred candidates takes well under a millisecond.
+
+    Args:
+        relevance (np.ndarray): Relevance score of each candidate, higher is better, shape (n,).
+        vectors (np.ndarray): Embedding of each candidate, shape (n, dimension).
+        k (int): Number of candidates to pick.
+        lambda_mult (float): Weight of relevance against diversity, between 0 and 1.
+
+    Returns:
+        np.ndarray: Indices of the picked candidates, in pick order.
+    """
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    # Similarities are divided by the norms afterwards instead of normalizing every vector up front
+    norms = np.sqrt(np.einsum("ij,ij->i", vectors, vectors))
+    norms[norms == 0] = 1.0
+
+    weighted_relevance = lambda_mult * np.asarray(relevance, dtype=np.float32)
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    picked = np.empty(k, dtype=np.int64)
+    for step in range(k):
+        # Before the first pick nothing is redundant, so the most relevant candidate goes first
+        objective = weighted_relevance - (1.0 - lambda_mult) * redundancy if step else weighted_relevance.copy()
+        objective[~available] = -np.inf
+        choice = int(np.argmax(objective))
+        picked[step] = choice
+        available[choice] = False
+        np.maximum(redundancy, (vectors @ vectors[choice]) / (norms * norms[choice]), out=redundancy)
+    return picked
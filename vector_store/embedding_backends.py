@@ -0,0 +1,87 @@
+# vector_store/embedding_backends.py
+
+from typing import List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Embedding backends the Retriever Agent can be configured with:
+#   "google" - Google Generative AI embeddings (network call, needs GOOGLE_API_KEY)
+#   "hashed" - HashedNGramEmbeddings below (CPU only, no model files, no network)
+# Any other LangChain Embeddings object can also be passed to RetrieverAgent directly.
+EMBEDDING_BACKENDS = ("google", "hashed")
+
+def validate_embedding_backend(backend: str) -> str:
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Expected one of {', '.join(EMBEDDING_BACKENDS)}.")
+    return backend
+
+def _mix(hashes: np.ndarray) -> np.ndarray:
+    """MurmurHash3 64-bit finalizer, spreading polynomial hashes over all bits (uint64 arithmetic wraps)."""
+    hashes = hashes ^ (hashes >> np.uint64(33))
+    hashes = hashes * np.uint64(0xFF51AFD7ED558CCD)
+    hashes = hashes ^ (hashes >> np.uint64(33))
+    hashes = hashes * np.uint64(0xC4CEB9FE1A85EC53)
+    return hashes ^ (hashes >> np.uint64(33))
+
+class HashedNGramEmbeddings(Embeddings):
+    """
+    Local embeddings from the hashing trick over character n-grams: every n-gram of the lower-cased,
+    whitespace-normalized text adds +1 or -1 to one of `dimension` buckets, and the result is
+    L2-normalized. Lexically similar texts (shared words, tickers, numbers) get nearby vectors.
+
+    A whole batch is encoded at once: texts are concatenated into one byte buffer, n-gram hashes are
+    computed with sliding-window matrix products, and buckets are accumulated with a single bincount.
+    Output is deterministic across processes and machines, so vectors can be cached and persisted.
+    """
+    def __init__(self, dimension: int = 768, ngram_range: Tuple[int, int] = (3, 5)):
+        """
+        Initializes the HashedNGramEmbeddings.
+
+        Args:
+            dimension (int): Number of hash buckets, i.e. the embedding size.
+            ngram_range (Tuple[int, int]): Smallest and largest character n-gram length.
+        """
+        self.dimension = dimension
+        self.ngram_sizes = list(range(ngram_range[0], ngram_range[1] + 1))
+        self.model_name = f"hashed-ngram-{ngram_range[0]}-{ngram_range[1]}-{dimension}"
+        # Polynomial hash weights per n-gram length: byte j of an n-gram is multiplied by 257^(n-1-j)
+        self._powers = {
+            n: np.array([pow(257, n - 1 - j, 2 ** 64) for j in range(n)], dtype=np.uint64) for n in self.ngram_sizes
+        }
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encoded = [(" " + " ".join(text.lower().split()) + " ").encode("utf-8") for text in texts]
+        lengths = np.fromiter((len(data) for data in encoded), dtype=np.int64, count=len(encoded))
+        buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+        row_of_byte = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+
+        bucket_ids, signs = [], []
+        for n in self.ngram_sizes:
+            if len(buffer) < n:
+                continue
+            windows = np.lib.stride_tricks.sliding_window_view(buffer, n)
+            hashes = _mix((windows * self._powers[n]).sum(axis=1, dtype=np.uint64) + np.uint64(n))
+            # Windows spanning two texts are dropped
+            rows = row_of_byte[:len(windows)]
+            inside = rows == row_of_byte[n - 1:]
+            hashes, rows = hashes[inside], rows[inside]
+            bucket_ids.append(rows * self.dimension + (hashes % np.uint64(self.dimension)).astype(np.int64))
+            signs.append(np.where(hashes >> np.uint64(63), 1.0, -1.0))
+
+        counts = np.bincount(
+            np.concatenate(bucket_ids) if bucket_ids else np.empty(0, dtype=np.int64),
+            weights=np.concatenate(signs) if signs else None,
+            minlength=len(texts) * self.dimension,
+        ).reshape(len(texts), self.dimension)
+        norms = np.linalg.norm(counts, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (counts / norms).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
@@ -0,0 +1,127 @@
+# vector_store/embedding_cache.py
+
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of embedding vectors backed by SQLite.
+    Entries are keyed by a SHA-256 hash of (model name, text), so the same sentence
+    embedded by the same model is only ever sent to the embedding API once.
+    The cache is capped at `max_entries` and evicts the least recently used entries first.
+    """
+    # SQLite limits the number of bound parameters per statement
+    _LOOKUP_CHUNK_SIZE = 500
+
+    def __init__(self, path: str = "embedding_cache.sqlite3", max_entries: int = 100_000):
+        """
+        Initializes the EmbeddingCache.
+
+        Args:
+            path (str): Location of the SQLite database file. Created if it does not exist.
+            max_entries (int): Maximum number of vectors kept before LRU eviction kicks in.
+        """
+        if max_entries < 1:
+            raise ValueError("EmbeddingCache: max_entries must be at least 1.")
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        # Monotonic access counter used as the LRU clock; resumes from the persisted maximum
+        self._clock = self._conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """Returns the content address for `text` embedded with `model_name`."""
+        return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Looks up cached vectors for `texts`. Returns a list aligned with `texts`,
+        holding the vector on a hit and None on a miss.
+        """
+        keys = [self.make_key(model_name, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), self._LOOKUP_CHUNK_SIZE):
+                chunk = unique_keys[start:start + self._LOOKUP_CHUNK_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                self._clock += 1
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(self._clock, key) for key in found],
+                )
+                self._conn.commit()
+            results = [found.get(key) for key in keys]
+            hit_count = sum(1 for vector in results if vector is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model_name: str, texts: List[str], vectors: List[List[float]]) -> None:
+        """
+        Stores vectors for `texts`, then evicts least recently used entries above the size cap.
+        """
+        if len(texts) != len(vectors):
+            raise ValueError("EmbeddingCache: Length of texts and vectors must match.")
+        if not texts:
+            return
+        with self._lock:
+            self._clock += 1
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [
+                    (self.make_key(model_name, text), np.asarray(vector, dtype=np.float32).tobytes(), self._clock)
+                    for text, vector in zip(texts, vectors)
+                ],
+            )
+            overflow = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns size and hit/miss counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        """Closes the underlying SQLite connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,100 @@
+# vector_store/embedding_pipeline.py
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+class BatchEmbedder:
+    """
+    Embeds document texts in fixed-size batches spread over a bounded pool of worker threads.
+    Each batch is retried with exponential backoff, and the returned vectors always line up
+    with the order of the input texts, whatever order the batches complete in.
+    When an EmbeddingCache is supplied, only texts missing from the cache reach the model.
+    """
+    def __init__(self, embeddings, batch_size: int = 64, max_workers: int = 4,
+                 max_retries: int = 3, retry_backoff_seconds: float = 1.0,
+                 cache=None, model_name: str = ""):
+        """
+        Initializes the BatchEmbedder.
+
+        Args:
+            embeddings: Any LangChain-style embeddings object exposing `embed_documents(texts)`.
+            batch_size (int): Number of texts sent to the embedding model per call.
+            max_workers (int): Maximum number of batches embedded concurrently.
+            max_retries (int): Attempts per batch before the error is propagated.
+            retry_backoff_seconds (float): Delay before the first retry; doubled after each failure.
+            cache (Optional[EmbeddingCache]): Content-addressed vector cache consulted before embedding.
+            model_name (str): Embedding model name, part of the cache key.
+        """
+        if batch_size < 1:
+            raise ValueError("BatchEmbedder: batch_size must be at least 1.")
+        if max_workers < 1:
+            raise ValueError("BatchEmbedder: max_workers must be at least 1.")
+        if max_retries < 1:
+            raise ValueError("BatchEmbedder: max_retries must be at least 1.")
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds `texts` and returns one vector per text, in input order.
+        """
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        cached_vectors = self.cache.get_many(self.model_name, texts)
+        # Each distinct uncached text is embedded once, even if it repeats within this call
+        missing_texts = list(dict.fromkeys(text for text, vector in zip(texts, cached_vectors) if vector is None))
+        print(f"BatchEmbedder: Embedding cache served {len(texts) - sum(v is None for v in cached_vectors)} of {len(texts)} texts.")
+        if not missing_texts:
+            return cached_vectors
+
+        new_vectors = self._embed_uncached(missing_texts)
+        self.cache.put_many(self.model_name, missing_texts, new_vectors)
+        vector_by_text = dict(zip(missing_texts, new_vectors))
+        return [vector if vector is not None else vector_by_text[text] for text, vector in zip(texts, cached_vectors)]
+
+    def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        """
+        Sends `texts` to the embedding model in concurrent batches.
+        """
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        workers = min(self.max_workers, len(batches))
+        print(f"BatchEmbedder: Embedding {len(texts)} texts in {len(batches)} batches using {workers} workers...")
+
+        if workers == 1:
+            batch_results = [self._embed_batch_with_retry(batch) for batch in batches]
+        else:
+            # executor.map yields results in submission order, which keeps document order stable
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as executor:
+                batch_results = list(executor.map(self._embed_batch_with_retry, batches))
+
+        vectors = [vector for batch_vectors in batch_results for vector in batch_vectors]
+        if len(vectors) != len(texts):
+            raise ValueError(f"BatchEmbedder: Expected {len(texts)} embeddings but received {len(vectors)}.")
+        return vectors
+
+    def _embed_batch_with_retry(self, batch: List[str]) -> List[List[float]]:
+        """
+        Embeds a single batch, retrying transient failures with exponential backoff.
+        """
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                vectors = self.embeddings.embed_documents(batch)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"embedding model returned {len(vectors)} vectors for {len(batch)} texts")
+                return vectors
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"BatchEmbedder: Batch of {len(batch)} texts failed after {attempt} attempts: {e}")
+                    raise
+                delay = self.retry_backoff_seconds * (2 ** (attempt - 1))
+                print(f"BatchEmbedder: Attempt {attempt} failed for batch of {len(batch)} texts: {e}. Retrying in {delay:.1f}s...")
+                time.sleep(delay)
@@ -0,0 +1,165 @@
+# vector_store/float_vectors.py
+
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+# Rows copied per step when writing vectors to disk, bounding the extra memory a snapshot needs
+WRITE_CHUNK_ROWS = 65_536
+
+class FloatVectorStore:
+    """
+    Full-precision (float32) embeddings addressed by FAISS position.
+    Rows from the last snapshot are a read-only memory map of its vectors.npy; rows added since
+    live in RAM until the next snapshot. Quantized indexes only keep compressed codes, so this
+    is what exact re-ranking, filtered brute-force scoring and index rebuilds read from.
+
+    Rows are append-only and never change once written. The in-RAM rows are a tuple of immutable
+    chunks that add() replaces with a single assignment, so readers may call get() and iter_rows()
+    for positions they already know about while one writer appends, without any locking.
+    """
+    def __init__(self, dimension: int, base: Optional[np.ndarray] = None):
+        """
+        Initializes the FloatVectorStore.
+
+        Args:
+            dimension (int): Embedding dimension.
+            base (Optional[np.ndarray]): Initial (n, dimension) rows, e.g. a memory-mapped snapshot file.
+        """
+        self.dimension = dimension
+        self._base = base if base is not None else np.empty((0, dimension), dtype=np.float32)
+        # (chunks, start position of each chunk), replaced as a whole on every add
+        self._tail: Tuple[Tuple[np.ndarray, ...], Tuple[int, ...]] = ((), ())
+
+    @classmethod
+    def open(cls, path: str) -> "FloatVectorStore":
+        """Memory-maps a vectors.npy file written by save()."""
+        base = np.load(path, mmap_mode="r")
+        return cls(base.shape[1], base)
+
+    @classmethod
+    def from_index(cls, index) -> "FloatVectorStore":
+        """Recovers vectors from a FAISS index that stores them unquantized (older snapshots)."""
+        base = index.reconstruct_n(0, index.ntotal) if index.ntotal else None
+        return cls(index.d, base)
+
+    def __len__(self) -> int:
+        chunks, starts = self._tail
+        return starts[-1] + len(chunks[-1]) if chunks else len(self._base)
+
+    def add(self, vectors: np.ndarray) -> None:
+        """Appends rows for the positions following the current last one."""
+        vectors = np.array(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        if not len(vectors):
+            return
+        chunks, starts = self._tail
+        chunks, starts = list(chunks) + [vectors], list(starts) + [len(self)]
+        # Merge trailing chunks of similar size, so a long run of small batches is held in
+        # O(log n) chunks while every row is copied only O(log n) times
+        while len(chunks) > 1 and len(chunks[-2]) <= 2 * len(chunks[-1]):
+            merged = np.concatenate(chunks[-2:])
+            chunks[-2:], starts[-2:] = [merged], [starts[-2]]
+        self._tail = (tuple(chunks), tuple(starts))
+
+    def get(self, positions: np.ndarray) -> np.ndarray:
+        """Returns the float32 rows at `positions` as a new (len(positions), dimension) array."""
+        positions = np.asarray(positions, dtype=np.int64)
+        base_rows = len(self._base)
+        chunks, starts = self._tail
+        if not chunks or (len(positions) and positions.max() < base_rows):
+            return np.asarray(self._base[positions], dtype=np.float32)
+        result = np.empty((len(positions), self.dimension), dtype=np.float32)
+        in_base = positions < base_rows
+        result[in_base] = self._base[positions[in_base]]
+        tail_rows = np.flatnonzero(~in_base)
+        chunk_of_row = np.searchsorted(starts, positions[tail_rows], side="right") - 1
+        for chunk in np.unique(chunk_of_row):
+            rows = tail_rows[chunk_of_row == chunk]
+            result[rows] = chunks[chunk][positions[rows] - starts[chunk]]
+        return result
+
+    def iter_rows(self, start: int, stop: int) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yields (first position, rows) pieces covering positions [start, stop) without copying them."""
+        pieces = [(0, self._base)] + list(zip(self._tail[1], self._tail[0]))
+        for first, rows in pieces:
+            lo, hi = max(start, first), min(stop, first + len(rows))
+            if lo < hi:
+                yield lo, rows[lo - first:hi - first]
+
+    def save(self, path: str, count: Optional[int] = None) -> None:
+        """
+        Writes the first `count` rows (default: every row) to an .npy file in chunks, without
+        materializing the whole matrix. Rows appended meanwhile are not written.
+        """
+        count = len(self) if count is None else count
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(count, self.dimension))
+        offset = 0
+        for _, part in self.iter_rows(0, count):
+            for start in range(0, len(part), WRITE_CHUNK_ROWS):
+                chunk = part[start:start + WRITE_CHUNK_ROWS]
+                out[offset:offset + len(chunk)] = chunk
+                offset += len(chunk)
+        out.flush()
+        del out
+
+    @property
+    def nbytes_in_memory(self) -> int:
+        """Bytes held on the heap (rows added since the snapshot); mapped rows are not counted."""
+        tail_bytes = sum(chunk.nbytes for chunk in self._tail[0])
+        return tail_bytes + (0 if isinstance(self._base, np.memmap) else self._base.nbytes)
+
+def rerank_exact(queries: np.ndarray, candidates: np.ndarray, vectors: FloatVectorStore, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Re-orders approximate search results by exact squared L2 distance to the float vectors.
+
+    Args:
+        queries (np.ndarray): (q, dimension) float32 query matrix.
+        candidates (np.ndarray): (q, c) candidate positions from an index search; -1 marks missing results.
+        vectors (FloatVectorStore): Float vectors addressed by the same positions.
+        k (int): Number of results to keep per query.
+
+    Returns:
+        (distances, indices) shaped like a FAISS search result with min(k, c) columns.
+    """
+    valid = candidates >= 0
+    candidate_vectors = vectors.get(np.where(valid, candidates, 0).ravel()).reshape(*candidates.shape, -1)
+    exact = ((candidate_vectors - queries[:, None, :]) ** 2).sum(axis=2)
+    exact[~valid] = np.inf
+    top_k = min(k, candidates.shape[1])
+    nearest = np.argpartition(exact, top_k - 1, axis=1)[:, :top_k]
+    nearest_distances = np.take_along_axis(exact, nearest, axis=1)
+    order = np.argsort(nearest_distances, axis=1)
+    indices = np.take_along_axis(candidates, np.take_along_axis(nearest, order, axis=1), axis=1)
+    distances = np.take_along_axis(nearest_distances, order, axis=1)
+    indices[~np.isfinite(distances)] = -1
+    return distances, indices
+
+def squared_distances(queries: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Squared L2 distances for every (query, row) pair: |q|^2 - 2 q.r + |r|^2."""
+    distances = (queries ** 2).sum(axis=1)[:, None] - 2.0 * queries @ rows.T + (rows ** 2).sum(axis=1)[None, :]
+    np.maximum(distances, 0.0, out=distances)
+    return distances
+
+def top_k_smallest(distances: np.ndarray, positions: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Keeps the k smallest distances per row, sorted ascending, like a FAISS search result.
+
+    Args:
+        distances (np.ndarray): (q, n) distances; np.inf marks excluded entries.
+        positions (np.ndarray): Positions of the n columns, shape (n,) or (q, n).
+        k (int): Number of results to keep per query.
+
+    Returns:
+        (distances, indices) with min(k, n) columns; excluded entries come last with index -1.
+    """
+    top_k = min(k, distances.shape[1])
+    if top_k == 0:
+        return distances[:, :0], np.empty((len(distances), 0), dtype=np.int64)
+    positions = np.broadcast_to(positions, distances.shape)
+    nearest = np.argpartition(distances, top_k - 1, axis=1)[:, :top_k]
+    nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+    order = np.argsort(nearest_distances, axis=1)
+    indices = np.take_along_axis(positions, np.take_along_axis(nearest, order, axis=1), axis=1).astype(np.int64)
+    distances = np.take_along_axis(nearest_distances, order, axis=1)
+    indices[~np.isfinite(distances)] = -1
+    return distances, indices
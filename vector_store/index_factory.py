@@ -0,0 +1,169 @@
+# vector_store/index_factory.py
+
+from typing import Optional
+
+import faiss
+import numpy as np
+
+# Supported FAISS index layouts:
+#   "flat" - exact brute-force search (IndexFlatL2)
+#   "ivf"  - inverted file with k-means centroids (IndexIVFFlat); needs training, tuned with nprobe
+#   "hnsw" - hierarchical navigable small-world graph (IndexHNSWFlat); no training, tuned with efSearch
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+
+# How each index stores its vectors:
+#   "none" - float32, 4 bytes per dimension
+#   "sq8"  - int8 scalar quantization, 1 byte per dimension (4x smaller)
+#   "pq"   - product quantization, one byte per sub-vector (e.g. 96 bytes for 768 dims, 32x smaller)
+# Quantized indexes return approximate distances; callers re-rank candidates with the float vectors.
+QUANTIZATION_MODES = ("none", "sq8", "pq")
+
+# Bits per product-quantization code; k-means needs at least 2**PQ_NBITS training vectors
+PQ_NBITS = 8
+
+# FAISS warns when k-means gets fewer than this many training points per centroid
+IVF_MIN_POINTS_PER_CENTROID = 39
+
+def validate_index_type(index_type: str) -> str:
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'. Expected one of {', '.join(INDEX_TYPES)}.")
+    return index_type
+
+def validate_quantization(quantization: str) -> str:
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization '{quantization}'. Expected one of {', '.join(QUANTIZATION_MODES)}.")
+    return quantization
+
+def index_type_of(index) -> str:
+    """Returns which of INDEX_TYPES a FAISS index object is."""
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivf"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+def quantization_of(index) -> str:
+    """Returns which of QUANTIZATION_MODES a FAISS index object uses for its vectors."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        storage = faiss.downcast_index(ivf)
+    elif isinstance(index, faiss.IndexHNSW):
+        storage = faiss.downcast_index(index.storage)
+    else:
+        storage = index
+    if isinstance(storage, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "sq8"
+    if isinstance(storage, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "none"
+
+def effective_pq_m(pq_m: int, dimension: int) -> int:
+    """Largest number of PQ sub-vectors not above `pq_m` that divides `dimension` evenly."""
+    pq_m = max(1, min(pq_m, dimension))
+    while dimension % pq_m:
+        pq_m -= 1
+    return pq_m
+
+def effective_nlist(nlist: int, num_vectors: int) -> int:
+    """Caps the number of IVF centroids so every centroid gets enough training points."""
+    return max(1, min(nlist, num_vectors // IVF_MIN_POINTS_PER_CENTROID))
+
+def build_index(index_type: str, vectors: np.ndarray, nlist: int = 1024, nprobe: int = 8,
+                hnsw_m: int = 32, ef_construction: int = 200, ef_search: int = 64,
+                quantization: str = "none", pq_m: int = 96):
+    """
+    Creates an index of `index_type`, trains it on `vectors` if the layout needs training,
+    and adds the vectors in order, so row i of `vectors` ends up at position i.
+
+    Args:
+        index_type (str): One of INDEX_TYPES.
+        vectors (np.ndarray): float32 matrix of shape (n, dimension).
+        nlist (int): Requested number of IVF centroids; capped by effective_nlist.
+        nprobe (int): Default number of IVF lists visited per query.
+        hnsw_m (int): Graph degree of HNSW.
+        ef_construction (int): HNSW candidate list size while building the graph.
+        ef_search (int): Default HNSW candidate list size per query.
+        quantization (str): One of QUANTIZATION_MODES.
+        pq_m (int): Requested number of PQ sub-vectors; capped by effective_pq_m.
+    """
+    validate_index_type(index_type)
+    validate_quantization(quantization)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dimension = vectors.shape[1]
+    if quantization == "pq" and len(vectors) < 2 ** PQ_NBITS:
+        raise ValueError(f"Product quantization needs at least {2 ** PQ_NBITS} vectors to train, got {len(vectors)}.")
+    sq8 = faiss.ScalarQuantizer.QT_8bit
+    pq_m = effective_pq_m(pq_m, dimension)
+    if index_type == "ivf":
+        lists = effective_nlist(nlist, len(vectors))
+        quantizer = faiss.IndexFlatL2(dimension)
+        if quantization == "sq8":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, lists, sq8, faiss.METRIC_L2)
+        elif quantization == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dimension, lists, pq_m, PQ_NBITS)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dimension, lists, faiss.METRIC_L2)
+        index.nprobe = min(nprobe, lists)
+    elif index_type == "hnsw":
+        if quantization == "sq8":
+            index = faiss.IndexHNSWSQ(dimension, sq8, hnsw_m)
+        elif quantization == "pq":
+            index = faiss.IndexHNSWPQ(dimension, pq_m, hnsw_m, PQ_NBITS)
+        else:
+            index = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+    else:
+        if quantization == "sq8":
+            index = faiss.IndexScalarQuantizer(dimension, sq8, faiss.METRIC_L2)
+        elif quantization == "pq":
+            index = faiss.IndexPQ(dimension, pq_m, PQ_NBITS)
+        else:
+            index = faiss.IndexFlatL2(dimension)
+    if not index.is_trained:
+        index.train(vectors)
+    if len(vectors):
+        index.add(vectors)
+    enable_reconstruction(index)
+    return index
+
+def enable_reconstruction(index) -> None:
+    """
+    Makes `reconstruct`/`reconstruct_batch` available. IVF indexes need a direct map
+    from position to inverted-list entry; flat and HNSW storage support it natively.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+def empty_like(index):
+    """Returns an empty copy of `index` that keeps its training (IVF centroids) and parameters."""
+    fresh = faiss.clone_index(index)
+    fresh.reset()
+    enable_reconstruction(fresh)
+    return fresh
+
+def supports_selector(index) -> bool:
+    """Whether a search of `index` can be restricted by an ID selector; IndexPQ rejects any SearchParameters."""
+    return not isinstance(index, faiss.IndexPQ)
+
+def make_search_params(index, selector=None, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """
+    Builds the SearchParameters subclass matching `index`, carrying an optional ID selector
+    and per-query nprobe / efSearch overrides. Returns None when there is nothing to set.
+    Check supports_selector first: an index that rejects selectors raises on search.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe or ivf.nprobe
+    elif isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or index.hnsw.efSearch
+    elif selector is not None:
+        params = faiss.SearchParameters()
+    else:
+        return None
+    if selector is not None:
+        params.sel = selector
+    return params
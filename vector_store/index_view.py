@@ -0,0 +1,198 @@
+# vector_store/index_view.py
+
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from vector_store.float_vectors import FloatVectorStore, squared_distances, top_k_smallest
+from vector_store.mmap_snapshot import MmapDocstore
+from vector_store.numpy_search import normalize_queries, top_k_similar
+
+class PositionalDocuments:
+    """
+    Documents addressed by index position, laid out like FloatVectorStore: a read-only base
+    (the rows of a snapshot's document file, or an earlier generation renumbered by a rebuild)
+    followed by an append-only in-memory tail. A position's document never changes once written,
+    so readers can look up positions they already know about while a writer appends.
+    """
+    def __init__(self, base: Optional[Callable[[int], Document]] = None, base_count: int = 0):
+        """
+        Initializes the PositionalDocuments.
+
+        Args:
+            base (Optional[Callable[[int], Document]]): Returns the document at a base position.
+            base_count (int): Number of base positions.
+        """
+        self._base = base
+        self._base_count = base_count
+        self._tail: List[Document] = []
+
+    @classmethod
+    def from_snapshot(cls, docstore: MmapDocstore) -> "PositionalDocuments":
+        """Serves the rows of a snapshot's memory-mapped document file."""
+        return cls(docstore.document_at, docstore.row_count)
+
+    @classmethod
+    def renumbered(cls, documents: "PositionalDocuments", positions: np.ndarray) -> "PositionalDocuments":
+        """Documents of a rebuilt index whose position i holds what `documents` has at positions[i]."""
+        return cls(lambda position: documents.at(int(positions[position])), len(positions))
+
+    def __len__(self) -> int:
+        return self._base_count + len(self._tail)
+
+    def append(self, documents: Iterable[Document]) -> None:
+        """Appends documents for the positions following the current last one."""
+        self._tail.extend(list(documents))
+
+    def at(self, position: int) -> Document:
+        if position < self._base_count:
+            return self._base(position)
+        return self._tail[position - self._base_count]
+
+class IndexView:
+    """
+    Immutable state a search of one vector store reads, published by the writer with a single
+    reference swap. Nothing a view refers to changes in a way the view can observe: the FAISS
+    index is replaced rather than added to once published, vectors and documents only grow past
+    the view's `count`, and the tombstone set is frozen. Searches take the current view with one
+    attribute read and use nothing else, so they run without locks while writes continue.
+
+    Positions [0, index.ntotal) are searched through the FAISS index. Positions [index.ntotal, count)
+    were written after the index was built; they are scanned exactly from their float vectors
+    until the writer merges them into a new copy of the index. With the NumPy engine, the view
+    also carries the normalized matrix of all positions and FAISS is not searched at all.
+    """
+    def __init__(self, generation: int, index, count: int, tombstones: FrozenSet[int], vectors: FloatVectorStore,
+                 documents: PositionalDocuments, position_by_id: Dict[str, int], matrix: Optional[np.ndarray] = None):
+        """
+        Initializes the IndexView.
+
+        Args:
+            generation (int): Increases with every published view of a store.
+            index: FAISS index over positions [0, index.ntotal). Must not be modified afterwards.
+            count (int): Number of positions visible to this view.
+            tombstones (FrozenSet[int]): Positions of deleted or replaced documents.
+            vectors (FloatVectorStore): Float vectors by position; may grow past `count`.
+            documents (PositionalDocuments): Documents by position; may grow past `count`.
+            position_by_id (Dict[str, int]): The writer's live document ID -> position map of this generation.
+            matrix (Optional[np.ndarray]): Normalized vectors by position (NormalizedMatrix rows), for the
+                                           NumPy engine; may hold more rows than `count`.
+        """
+        self.generation = generation
+        self.index = index
+        self.indexed_count = index.ntotal
+        self.count = count
+        self.tombstones = tombstones
+        self.vectors = vectors
+        self.documents = documents
+        self._position_by_id = position_by_id
+        self.matrix = matrix
+        self._exclusion_selector = None
+        self._tombstone_array: Optional[np.ndarray] = None
+
+    @property
+    def live_count(self) -> int:
+        return self.count - len(self.tombstones)
+
+    def position_of(self, doc_id: str) -> Optional[int]:
+        """
+        Returns the position of `doc_id` in this view, or None. The ID map is the writer's, so an ID
+        re-indexed or deleted after the view was published is left out rather than resolved to a
+        version the view does not contain.
+        """
+        position = self._position_by_id.get(doc_id)
+        if position is None or position >= self.count or position in self.tombstones:
+            return None
+        return position
+
+    def positions_for_ids(self, doc_ids: Iterable[str]) -> np.ndarray:
+        """Maps document IDs to their positions in this view (see position_of), in ascending order."""
+        positions = [position for position in map(self.position_of, doc_ids) if position is not None]
+        return np.sort(np.asarray(positions, dtype=np.int64))
+
+    def exclusion_selector(self):
+        """
+        Returns a FAISS selector that skips tombstoned positions, or None if there are none.
+        The inner batch selector is kept alongside, since IDSelectorNot only holds a pointer to it.
+        """
+        if not self.tombstones:
+            return None
+        if self._exclusion_selector is None:
+            excluded = faiss.IDSelectorBatch(self.tombstone_positions())
+            self._exclusion_selector = (excluded, faiss.IDSelectorNot(excluded))
+        return self._exclusion_selector[1]
+
+    def tombstone_positions(self) -> np.ndarray:
+        """Tombstoned positions as a sorted array."""
+        if self._tombstone_array is None:
+            self._tombstone_array = np.sort(np.fromiter(self.tombstones, dtype=np.int64, count=len(self.tombstones)))
+        return self._tombstone_array
+
+    def scan_unindexed(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact k-nearest search over the positions written after the FAISS index was built.
+        Returns (distances, indices) like a FAISS search, with -1 for missing results.
+        """
+        pieces = list(self.vectors.iter_rows(self.indexed_count, self.count))
+        if not pieces:
+            return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+        distances = np.concatenate([squared_distances(queries, rows) for _, rows in pieces], axis=1)
+        positions = np.arange(self.indexed_count, self.count, dtype=np.int64)
+        if self.tombstones:
+            distances[:, np.isin(positions, self.tombstone_positions())] = np.inf
+        return top_k_smallest(distances, positions, k)
+
+    def score_positions(self, queries: np.ndarray, positions: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact k-nearest search restricted to `positions`, scored from their float vectors."""
+        return top_k_smallest(squared_distances(queries, self.vectors.get(positions)), positions, k)
+
+    def search_matrix(self, queries: np.ndarray, k: int, positions: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact k-nearest search over the normalized matrix, of all live positions or only of `positions`.
+        Returns (distances, indices) like a FAISS search; see top_k_similar.
+        """
+        queries = normalize_queries(queries)
+        if positions is None:
+            excluded = self.tombstone_positions() if self.tombstones else None
+            return top_k_similar(queries, self.matrix[:self.count], k, excluded=excluded)
+        if 4 * len(positions) >= self.count:
+            # Copying out most of the matrix costs more than scoring all of it and masking the rest
+            allowed = np.zeros(self.count, dtype=bool)
+            allowed[positions] = True
+            return top_k_similar(queries, self.matrix[:self.count], k, excluded=np.flatnonzero(~allowed))
+        return top_k_similar(queries, self.matrix[positions], k, positions=positions)
+
+    def results(self, distances: np.ndarray, indices: np.ndarray, with_vectors: bool = False) -> List[List[Tuple]]:
+        """
+        Turns search output into (document, distance) lists, skipping missing (-1) results.
+        With `with_vectors`, each hit is a (document, distance, float vector) triple instead.
+        """
+        documents = self.documents
+        if not with_vectors:
+            return [
+                [(documents.at(int(position)), float(distance)) for position, distance in zip(row_indices, row_distances) if position >= 0]
+                for row_indices, row_distances in zip(indices, distances)
+            ]
+        results = []
+        for row_indices, row_distances in zip(indices, distances):
+            found = row_indices >= 0
+            positions = row_indices[found]
+            results.append([
+                (documents.at(int(position)), float(distance), vector)
+                for position, distance, vector in zip(positions, row_distances[found], self.vectors.get(positions))
+            ])
+        return results
+
+def merge_nearest(first: Tuple[np.ndarray, np.ndarray], second: Tuple[np.ndarray, np.ndarray],
+                  k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Merges two (distances, indices) search results over disjoint positions into the k nearest per query."""
+    if second[1].shape[1] == 0:
+        return first
+    if first[1].shape[1] == 0:
+        return second
+    distances = np.concatenate([first[0], second[0]], axis=1).astype(np.float32)
+    indices = np.concatenate([first[1], second[1]], axis=1)
+    distances[indices < 0] = np.inf
+    return top_k_smallest(distances, indices, k)
@@ -0,0 +1,129 @@
+# vector_store/ingest_jobs.py
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+# Lifecycle of an ingest job: queued -> running -> succeeded | failed
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+class IngestJobQueue:
+    """
+    Runs indexing requests as background jobs on a bounded worker pool, so the API can accept
+    a bulk ingest and return at once instead of embedding on the request path.
+
+    Each job indexes its documents in slices of `batch_size` through `index_batch`, which is
+    called as index_batch(documents, metadata, ids) and returns the number of documents indexed.
+    Progress is recorded after every slice. Finished jobs are kept for status lookups until
+    more than `max_finished_jobs` have accumulated, oldest first out.
+    """
+    def __init__(self, index_batch: Callable[[List[str], Optional[List[Dict[str, Any]]], Optional[List[Optional[str]]]], int],
+                 max_workers: int = 2, batch_size: int = 256, max_finished_jobs: int = 1000):
+        """
+        Initializes the IngestJobQueue.
+
+        Args:
+            index_batch (Callable): Embeds and indexes one slice of a job.
+            max_workers (int): Number of jobs running at once.
+            batch_size (int): Documents per slice; progress is reported at slice boundaries.
+            max_finished_jobs (int): Finished jobs kept for status lookups.
+        """
+        self.index_batch = index_batch
+        self.batch_size = max(1, batch_size)
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="retriever-ingest")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, documents: List[str], metadata: Optional[List[Dict[str, Any]]] = None,
+               ids: Optional[List[Optional[str]]] = None) -> Dict[str, Any]:
+        """Queues an indexing job and returns its initial status, including the job ID."""
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": JOB_QUEUED,
+            "document_count": len(documents),
+            "processed_count": 0,
+            "indexed_count": 0,
+            "error": None,
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._futures[job_id] = self._executor.submit(self._run, job_id, documents, metadata, ids)
+            return self._status(job)
+
+    def _run(self, job_id: str, documents: List[str], metadata: Optional[List[Dict[str, Any]]],
+             ids: Optional[List[Optional[str]]]) -> None:
+        self._update(job_id, status=JOB_RUNNING, started_at=time.time())
+        try:
+            for start in range(0, len(documents), self.batch_size):
+                end = start + self.batch_size
+                indexed_count = self.index_batch(
+                    documents[start:end],
+                    metadata[start:end] if metadata else None,
+                    ids[start:end] if ids else None,
+                )
+                with self._lock:
+                    job = self._jobs[job_id]
+                    job["processed_count"] = min(end, len(documents))
+                    job["indexed_count"] += indexed_count
+            self._update(job_id, status=JOB_SUCCEEDED, finished_at=time.time())
+        except Exception as e:
+            # HTTPException carries its message in `detail`
+            error = getattr(e, "detail", None) or f"{type(e).__name__}: {e}"
+            print(f"RetrieverAgent: Ingest job {job_id} failed: {error}")
+            self._update(job_id, status=JOB_FAILED, error=str(error), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._futures.pop(job_id, None)
+                self._evict_finished()
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _evict_finished(self) -> None:
+        """Drops the oldest finished jobs beyond max_finished_jobs. Callers must hold self._lock."""
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in (JOB_SUCCEEDED, JOB_FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    @staticmethod
+    def _status(job: Dict[str, Any]) -> Dict[str, Any]:
+        status = dict(job)
+        status["progress"] = job["processed_count"] / job["document_count"] if job["document_count"] else 1.0
+        return status
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Returns a copy of the job's status with a 0-1 `progress` fraction, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._status(job) if job is not None else None
+
+    def finished_jobs(self) -> List[Dict[str, Any]]:
+        """Copies of the statuses of succeeded and failed jobs still kept, oldest first."""
+        with self._lock:
+            return [self._status(job) for job in self._jobs.values() if job["status"] in (JOB_SUCCEEDED, JOB_FAILED)]
+
+    def future(self, job_id: str) -> Optional[Future]:
+        """Returns the future of a queued or running job, e.g. to await its completion; None once finished."""
+        with self._lock:
+            return self._futures.get(job_id)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._futures)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stops accepting jobs; with `wait`, blocks until queued and running jobs have finished."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,74 @@
+# vector_store/latency_stats.py
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator
+
+import numpy as np
+
+class RollingLatencies:
+    """
+    Durations of the last `window` calls of one stage, in milliseconds. Old samples drop out as new
+    ones arrive, so percentiles describe recent behaviour rather than everything since startup.
+    """
+    def __init__(self, window: int = 1024):
+        self._samples: Deque[float] = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+        self.count = 0 # Calls recorded since startup, including those that left the window
+
+    def record(self, milliseconds: float) -> None:
+        with self._lock:
+            self._samples.append(milliseconds)
+            self.count += 1
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = np.fromiter(self._samples, dtype=np.float64, count=len(self._samples))
+            count = self.count
+        if not len(samples):
+            return {"count": count, "window": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        return {
+            "count": count,
+            "window": len(samples),
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "max_ms": round(float(samples.max()), 3),
+        }
+
+class LatencyStats:
+    """Rolling latencies per named stage ("embed", "search", "save", ...), created on first use."""
+    def __init__(self, window: int = 1024):
+        """
+        Initializes the LatencyStats.
+
+        Args:
+            window (int): Number of most recent calls per stage the percentiles are computed over.
+        """
+        self.window = window
+        self._stages: Dict[str, RollingLatencies] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, milliseconds: float) -> None:
+        latencies = self._stages.get(stage)
+        if latencies is None:
+            with self._lock:
+                latencies = self._stages.setdefault(stage, RollingLatencies(self.window))
+        latencies.record(milliseconds)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """Records how long the body of the `with` block takes, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            stages = dict(self._stages)
+        return {stage: latencies.summary() for stage, latencies in sorted(stages.items())}
@@ -0,0 +1,128 @@
+# vector_store/lexical_index.py
+
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+# Tokens keep inner dots, dashes and ampersands so tickers and dates stay whole:
+# "005930.KS" -> "005930.ks", "2330.TW" -> "2330.tw", "2025-05-29" -> "2025-05-29", "S&P" -> "s&p"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-&][a-z0-9]+)*")
+
+# Function words that carry no lexical signal in market questions
+STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from has have how in is it its of on or "
+    "our s the their this to was were what whats when which who why will with".split()
+)
+
+# Constant of reciprocal rank fusion: a document at rank r of a ranking contributes 1 / (RRF_K + r)
+RRF_K = 60
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over document texts, kept next to the FAISS store so that
+    exact-term queries (tickers like "005930.KS") can be answered without an embedding call.
+
+    Scores are normalized by the query's total IDF over terms present in the corpus, so a
+    document containing every known query term about once at average length scores roughly 1.0.
+    That makes scores comparable across queries and across shards with different statistics.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Initializes the BM25Index.
+
+        Args:
+            k1 (float): Term-frequency saturation.
+            b (float): Strength of document length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._doc_lengths: Dict[str, int] = {}
+        self._terms_by_doc: Dict[str, List[str]] = {}
+        self._total_length = 0
+
+    def add(self, doc_id: str, text: str) -> None:
+        """Indexes the text of `doc_id`, replacing whatever was indexed for it before."""
+        self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self._postings[term][doc_id] = tf
+        length = sum(counts.values())
+        self._doc_lengths[doc_id] = length
+        self._terms_by_doc[doc_id] = list(counts)
+        self._total_length += length
+
+    def remove(self, doc_id: str) -> None:
+        length = self._doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in self._terms_by_doc.pop(doc_id):
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def rebuild(self, documents: Iterable[Tuple[str, str]]) -> None:
+        """Rebuilds the index from (doc_id, text) pairs."""
+        self._postings.clear()
+        self._doc_lengths.clear()
+        self._terms_by_doc.clear()
+        self._total_length = 0
+        for doc_id, text in documents:
+            self.add(doc_id, text)
+
+    def _idf(self, df: int) -> float:
+        n = len(self._doc_lengths)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int, allowed: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (doc_id, normalized BM25 score) pairs, best first.
+        `allowed` restricts scoring to a candidate set, e.g. from the metadata index.
+        """
+        num_docs = len(self._doc_lengths)
+        if not num_docs:
+            return []
+        average_length = self._total_length / num_docs or 1.0
+        scores: Dict[str, float] = defaultdict(float)
+        query_idf = 0.0
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(len(postings))
+            query_idf += idf
+            # list() copies the postings in one step, so searches may run while a writer adds or removes documents
+            for doc_id, tf in list(postings.items()):
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                doc_length = self._doc_lengths.get(doc_id)
+                if doc_length is None:
+                    continue
+                length_norm = 1.0 - self.b + self.b * doc_length / average_length
+                scores[doc_id] += idf * tf * (self.k1 + 1.0) / (tf + self.k1 * length_norm)
+        if not scores:
+            return []
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(doc_id, score / query_idf) for doc_id, score in best]
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+def reciprocal_rank_fusion(rankings: List[List[Hashable]], k: int, rrf_k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """
+    Merges several best-first rankings of keys with reciprocal rank fusion and returns the
+    top k (key, fused score) pairs. Only ranks are used, so dense distances and BM25 scores
+    never have to be put on a common scale.
+    """
+    fused: Dict[Hashable, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] += 1.0 / (rrf_k + rank)
+    return heapq.nlargest(k, fused.items(), key=lambda item: item[1])
@@ -0,0 +1,92 @@
+# vector_store/metadata_index.py
+
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+class MetadataIndex:
+    """
+    Inverted index from metadata (key, value) pairs to document IDs.
+    Used to resolve filters such as {"type": "earnings_surprise", "symbol": "TSM"} into
+    a candidate set before any vector scoring happens.
+
+    Values are compared as strings, so a filter value of 2025 matches stored "2025".
+    List-valued metadata indexes each element; a list in a filter means "any of these values".
+    """
+    def __init__(self):
+        self._postings: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        self._terms_by_doc: Dict[str, List[Tuple[str, str]]] = {}
+
+    @staticmethod
+    def _normalize(value: Any) -> str:
+        return str(value)
+
+    @classmethod
+    def _terms(cls, metadata: Dict[str, Any]) -> List[Tuple[str, str]]:
+        terms = []
+        for key, value in (metadata or {}).items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            for item in values:
+                if isinstance(item, (str, int, float, bool)):
+                    terms.append((key, cls._normalize(item)))
+        return terms
+
+    def add(self, doc_id: str, metadata: Dict[str, Any]) -> None:
+        """Indexes the metadata of `doc_id`, replacing whatever was indexed for it before."""
+        self.remove(doc_id)
+        terms = self._terms(metadata)
+        for term in terms:
+            self._postings[term].add(doc_id)
+        self._terms_by_doc[doc_id] = terms
+
+    def remove(self, doc_id: str) -> None:
+        """Removes `doc_id` from every posting list it appears in."""
+        for term in self._terms_by_doc.pop(doc_id, []):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[term]
+
+    def rebuild(self, documents: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        """Rebuilds the index from (doc_id, metadata) pairs, e.g. after loading a snapshot."""
+        self._postings.clear()
+        self._terms_by_doc.clear()
+        for doc_id, metadata in documents:
+            self.add(doc_id, metadata)
+
+    def candidates(self, filters: Dict[str, Any]) -> Set[str]:
+        """
+        Returns IDs of documents matching every key in `filters` (AND across keys,
+        OR across the values listed for one key).
+        """
+        per_key: List[Set[str]] = []
+        for key, value in filters.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            matched: Set[str] = set()
+            for item in values:
+                matched |= self._postings.get((key, self._normalize(item)), set())
+            if not matched:
+                return set()
+            per_key.append(matched)
+        if not per_key:
+            return set(self._terms_by_doc)
+        # Intersect starting from the most selective key to keep the work proportional to the result
+        per_key.sort(key=len)
+        result = set(per_key[0])
+        for matched in per_key[1:]:
+            result &= matched
+            if not result:
+                break
+        return result
+
+    def values(self, key: str) -> Set[str]:
+        """Returns every distinct (normalized) value indexed under `key`."""
+        # list() copies the keys in one step, so a concurrent add or remove cannot break the iteration
+        return {value for term_key, value in list(self._postings) if term_key == key}
+
+    def value_counts(self, key: str) -> Dict[str, int]:
+        """Returns the number of documents indexed under each (normalized) value of `key`."""
+        return {value: len(doc_ids) for (term_key, value), doc_ids in list(self._postings.items()) if term_key == key}
+
+    def __len__(self) -> int:
+        return len(self._terms_by_doc)
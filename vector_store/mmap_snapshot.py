@@ -0,0 +1,195 @@
+# vector_store/mmap_snapshot.py
+
+import json
+import os
+import shutil
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+from vector_store.float_vectors import FloatVectorStore
+
+# Snapshot layout inside the vector store directory:
+#   CURRENT                    - name of the live snapshot directory, replaced atomically
+#   snapshot-<generation>/
+#       manifest.json          - format version, document count, dimension, index type
+#       index.faiss            - FAISS index, position i holds the vector of document row i
+#       ids.json               - document IDs in row order, null for rows of deleted or replaced documents
+#       vectors.npy            - float32 embeddings in row order, kept for exact re-ranking of quantized indexes
+#       documents.bin          - concatenated UTF-8 JSON records {"text", "metadata"}
+#       documents.offsets.npy  - int64 byte offsets into documents.bin (count + 1 entries)
+# Every file is written once and never modified, so it can be mapped read-only and its pages
+# shared through the OS page cache by every worker process serving the same directory.
+CURRENT_POINTER = "CURRENT"
+SNAPSHOT_PREFIX = "snapshot-"
+SNAPSHOT_FORMAT_VERSION = 1
+
+def has_snapshot(base_path: str) -> bool:
+    return os.path.exists(os.path.join(base_path, CURRENT_POINTER))
+
+def current_snapshot_dir(base_path: str) -> str:
+    with open(os.path.join(base_path, CURRENT_POINTER), "r", encoding="utf-8") as f:
+        return os.path.join(base_path, f.read().strip())
+
+def _mmap_flags(index_type: str) -> int:
+    """
+    Read flags that map the index's bulk storage instead of copying it onto the heap.
+    IVF inverted lists and flat code arrays are mapped by different FAISS IO hooks;
+    FAISS builds without flat-code mapping fall back to a regular read.
+    """
+    if index_type == "ivf":
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+    return 0
+
+def _fsync_file(path: str) -> None:
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+def write_snapshot(base_path: str, index, ordered_ids: List[Optional[str]], documents: Iterable[Document], index_type: str,
+                   vectors: Optional[FloatVectorStore] = None, quantization: str = "none") -> str:
+    """
+    Writes a new snapshot generation and atomically points CURRENT at it.
+    `ordered_ids`, `documents` and `vectors` must follow index positions 0..ntotal-1; a None ID
+    marks a tombstoned row that stays in the index but is no longer served. `vectors` may hold more
+    rows than the index, e.g. when a writer appends while the snapshot is written; only the first
+    ntotal are saved.
+    Older generations are removed afterwards; processes that still map them keep
+    valid mappings until they reopen. Returns the new snapshot directory.
+    """
+    os.makedirs(base_path, exist_ok=True)
+    generations = [
+        int(name[len(SNAPSHOT_PREFIX):]) for name in os.listdir(base_path)
+        if name.startswith(SNAPSHOT_PREFIX) and name[len(SNAPSHOT_PREFIX):].isdigit()
+    ]
+    name = f"{SNAPSHOT_PREFIX}{max(generations, default=0) + 1:08d}"
+    tmp_dir = os.path.join(base_path, f".{name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    faiss.write_index(index, os.path.join(tmp_dir, "index.faiss"))
+    offsets = [0]
+    with open(os.path.join(tmp_dir, "documents.bin"), "wb") as f:
+        for doc in documents:
+            record = json.dumps({"text": doc.page_content, "metadata": doc.metadata}, separators=(",", ":")).encode("utf-8")
+            f.write(record)
+            offsets.append(offsets[-1] + len(record))
+    np.save(os.path.join(tmp_dir, "documents.offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(tmp_dir, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump(ordered_ids, f)
+    if vectors is not None:
+        vectors.save(os.path.join(tmp_dir, "vectors.npy"), index.ntotal)
+    if len(ordered_ids) != index.ntotal or len(offsets) != index.ntotal + 1 or (vectors is not None and len(vectors) < index.ntotal):
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise ValueError(f"Snapshot is inconsistent: {index.ntotal} vectors, {len(ordered_ids)} IDs, {len(offsets) - 1} documents.")
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "count": index.ntotal,
+            "tombstones": sum(doc_id is None for doc_id in ordered_ids),
+            "dimension": index.d,
+            "index_type": index_type,
+            "quantization": quantization,
+            "created_at": time.time(),
+        }, f)
+    for filename in os.listdir(tmp_dir):
+        _fsync_file(os.path.join(tmp_dir, filename))
+
+    final_dir = os.path.join(base_path, name)
+    os.rename(tmp_dir, final_dir)
+    pointer_tmp = os.path.join(base_path, f"{CURRENT_POINTER}.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(base_path, CURRENT_POINTER))
+
+    for old_name in os.listdir(base_path):
+        if old_name.startswith(SNAPSHOT_PREFIX) and old_name != name:
+            shutil.rmtree(os.path.join(base_path, old_name), ignore_errors=True)
+    return final_dir
+
+def read_manifest(snapshot_dir: str) -> Dict:
+    with open(os.path.join(snapshot_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def read_snapshot_index(snapshot_dir: str, mmap: bool = True):
+    """
+    Reads the snapshot's FAISS index. With `mmap`, the index is a read-only view of the file:
+    it can be searched and reconstructed from, but must never be added to.
+    """
+    flags = _mmap_flags(read_manifest(snapshot_dir)["index_type"]) if mmap else 0
+    return faiss.read_index(os.path.join(snapshot_dir, "index.faiss"), flags)
+
+def read_snapshot_vectors(snapshot_dir: str) -> Optional[FloatVectorStore]:
+    """Memory-maps the snapshot's float32 vectors, or returns None for snapshots written without them."""
+    path = os.path.join(snapshot_dir, "vectors.npy")
+    return FloatVectorStore.open(path) if os.path.exists(path) else None
+
+def load_snapshot(base_path: str, mmap: bool = True) -> Tuple[object, List[Optional[str]], "MmapDocstore", str]:
+    """
+    Opens the current snapshot. Returns (index, ids in position order, docstore, snapshot directory).
+    Tombstoned positions have the ID None.
+    Only the ID list is parsed eagerly; vectors and documents stay on disk until touched.
+    """
+    snapshot_dir = current_snapshot_dir(base_path)
+    index = read_snapshot_index(snapshot_dir, mmap=mmap)
+    with open(os.path.join(snapshot_dir, "ids.json"), "r", encoding="utf-8") as f:
+        ids = json.load(f)
+    return index, ids, MmapDocstore(snapshot_dir, ids), snapshot_dir
+
+
+class MmapDocstore(Docstore, AddableMixin):
+    """
+    LangChain docstore over a snapshot's memory-mapped document file.
+    Documents are decoded on lookup, so opening it costs only the ID -> row map.
+    Writes made after the snapshot live in an in-memory overlay until the next snapshot.
+    """
+    def __init__(self, snapshot_dir: str, ids: List[Optional[str]]):
+        self.snapshot_dir = snapshot_dir
+        self._offsets = np.load(os.path.join(snapshot_dir, "documents.offsets.npy"), mmap_mode="r")
+        blob_path = os.path.join(snapshot_dir, "documents.bin")
+        # np.memmap refuses zero-length files
+        self._blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else np.empty(0, dtype=np.uint8)
+        self._row_by_id: Dict[str, int] = {doc_id: row for row, doc_id in enumerate(ids) if doc_id is not None}
+        self._added: Dict[str, Document] = {}
+        self._deleted: Set[str] = set()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._added or (doc_id in self._row_by_id and doc_id not in self._deleted)
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self._added:
+            return self._added[search]
+        row = self._row_by_id.get(search)
+        if row is None or search in self._deleted:
+            return f"ID {search} not found."
+        return self.document_at(row)
+
+    def document_at(self, row: int) -> Document:
+        """Decodes the snapshot document at `row`, ignoring the overlay. Snapshot rows never change."""
+        record = json.loads(self._blob[int(self._offsets[row]):int(self._offsets[row + 1])].tobytes())
+        return Document(page_content=record["text"], metadata=record["metadata"])
+
+    @property
+    def row_count(self) -> int:
+        return len(self._offsets) - 1
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = [doc_id for doc_id in texts if doc_id in self]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids: List) -> None:
+        existing = [doc_id for doc_id in ids if doc_id in self]
+        if not existing:
+            raise ValueError(f"Tried to delete ids that does not exist: {ids}")
+        for doc_id in existing:
+            if self._added.pop(doc_id, None) is None:
+                self._deleted.add(doc_id)
@@ -0,0 +1,97 @@
+# vector_store/numpy_search.py
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+from vector_store.float_vectors import FloatVectorStore
+
+# Engines the Retriever Agent can answer dense searches with:
+#   "faiss" - the FAISS index (flat, IVF or HNSW, optionally quantized)
+#   "numpy" - exact search over NormalizedMatrix below; no index, no per-call wrapper overhead
+SEARCH_ENGINES = ("faiss", "numpy")
+
+def validate_search_engine(engine: str) -> str:
+    if engine not in SEARCH_ENGINES:
+        raise ValueError(f"Unknown search engine '{engine}'. Expected one of {', '.join(SEARCH_ENGINES)}.")
+    return engine
+
+class NormalizedMatrix:
+    """
+    L2-normalized embeddings by position in one contiguous float32 array, so a search is a single
+    matrix product. Rows are appended into spare capacity, which doubles when full; a reallocation
+    leaves the old array to whoever still holds it. Rows never change once written, so a reader can
+    keep using `rows[:count]` of the array it took while the writer appends.
+    """
+    def __init__(self, dimension: int, capacity: int = 1024):
+        """
+        Initializes the NormalizedMatrix.
+
+        Args:
+            dimension (int): Embedding dimension.
+            capacity (int): Initial number of rows allocated.
+        """
+        self.dimension = dimension
+        self.rows = np.empty((max(1, capacity), dimension), dtype=np.float32)
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        end = self._count + len(vectors)
+        if end > len(self.rows):
+            grown = np.empty((max(end, 2 * len(self.rows)), self.dimension), dtype=np.float32)
+            grown[:self._count] = self.rows[:self._count]
+            self.rows = grown
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        np.divide(vectors, norms, out=self.rows[self._count:end])
+        self._count = end
+
+    def extend_from(self, vectors: FloatVectorStore) -> None:
+        """Appends the rows of `vectors` past the ones already held."""
+        for _, rows in vectors.iter_rows(self._count, len(vectors)):
+            self.append(rows)
+
+def normalize_queries(queries: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.asarray(queries / norms, dtype=np.float32)
+
+def top_k_similar(queries: np.ndarray, rows: np.ndarray, k: int, positions: Optional[np.ndarray] = None,
+                  excluded: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact k-nearest search of normalized `queries` against normalized `rows`: one matrix product
+    for all queries, then argpartition for the top k and a sort of those k only.
+
+    Returns (distances, indices) like a FAISS search, with -1 for missing results. Distances are
+    squared L2 between the unit vectors (2 - 2 * cosine), so they rank and score exactly like
+    FAISS L2 distances over normalized embeddings.
+
+    Args:
+        queries (np.ndarray): (num_queries, dimension) unit vectors.
+        rows (np.ndarray): (n, dimension) unit vectors.
+        k (int): Results per query.
+        positions (Optional[np.ndarray]): Position reported for each row; defaults to the row number.
+        excluded (Optional[np.ndarray]): Row numbers never returned, e.g. tombstones.
+    """
+    n = len(rows)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+    similarities = queries @ rows.T
+    if excluded is not None and len(excluded):
+        similarities[:, excluded] = -np.inf
+    if k < n:
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(n), (len(queries), n))
+    top_similarities = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-top_similarities, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    top_similarities = np.take_along_axis(top_similarities, order, axis=1)
+    indices = top.astype(np.int64) if positions is None else positions[top]
+    indices = np.where(np.isfinite(top_similarities), indices, -1)
+    return (2.0 - 2.0 * top_similarities).astype(np.float32), indices
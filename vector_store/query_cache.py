@@ -0,0 +1,75 @@
+# vector_store/query_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+class QueryEmbeddingCache:
+    """
+    In-memory LRU cache of query text -> embedding vector with a time-to-live.
+    Repeated queries (such as the Streamlit default question) skip the embedding round trip.
+    """
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = 3600.0):
+        """
+        Initializes the QueryEmbeddingCache.
+
+        Args:
+            max_entries (int): Maximum number of cached queries; the least recently used is evicted first.
+            ttl_seconds (Optional[float]): Lifetime of an entry since it was stored. None keeps entries until evicted.
+        """
+        if max_entries < 1:
+            raise ValueError("QueryEmbeddingCache: max_entries must be at least 1.")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[List[float], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, query: str) -> Optional[List[float]]:
+        """Returns the cached vector for `query`, or None if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is not None:
+                vector, stored_at = entry
+                if self.ttl_seconds is None or time.monotonic() - stored_at < self.ttl_seconds:
+                    self._entries.move_to_end(query)
+                    self.hits += 1
+                    return vector
+                del self._entries[query]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, query: str, vector: List[float]) -> None:
+        """Stores the vector for `query`, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[query] = (vector, time.monotonic())
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns size and hit-rate counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
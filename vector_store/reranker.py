@@ -0,0 +1,72 @@
+# vector_store/reranker.py
+
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from vector_store.lexical_index import tokenize
+
+class TermOverlapReranker:
+    """
+    CPU re-ranker for retrieval candidates: no model, no network. A candidate's new score blends
+    its retrieval score with how many of the query's terms its text contains and whether the
+    query names its ticker (metadata "symbol"), which embeddings alone tend to miss, e.g. two
+    chip makers' earnings chunks sit close together in vector space but only one matches "TSM".
+
+    Any object with the same score_batch method, such as a small local cross-encoder, can be
+    passed to RetrieverAgent in its place.
+    """
+    def __init__(self, retrieval_weight: float = 0.5, overlap_weight: float = 0.3, symbol_weight: float = 0.2):
+        """
+        Initializes the TermOverlapReranker. With weights summing to 1, scores stay between 0 and 1
+        for retrieval scores between 0 and 1.
+
+        Args:
+            retrieval_weight (float): Weight of the candidate's retrieval score.
+            overlap_weight (float): Weight of the fraction of query terms found in the candidate's text.
+            symbol_weight (float): Weight of the query naming the candidate's symbol.
+        """
+        self.retrieval_weight = retrieval_weight
+        self.overlap_weight = overlap_weight
+        self.symbol_weight = symbol_weight
+
+    def score_batch(self, query: str, documents: Sequence[Document], retrieval_scores: np.ndarray) -> np.ndarray:
+        """Returns the new score of each document for `query`, higher is better."""
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return self.retrieval_weight * retrieval_scores
+        overlap = np.fromiter(
+            (len(query_terms.intersection(tokenize(doc.page_content))) for doc in documents), dtype=np.float32, count=len(documents),
+        ) / len(query_terms)
+        symbol_match = np.fromiter(
+            (str(doc.metadata.get("symbol", "")).lower() in query_terms for doc in documents), dtype=np.float32, count=len(documents),
+        )
+        return self.retrieval_weight * retrieval_scores + self.overlap_weight * overlap + self.symbol_weight * symbol_match
+
+def rerank_hits(reranker, queries: List[str], results: List[List[Tuple]], batch_size: int = 64,
+                budget_seconds: Optional[float] = None) -> List[List[Tuple]]:
+    """
+    Re-scores each query's best-first (document, score, ...) hits with `reranker` and re-orders them
+    by the new score; anything after the score in a hit is kept.
+
+    Candidates are scored in batches of `batch_size`, best first. Once `budget_seconds` have passed,
+    no further batch is started: the candidates left unscored keep their retrieval order and score
+    and follow the re-ranked ones, so a slow re-ranker costs precision instead of latency.
+    """
+    deadline = None if budget_seconds is None else time.perf_counter() + budget_seconds
+    reranked = []
+    for query, hits in zip(queries, results):
+        rescored: List[Tuple] = []
+        for start in range(0, len(hits), batch_size):
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            batch = hits[start:start + batch_size]
+            scores = reranker.score_batch(
+                query, [hit[0] for hit in batch], np.fromiter((hit[1] for hit in batch), dtype=np.float32, count=len(batch)),
+            )
+            rescored.extend((hit[0], float(score)) + hit[2:] for hit, score in zip(batch, scores))
+        rescored.sort(key=lambda hit: hit[1], reverse=True)
+        reranked.append(rescored + hits[len(rescored):])
+    return reranked
@@ -0,0 +1,41 @@
+# vector_store/scoring.py
+
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# Rough size of a token in English text, used to turn a token budget into a character budget
+# without loading a tokenizer
+CHARS_PER_TOKEN = 4
+
+def similarity_from_distance(distance: float) -> float:
+    """
+    Turns a squared L2 distance between unit-length embeddings into their cosine similarity
+    (|a - b|^2 = 2 - 2 cos). Embedding models used here return normalized vectors, so the
+    score is 1 for identical texts, around 0 for unrelated ones and never above 1.
+    """
+    return max(-1.0, min(1.0, 1.0 - distance / 2.0))
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a text (CHARS_PER_TOKEN characters per token, rounded up)."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def cut_off(hits: List[Tuple[Document, float]], min_score: Optional[float] = None, max_chars: Optional[int] = None,
+            max_tokens: Optional[int] = None) -> List[Tuple[Document, float]]:
+    """
+    Keeps the leading (document, score) pairs of a best-first list while their score reaches
+    `min_score` and their texts fit into the character and (estimated) token budgets together.
+    Collection stops at the first pair that fails, so a weaker result is never taken in place
+    of a stronger one that did not fit.
+    """
+    kept = []
+    chars = tokens = 0
+    for doc, score in hits:
+        if min_score is not None and score < min_score:
+            break
+        chars += len(doc.page_content)
+        tokens += estimate_tokens(doc.page_content)
+        if (max_chars is not None and chars > max_chars) or (max_tokens is not None and tokens > max_tokens):
+            break
+        kept.append((doc, score))
+    return kept
@@ -0,0 +1,122 @@
+# vector_store/semantic_cache.py
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional
+
+import numpy as np
+
+from vector_store.lexical_index import STOPWORDS
+
+# Words as written, keeping inner dots, dashes and ampersands ("005930.KS", "2025-05-29", "S&P")
+WORD_PATTERN = re.compile(r"[A-Za-z0-9]+(?:[.\-&][A-Za-z0-9]+)*")
+
+def query_key_terms(text: str) -> FrozenSet[str]:
+    """
+    The words of a query that name what it is about rather than how it is phrased: words with a digit
+    (dates, numbers, tickers like "2330.TW") or a capital letter (tickers, company names), lowercased.
+    Embeddings of "How did TSM do on 2025-05-29?" and "How did AMD do on 2025-05-29?" are nearly equal,
+    so two queries only share cached results when these terms are the same.
+    """
+    return frozenset(
+        word.lower() for word in WORD_PATTERN.findall(text)
+        if (any(char.isdigit() for char in word) or any(char.isupper() for char in word)) and word.lower() not in STOPWORDS
+    )
+
+class SemanticResultCache:
+    """
+    Cache of retrieval results keyed on the query embedding instead of the query text, so a paraphrase
+    of an earlier question ("TSMC results?" / "How did TSMC report?") is answered from the earlier
+    results when the two embeddings' cosine similarity reaches `similarity_threshold`.
+
+    Results are only valid for the index state they were computed on: every lookup and store names
+    the index generation, and the first one naming a new generation empties the cache. Results are
+    also only shared between queries with the same retrieval options (k, filters, mode, ...), which
+    should include the query's query_key_terms: embeddings alone barely tell tickers or dates apart.
+    """
+    def __init__(self, max_entries: int = 256, similarity_threshold: float = 0.95):
+        """
+        Initializes the SemanticResultCache.
+
+        Args:
+            max_entries (int): Maximum number of cached queries; the least recently used is evicted first.
+            similarity_threshold (float): Minimum cosine similarity of a query to a cached one to reuse its results.
+        """
+        if max_entries < 1:
+            raise ValueError("SemanticResultCache: max_entries must be at least 1.")
+        if not -1.0 <= similarity_threshold <= 1.0:
+            raise ValueError(f"SemanticResultCache: similarity_threshold must be between -1 and 1, got {similarity_threshold}.")
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        # Entry number -> (options key, unit query vector, results), least recently used first
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._next_entry = 0
+        self._generation: Hashable = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _check_generation(self, generation: Hashable) -> None:
+        if generation != self._generation:
+            if self._entries:
+                self._entries.clear()
+                self.invalidations += 1
+            self._generation = generation
+
+    def get(self, vector, options: Hashable, generation: Hashable) -> Optional[List[Any]]:
+        """Returns the results of the most similar cached query with the same options, or None below the threshold."""
+        unit = self._unit(vector)
+        with self._lock:
+            self._check_generation(generation)
+            candidates = [(entry, cached) for entry, cached in self._entries.items() if cached[0] == options]
+            if candidates:
+                similarities = np.stack([cached[1] for _, cached in candidates]) @ unit
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    entry, cached = candidates[best]
+                    self._entries.move_to_end(entry)
+                    self.hits += 1
+                    return cached[2]
+            self.misses += 1
+            return None
+
+    def put(self, vector, options: Hashable, generation: Hashable, results: List[Any]) -> None:
+        """Stores the results of a query computed on index `generation`, evicting the least recently used entry if full."""
+        unit = self._unit(vector)
+        with self._lock:
+            self._check_generation(generation)
+            self._entries[self._next_entry] = (options, unit, results)
+            self._next_entry += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns size and hit-rate counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "similarity_threshold": self.similarity_threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
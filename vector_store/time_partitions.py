@@ -0,0 +1,93 @@
+# vector_store/time_partitions.py
+
+import datetime
+from typing import Any, Iterable, List, Optional, Tuple
+
+# Supported shard granularities:
+#   "day"  - one shard per calendar date, keyed "2025-05-29"
+#   "week" - one shard per ISO week, keyed "2025-W22"
+PARTITION_GRANULARITIES = ("day", "week")
+
+# Shard for documents without a parseable date; it is never expired by retention
+UNDATED_PARTITION = "undated"
+
+def validate_partition_by(partition_by: str) -> str:
+    if partition_by not in PARTITION_GRANULARITIES:
+        raise ValueError(f"Unknown partition granularity '{partition_by}'. Expected one of {', '.join(PARTITION_GRANULARITIES)}.")
+    return partition_by
+
+def parse_date(value: Any) -> Optional[datetime.date]:
+    """
+    Reads a date from metadata: a date/datetime object or a string starting with YYYY-MM-DD
+    (timestamps such as "2025-05-29T16:00:00" included). Returns None if it is not a date.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    if isinstance(value, str) and len(value) >= 10:
+        try:
+            return datetime.date.fromisoformat(value[:10])
+        except ValueError:
+            return None
+    return None
+
+def partition_key(value: Any, granularity: str) -> str:
+    """Returns the shard key for a metadata date value."""
+    date = parse_date(value)
+    if date is None:
+        return UNDATED_PARTITION
+    if granularity == "week":
+        year, week, _ = date.isocalendar()
+        return f"{year}-W{week:02d}"
+    return date.isoformat()
+
+def partition_range(key: str, granularity: str) -> Optional[Tuple[datetime.date, datetime.date]]:
+    """Returns the first and last date covered by shard `key`, or None for the undated shard."""
+    if key == UNDATED_PARTITION:
+        return None
+    if granularity == "week":
+        year, week = key.split("-W")
+        start = datetime.date.fromisocalendar(int(year), int(week), 1)
+        return start, start + datetime.timedelta(days=6)
+    day = datetime.date.fromisoformat(key)
+    return day, day
+
+def is_partition_key(key: str, granularity: str) -> bool:
+    """Whether `key` names a shard of this granularity (used to skip stray directories)."""
+    if key == UNDATED_PARTITION:
+        return True
+    try:
+        partition_range(key, granularity)
+        return True
+    except ValueError:
+        return False
+
+def is_expired(key: str, granularity: str, retention_days: Optional[int], today: datetime.date) -> bool:
+    """A shard expires once its last date is more than `retention_days` before `today`."""
+    covered = partition_range(key, granularity)
+    if retention_days is None or covered is None:
+        return False
+    return covered[1] < today - datetime.timedelta(days=retention_days)
+
+def select_partitions(keys: Iterable[str], granularity: str, date_from: Optional[datetime.date],
+                      date_to: Optional[datetime.date]) -> List[Tuple[str, bool]]:
+    """
+    Picks the shards a date window needs. Returns (key, fully_covered) pairs; shards only partly
+    inside the window need a per-document date filter. Without a window every shard is returned.
+    The undated shard is skipped whenever a window is given.
+    """
+    selected = []
+    for key in keys:
+        if date_from is None and date_to is None:
+            selected.append((key, True))
+            continue
+        covered = partition_range(key, granularity)
+        if covered is None:
+            continue
+        start, end = covered
+        if (date_to is not None and start > date_to) or (date_from is not None and end < date_from):
+            continue
+        fully_covered = (date_from is None or date_from <= start) and (date_to is None or end <= date_to)
+        selected.append((key, fully_covered))
+    return selected
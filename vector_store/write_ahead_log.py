@@ -0,0 +1,131 @@
+# vector_store/write_ahead_log.py
+
+import base64
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+class WriteAheadLog:
+    """
+    Append-only log of vector store mutations, stored as JSON lines next to the index snapshot.
+    Every indexing batch is appended (and optionally fsynced) before it is applied in memory,
+    so the cost of persisting a batch depends on the batch size rather than the index size.
+    On startup the log is replayed on top of the last snapshot; compaction marks the end of the
+    log, writes a new snapshot and truncates the log up to the mark.
+    """
+    def __init__(self, path: str, fsync: bool = True):
+        """
+        Initializes the WriteAheadLog.
+
+        Args:
+            path (str): Location of the log file. Created, with its directory, on first append.
+            fsync (bool): Whether every append is flushed to disk before returning.
+        """
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self.record_count = self._count_records()
+
+    def _count_records(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            return sum(1 for line in f if line.strip())
+
+    @staticmethod
+    def encode_vectors(vectors: List[List[float]]) -> str:
+        """Packs vectors as base64-encoded float32, far smaller than JSON float lists."""
+        return base64.b64encode(np.asarray(vectors, dtype=np.float32).tobytes()).decode("ascii")
+
+    @staticmethod
+    def decode_vectors(encoded: str, count: int) -> List[List[float]]:
+        """Inverse of encode_vectors."""
+        flat = np.frombuffer(base64.b64decode(encoded), dtype=np.float32)
+        return flat.reshape(count, -1).tolist() if count else []
+
+    def append_upsert(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]],
+                      vectors: List[List[float]]) -> None:
+        """Logs a batch of documents that replace any stored documents with the same IDs."""
+        self._append({
+            "op": "upsert",
+            "ids": ids,
+            "texts": texts,
+            "metadatas": metadatas,
+            "vectors": self.encode_vectors(vectors),
+        })
+
+    def append_delete(self, ids: List[str]) -> None:
+        """Logs the removal of documents by ID."""
+        self._append({"op": "delete", "ids": ids})
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self.record_count == 0:
+                # A new store has no snapshot directory yet
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self.record_count += 1
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yields logged records in write order, with upsert vectors decoded.
+        A torn final line left by a crash mid-append is skipped.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"WriteAheadLog: Skipping unreadable record at line {line_number} of {self.path}.")
+                    continue
+                if record.get("op") == "upsert":
+                    record["vectors"] = self.decode_vectors(record["vectors"], len(record["ids"]))
+                yield record
+
+    def mark(self) -> Tuple[int, int]:
+        """Returns the current end of the log as (byte offset, record count), for truncate()."""
+        with self._lock:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            return size, self.record_count
+
+    def truncate(self, upto: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Discards all records, typically right after a snapshot has been written. With `upto`, a
+        mark() taken when the snapshot's state was captured, only the records before the mark are
+        discarded and those appended since are kept.
+        """
+        with self._lock:
+            if upto is None:
+                with open(self.path, "w", encoding="utf-8") as f:
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                self.record_count = 0
+                return
+            offset, count = upto
+            remainder = b""
+            if os.path.exists(self.path):
+                with open(self.path, "rb") as f:
+                    f.seek(offset)
+                    remainder = f.read()
+            # Written aside and renamed over the log, so a crash leaves either the old or the new log
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(remainder)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.record_count -= count
@@ -0,0 +1,67 @@
+# vector_store/writer_lock.py
+
+import os
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError: # Windows has no flock; every process then writes, as before the lock existed
+    fcntl = None
+
+class WriterLock:
+    """
+    Cross-process lock electing the one process allowed to write a store directory. Worker processes
+    serving the same directory (e.g. `uvicorn --workers 4`) each try to take it on startup: the one
+    that succeeds appends to the write-ahead log and compacts, the others open the store read-only.
+
+    The lock is an flock on a file in the store directory, so the operating system releases it when
+    the holder exits or crashes, and the next process to try takes over.
+    """
+    def __init__(self, path: str):
+        """
+        Initializes the WriterLock.
+
+        Args:
+            path (str): Location of the lock file. Created, with its directory, on first acquire.
+        """
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def try_acquire(self) -> bool:
+        """Takes the lock without waiting. Returns whether this process now holds it."""
+        if self._file is not None or fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        f = open(self.path, "a+", encoding="utf-8")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        # Record the holder so read-only workers can say which process to send writes to
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        self._file = f
+        return True
+
+    def holder(self) -> Optional[str]:
+        """Process ID written by the current or last holder, if any."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def release(self) -> None:
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None